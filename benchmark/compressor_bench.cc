@@ -0,0 +1,383 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// CPU benchmark and accuracy suite of the compressors. Each compressor is
+// created through the CompressorRegistry from the kwargs the runtime uses,
+// and measured on a partition of normal(0, 1) entries for each size and
+// dtype: Compress and Decompress throughput (GB/s of the uncompressed
+// partition), compression ratio, and the relative L2 error of one round trip
+// against the tensor that was compressed (the corrected gradient with error
+// feedback or momentum). The results are printed as JSON.
+//
+// Each error is checked against a bound of its compressor on that tensor:
+// 1 for topk and randomk, whose kept values are exact and in place; the exact
+// error of sign times the scale for onebit; and the expected error of
+// stochastic rounding to the dithering levels, with 10% slack. An entry above
+// its bound has "ok": false, is listed on stderr, and fails the run. With
+// float16 and bfloat16, dithering stores its bit count in 16 bits, so it
+// fails its bound past 65536 bits. topk and randomk use 32-bit indices with
+// 16-bit values; with 16-bit indices they wrapped past 65536 elements.
+//
+//   make -C benchmark compressor_bench
+//   ./benchmark/compressor_bench [--sizes=4096,262144,4194304]
+//       [--dtypes=float32,float16,bfloat16,float64] [--out=results.json]
+//       [kwargs...]
+//
+// kwargs are comma-separated, e.g.,
+//   compressor_type=topk,compressor_k=0.01,ef_type=vanilla
+// and default to every compressor alone, with vanilla error feedback, with
+// nesterov momentum and with both.
+
+#include <fcntl.h>
+#include <omp.h>
+#include <stdlib.h>
+#include <unistd.h>
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstring>
+#include <random>
+#include <sstream>
+#include <string>
+#include <utility>
+#include <vector>
+
+#include "byteps/common/compressor/compressor_registry.h"
+#include "byteps/common/half.h"
+
+using byteps::common::bfloat16_t;
+using byteps::common::DataType;
+using byteps::common::compressor::Compressor;
+using byteps::common::compressor::CompressorRegistry;
+using byteps::common::compressor::kwargs_t;
+using byteps::common::compressor::tensor_t;
+using mshadow::half::half_t;
+using Clock = std::chrono::steady_clock;
+
+// the kwargs in the given order, for the report
+using ordered_kwargs_t = std::vector<std::pair<std::string, std::string>>;
+
+const char* kCompressors[] = {
+    "compressor_type=onebit",
+    "compressor_type=onebit,compressor_onebit_scaling=true",
+    "compressor_type=topk,compressor_k=0.01",
+    "compressor_type=topk,compressor_k=0.01,compressor_topk_select=true",
+    "compressor_type=randomk,compressor_k=0.01,seed=2020",
+    "compressor_type=randomk,compressor_k=0.01,seed=2020,"
+    "compressor_randomk_shared_seed=true",
+    "compressor_type=dithering,compressor_k=4,seed=2020",
+};
+const char* kDecorators[] = {
+    "",
+    ",ef_type=vanilla",
+    ",momentum_type=nesterov,momentum_mu=0.9",
+    ",ef_type=vanilla,momentum_type=nesterov,momentum_mu=0.9",
+};
+
+std::vector<std::string> Split(const std::string& s, char sep) {
+  std::vector<std::string> parts;
+  std::istringstream is(s);
+  std::string part;
+  while (std::getline(is, part, sep)) {
+    if (!part.empty()) parts.push_back(part);
+  }
+  return parts;
+}
+
+ordered_kwargs_t ParseKwargs(const std::string& s) {
+  ordered_kwargs_t kwargs;
+  for (auto& kv : Split(s, ',')) {
+    auto eq = kv.find('=');
+    kwargs.emplace_back(kv.substr(0, eq), kv.substr(eq + 1));
+  }
+  return kwargs;
+}
+
+// CompressorRegistry::Create as on workers, servers do not apply momentum
+std::unique_ptr<Compressor> Create(const kwargs_t& kwargs, size_t size,
+                                   DataType dtype) {
+  auto it = kwargs.find("momentum_type");
+  if (it != kwargs.end()) {
+    return CompressorRegistry::Find(it->second + "_momentum_type")(kwargs,
+                                                                 size, dtype);
+  }
+  return CompressorRegistry::Create(kwargs, size, dtype);
+}
+
+// seconds per call of f, over at least 3 calls and 0.1 s; reset runs
+// before every call and is not timed
+template <typename R, typename F>
+double Time(R reset, F f) {
+  size_t iters = 0;
+  double secs = 0;
+  do {
+    reset();
+    auto start = Clock::now();
+    f();
+    secs += std::chrono::duration<double>(Clock::now() - start).count();
+    ++iters;
+  } while (iters < 3 || secs < 0.1);
+  return secs / iters;
+}
+
+double ToDouble(const char* p, DataType dtype, size_t i) {
+  switch (dtype) {
+    case byteps::common::BYTEPS_FLOAT16:
+      return static_cast<float>(reinterpret_cast<const half_t*>(p)[i]);
+    case byteps::common::BYTEPS_BFLOAT16:
+      return static_cast<float>(reinterpret_cast<const bfloat16_t*>(p)[i]);
+    case byteps::common::BYTEPS_FLOAT32:
+      return reinterpret_cast<const float*>(p)[i];
+    default:
+      return reinterpret_cast<const double*>(p)[i];
+  }
+}
+
+void Fill(char* p, DataType dtype, size_t len, std::mt19937* gen) {
+  std::normal_distribution<float> dist(0, 1);
+  for (size_t i = 0; i < len; ++i) {
+    float x = dist(*gen);
+    switch (dtype) {
+      case byteps::common::BYTEPS_FLOAT16:
+        reinterpret_cast<half_t*>(p)[i] = half_t(x);
+        break;
+      case byteps::common::BYTEPS_BFLOAT16:
+        reinterpret_cast<bfloat16_t*>(p)[i] = bfloat16_t(x);
+        break;
+      case byteps::common::BYTEPS_FLOAT32:
+        reinterpret_cast<float*>(p)[i] = x;
+        break;
+      default:
+        reinterpret_cast<double*>(p)[i] = x;
+    }
+  }
+}
+
+struct Result {
+  size_t compressed_size;
+  double compress_gbps;
+  double decompress_gbps;
+  double rel_error;
+  double max_rel_error;
+};
+
+std::string Get(const kwargs_t& kwargs, const std::string& key,
+                const std::string& default_value) {
+  auto it = kwargs.find(key);
+  return it == kwargs.end() ? default_value : it->second;
+}
+
+// the bound of the relative error of a round trip of x, see the top
+double ErrorBound(const kwargs_t& kwargs, const char* x, DataType dtype,
+                  size_t len) {
+  double norm2 = 0, abs_sum = 0, max_abs = 0;
+  for (size_t i = 0; i < len; ++i) {
+    double v = ToDouble(x, dtype, i);
+    norm2 += v * v;
+    abs_sum += std::abs(v);
+    max_abs = std::max(max_abs, std::abs(v));
+  }
+  if (norm2 == 0) return 0;
+  auto type = Get(kwargs, "compressor_type", "");
+  if (type == "onebit") {
+    double scale =
+        Get(kwargs, "compressor_onebit_scaling", "false") == "true"
+            ? abs_sum / len
+            : 1;
+    double err2 = 0;
+    for (size_t i = 0; i < len; ++i) {
+      double d = std::abs(ToDouble(x, dtype, i)) - scale;
+      err2 += d * d;
+    }
+    // the scale is rounded to the dtype
+    return std::sqrt(err2 / norm2) * 1.01;
+  }
+  if (type == "dithering") {
+    double s = std::stod(Get(kwargs, "compressor_k", "1"));
+    double scale = Get(kwargs, "dithering_normalize", "0") == "1"
+                       ? std::sqrt(norm2)
+                       : max_abs;
+    // rounding to a step of `step` errs by at most step^2 / 4 in variance
+    double err2;
+    if (Get(kwargs, "dithering_partition", "0") == "1") {
+      // natural levels: the step of x is at most x, below the lowest level
+      // it is scale / 2^(s-1)
+      double step = scale / std::pow(2, s - 1);
+      err2 = norm2 / 4 + len * step * step / 4;
+    } else {
+      double step = scale / s;
+      err2 = len * step * step / 4;
+    }
+    return std::sqrt(err2 / norm2) * 1.1;
+  }
+  // topk and randomk
+  return 1 + 1e-6;
+}
+
+Result Run(const kwargs_t& kwargs, size_t size, DataType dtype) {
+  size_t len = size / byteps::common::getDataTypeLength(dtype);
+  std::mt19937 gen(0);
+  std::vector<char> grad(size), input(size);
+  Fill(grad.data(), dtype, len, &gen);
+  Result r;
+
+  // accuracy of the first round trip of a fresh compressor; decorators
+  // correct the gradient in place, which is what gets compressed
+  auto compressor = Create(kwargs, size, dtype);
+  input = grad;
+  auto compressed = compressor->Compress(tensor_t(input.data(), size, dtype));
+  r.compressed_size = compressed.size;
+  std::vector<char> payload(compressed.data, compressed.data + compressed.size);
+  auto decompressed =
+      compressor->Decompress(tensor_t(payload.data(), payload.size(), dtype));
+  double err = 0, norm = 0;
+  for (size_t i = 0; i < len; ++i) {
+    double x = ToDouble(input.data(), dtype, i);
+    double y = ToDouble(decompressed.data, dtype, i);
+    err += (x - y) * (x - y);
+    norm += x * x;
+  }
+  r.rel_error = norm > 0 ? std::sqrt(err / norm) : 0;
+  r.max_rel_error = ErrorBound(kwargs, input.data(), dtype, len);
+
+  // throughput, with the decorators' state in steady state; they correct
+  // the gradient in place, so every call starts from the same one
+  double compress_secs = Time([&] { input = grad; }, [&] {
+    compressed = compressor->Compress(tensor_t(input.data(), size, dtype));
+  });
+  payload.assign(compressed.data, compressed.data + compressed.size);
+  // workers decompress in place, so every call starts from the payload
+  std::vector<char> scratch(std::max(size, payload.size()));
+  double decompress_secs = Time(
+      [&] { std::memcpy(scratch.data(), payload.data(), payload.size()); },
+      [&] {
+        compressor->Decompress(
+            tensor_t(scratch.data(), payload.size(), dtype));
+      });
+  r.compress_gbps = size / compress_secs / 1e9;
+  r.decompress_gbps = size / decompress_secs / 1e9;
+  return r;
+}
+
+// vanilla error feedback reads the learning rate from lr.s in the working
+// directory, give it one in a temporary directory
+std::string MakeLrFile() {
+  char dir[] = "/tmp/compressor_bench.XXXXXX";
+  if (!mkdtemp(dir) || chdir(dir) != 0) return "";
+  double lr = 1.0;
+  int fd = open("lr.s", O_CREAT | O_WRONLY, 0644);
+  if (fd < 0 || write(fd, &lr, sizeof(lr)) != sizeof(lr)) return "";
+  close(fd);
+  return dir;
+}
+
+int main(int argc, char** argv) {
+  std::vector<size_t> sizes = {4096, 262144, 4194304};
+  std::vector<std::string> dtypes = {"float32", "float16", "bfloat16",
+                                     "float64"};
+  std::string out;
+  std::vector<std::string> configs;
+  for (int i = 1; i < argc; ++i) {
+    std::string arg = argv[i];
+    if (arg.rfind("--sizes=", 0) == 0) {
+      sizes.clear();
+      for (auto& s : Split(arg.substr(8), ',')) sizes.push_back(std::stoul(s));
+    } else if (arg.rfind("--dtypes=", 0) == 0) {
+      dtypes = Split(arg.substr(9), ',');
+    } else if (arg.rfind("--out=", 0) == 0) {
+      out = arg.substr(6);
+    } else {
+      configs.push_back(arg);
+    }
+  }
+  if (configs.empty()) {
+    for (auto compressor : kCompressors) {
+      for (auto decorator : kDecorators) {
+        configs.push_back(std::string(compressor) + decorator);
+      }
+    }
+  }
+
+  std::string lr_dir = MakeLrFile();
+  if (lr_dir.empty()) {
+    fprintf(stderr, "failed to create lr.s\n");
+    return 1;
+  }
+
+  std::ostringstream json;
+  json << "{\n  \"omp_threads\": " << omp_get_max_threads()
+       << ",\n  \"results\": [";
+  const char* sep = "\n";
+  int failed = 0;
+  for (auto& config : configs) {
+    auto ordered = ParseKwargs(config);
+    kwargs_t kwargs(ordered.begin(), ordered.end());
+    for (auto& dtype_name : dtypes) {
+      DataType dtype = dtype_name == "float16"
+                           ? byteps::common::BYTEPS_FLOAT16
+                           : dtype_name == "bfloat16"
+                                 ? byteps::common::BYTEPS_BFLOAT16
+                                 : dtype_name == "float64"
+                                       ? byteps::common::BYTEPS_FLOAT64
+                                       : byteps::common::BYTEPS_FLOAT32;
+      for (auto size : sizes) {
+        auto r = Run(kwargs, size, dtype);
+        bool ok = r.rel_error <= r.max_rel_error;
+        if (!ok) {
+          fprintf(stderr, "EXCEEDS BOUND: %s %s %zu bytes: rel_error %g > %g\n",
+                  config.c_str(), dtype_name.c_str(), size, r.rel_error,
+                  r.max_rel_error);
+          ++failed;
+        }
+        json << sep << "    {\"kwargs\": {";
+        for (size_t i = 0; i < ordered.size(); ++i) {
+          json << (i ? ", " : "") << "\"" << ordered[i].first << "\": \""
+               << ordered[i].second << "\"";
+        }
+        json << "}, \"dtype\": \"" << dtype_name << "\", \"bytes\": " << size
+             << ", \"compressed_bytes\": " << r.compressed_size
+             << ", \"ratio\": " << (double)size / r.compressed_size
+             << ", \"compress_gbps\": " << r.compress_gbps
+             << ", \"decompress_gbps\": " << r.decompress_gbps
+             << ", \"rel_error\": " << r.rel_error
+             << ", \"max_rel_error\": " << r.max_rel_error
+             << ", \"ok\": " << (ok ? "true" : "false") << "}";
+        sep = ",\n";
+      }
+    }
+  }
+  json << "\n  ]\n}\n";
+
+  unlink((lr_dir + "/lr.s").c_str());
+  rmdir(lr_dir.c_str());
+  if (out.empty()) {
+    fputs(json.str().c_str(), stdout);
+  } else {
+    FILE* f = fopen(out.c_str(), "w");
+    if (!f) {
+      fprintf(stderr, "failed to open %s\n", out.c_str());
+      return 1;
+    }
+    fputs(json.str().c_str(), f);
+    fclose(f);
+  }
+  if (failed) {
+    fprintf(stderr, "%d result(s) exceed the error bound of their compressor\n",
+            failed);
+    return 1;
+  }
+  return 0;
+}
@@ -0,0 +1,144 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Resident memory of the compressors of a synthetic float32 model, cut into
+// partitions like BYTEPS_PARTITION_BYTES does (rounded up to whole ones). As a
+// worker, every partition has its compressor (with momentum if asked) and is
+// compressed once. As a server, every partition has its compressor, a push is
+// decompressed and the sum is compressed once. The gradients and the server
+// store are not counted.
+//
+//   make -C benchmark compressor_memory_bench
+//   ./benchmark/compressor_memory_bench worker|server [params] [partition]
+//       [kwargs]
+//
+// kwargs are comma-separated, e.g.,
+//   compressor_type=onebit,ef_type=vanilla,compressor_state_dtype=bfloat16
+
+#include <fcntl.h>
+#include <stdlib.h>
+#include <unistd.h>
+
+#include <cstdio>
+#include <cstring>
+#include <memory>
+#include <random>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#include "byteps/common/compressor/compressor_registry.h"
+
+using byteps::common::BYTEPS_FLOAT32;
+using byteps::common::compressor::Compressor;
+using byteps::common::compressor::CompressorRegistry;
+using byteps::common::compressor::kwargs_t;
+using byteps::common::compressor::tensor_t;
+
+double RssMB() {
+  long pages = 0, resident = 0;
+  FILE* f = fopen("/proc/self/statm", "r");
+  if (f) {
+    if (fscanf(f, "%ld %ld", &pages, &resident) != 2) resident = 0;
+    fclose(f);
+  }
+  return resident * sysconf(_SC_PAGESIZE) / 1e6;
+}
+
+kwargs_t ParseKwargs(const std::string& s) {
+  kwargs_t kwargs;
+  std::istringstream is(s);
+  std::string kv;
+  while (std::getline(is, kv, ',')) {
+    auto eq = kv.find('=');
+    kwargs[kv.substr(0, eq)] = kv.substr(eq + 1);
+  }
+  return kwargs;
+}
+
+std::unique_ptr<Compressor> Create(const kwargs_t& kwargs, size_t size,
+                                   bool worker) {
+  auto it = kwargs.find("momentum_type");
+  if (worker && it != kwargs.end()) {
+    return CompressorRegistry::Find(it->second + "_momentum_type")(
+        kwargs, size, BYTEPS_FLOAT32);
+  }
+  auto server_kwargs = kwargs;
+  server_kwargs.erase("momentum_type");
+  return CompressorRegistry::Create(server_kwargs, size, BYTEPS_FLOAT32);
+}
+
+int main(int argc, char** argv) {
+  bool worker = argc < 2 || std::string(argv[1]) != "server";
+  size_t params = argc > 2 ? atol(argv[2]) : 100000000;
+  size_t partition = argc > 3 ? atol(argv[3]) : 4096000;
+  auto kwargs = ParseKwargs(
+      argc > 4 ? argv[4] : "compressor_type=onebit,ef_type=vanilla,"
+                           "momentum_type=nesterov,momentum_mu=0.9");
+  size_t num_partitions = (params * sizeof(float) + partition - 1) / partition;
+  params = num_partitions * partition / sizeof(float);
+
+  // vanilla error feedback reads the learning rate from lr.s
+  char dir[] = "/tmp/compressor_memory_bench.XXXXXX";
+  double lr = 1.0;
+  int fd = -1;
+  if (mkdtemp(dir) && chdir(dir) == 0) {
+    fd = open("lr.s", O_CREAT | O_WRONLY, 0644);
+  }
+  if (fd < 0 || write(fd, &lr, sizeof(lr)) != sizeof(lr)) {
+    fprintf(stderr, "failed to create lr.s\n");
+    return 1;
+  }
+  close(fd);
+
+  std::vector<float> grad(partition / sizeof(float)), input(grad.size());
+  std::mt19937 gen(0);
+  std::normal_distribution<float> dist(0, 1);
+  for (auto& x : grad) x = dist(gen);
+  auto pusher = Create(kwargs, partition, true);
+  auto compressed =
+      pusher->Compress(tensor_t(grad.data(), partition, BYTEPS_FLOAT32));
+  std::vector<char> payload(compressed.data, compressed.data + compressed.size);
+
+  double before = RssMB();
+  std::vector<std::unique_ptr<Compressor>> compressors;
+  for (size_t i = 0; i < num_partitions; ++i) {
+    compressors.push_back(Create(kwargs, partition, worker));
+    auto& c = compressors.back();
+    input = grad;
+    if (worker) {
+      c->Compress(tensor_t(input.data(), partition, BYTEPS_FLOAT32));
+    } else {
+      std::vector<char> push(payload);
+      auto decompressed = c->Decompress(
+          tensor_t(push.data(), push.size(), BYTEPS_FLOAT32));
+      std::memcpy(input.data(), decompressed.data, partition);
+      c->Compress(tensor_t(input.data(), partition, BYTEPS_FLOAT32));
+    }
+  }
+  double after = RssMB();
+
+  unlink("lr.s");
+  rmdir(dir);
+  printf("%s, %zu params (%.0f MB) in %zu partitions of %zu bytes\n",
+         worker ? "worker" : "server", params, params * sizeof(float) / 1e6,
+         num_partitions, partition);
+  for (auto& kv : kwargs) {
+    printf("  %s=%s\n", kv.first.c_str(), kv.second.c_str());
+  }
+  printf("compressor memory: %.1f MB, %.2f bytes per param\n", after - before,
+         (after - before) * 1e6 / params);
+  return 0;
+}
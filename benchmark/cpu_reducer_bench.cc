@@ -0,0 +1,176 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Throughput of the CpuReducer over partition sizes, in GB/s of the partition:
+// dst += src, dst += alpha * src, the N-ary sum of 4 sources and copy, in
+// float32, float16 and bfloat16. Every vector instruction set of the CPU is
+// run, with the default BYTEPS_REDUCER_SINGLE_THREAD_BYTES and with the omp
+// team forked on every call ("fork"). The results are checked against the
+// generic kernels.
+//
+//   make -C benchmark cpu_reducer_bench
+//   BYTEPS_OMP_THREAD_PER_GPU=4 ./benchmark/cpu_reducer_bench [max bytes]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <functional>
+#include <memory>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "byteps/common/bfloat16.h"
+#include "byteps/common/cpu_reducer.h"
+#include "byteps/common/half.h"
+
+using byteps::common::bfloat16_t;
+using byteps::common::BYTEPS_BFLOAT16;
+using byteps::common::BYTEPS_FLOAT16;
+using byteps::common::BYTEPS_FLOAT32;
+using byteps::common::CpuReducer;
+using byteps::common::DataType;
+using mshadow::half::half_t;
+using Clock = std::chrono::steady_clock;
+
+struct Config {
+  std::string name;
+  const char* simd;
+  const char* threshold;
+};
+
+// GB/s of f over size bytes, for at least 3 calls and 0.1s
+double GBps(size_t size, const std::function<void()>& f) {
+  size_t iters = 0;
+  double secs = 0;
+  auto start = Clock::now();
+  while (iters < 3 || secs < 0.1) {
+    f();
+    ++iters;
+    secs = std::chrono::duration<double>(Clock::now() - start).count();
+  }
+  return size * (double)iters / secs / 1e9;
+}
+
+float Value(const std::vector<char>& buf, size_t i, DataType dtype) {
+  auto p = buf.data();
+  if (dtype == BYTEPS_FLOAT32) return reinterpret_cast<const float*>(p)[i];
+  if (dtype == BYTEPS_FLOAT16) return reinterpret_cast<const half_t*>(p)[i];
+  return reinterpret_cast<const bfloat16_t*>(p)[i];
+}
+
+const char* Name(DataType dtype) {
+  if (dtype == BYTEPS_FLOAT32) return "float32";
+  return dtype == BYTEPS_FLOAT16 ? "float16" : "bfloat16";
+}
+
+int main(int argc, char** argv) {
+  size_t max_size = argc > 1 ? atol(argv[1]) : 64 << 20;
+  const float alpha = 0.5;
+  const size_t num_srcs = 4;
+
+  __builtin_cpu_init();
+  std::vector<Config> configs = {{"generic", "generic", nullptr},
+                                 {"generic fork", "generic", "0"}};
+  if (__builtin_cpu_supports("avx2") && __builtin_cpu_supports("f16c")) {
+    configs.push_back({"avx2", "avx2", nullptr});
+    configs.push_back({"avx2 fork", "avx2", "0"});
+  }
+  if (__builtin_cpu_supports("avx512f")) {
+    configs.push_back({"avx512", "avx512", nullptr});
+    configs.push_back({"avx512 fork", "avx512", "0"});
+  }
+  const char* ops[] = {"sum", "sum_alpha", "sum_4", "copy"};
+
+  std::vector<std::unique_ptr<CpuReducer>> reducers;
+  for (auto& config : configs) {
+    setenv("BYTEPS_REDUCER_SIMD", config.simd, 1);
+    if (config.threshold) {
+      setenv("BYTEPS_REDUCER_SINGLE_THREAD_BYTES", config.threshold, 1);
+    } else {
+      unsetenv("BYTEPS_REDUCER_SINGLE_THREAD_BYTES");
+    }
+    reducers.emplace_back(new CpuReducer(nullptr));
+  }
+
+  printf("%-9s %-9s %-8s", "bytes", "op", "dtype");
+  for (auto& config : configs) printf(" %12s", config.name.c_str());
+  printf("\n");
+
+  std::mt19937 gen(0);
+  std::normal_distribution<float> dist(0, 1);
+  // odd sizes, so that the tails of the vector kernels run
+  for (size_t size = 1024; size <= max_size; size *= 4) {
+    for (auto dtype : {BYTEPS_FLOAT32, BYTEPS_FLOAT16, BYTEPS_BFLOAT16}) {
+      size_t elem = dtype == BYTEPS_FLOAT32 ? 4 : 2;
+      size_t len = (size / elem - 3) * elem;
+      std::vector<std::vector<char>> srcs(num_srcs, std::vector<char>(len));
+      for (auto& src : srcs) {
+        for (size_t i = 0; i < len / elem; ++i) {
+          float x = dist(gen);
+          if (dtype == BYTEPS_FLOAT32) {
+            reinterpret_cast<float*>(&src[0])[i] = x;
+          } else if (dtype == BYTEPS_FLOAT16) {
+            reinterpret_cast<half_t*>(&src[0])[i] = half_t(x);
+          } else {
+            reinterpret_cast<bfloat16_t*>(&src[0])[i] = bfloat16_t(x);
+          }
+        }
+      }
+      std::vector<const void*> src_ptrs;
+      for (auto& src : srcs) src_ptrs.push_back(src.data());
+
+      for (auto op : ops) {
+        std::string name(op);
+        printf("%-9zu %-9s %-8s", len, op, Name(dtype));
+        std::vector<char> expected;
+        for (auto& reducer : reducers) {
+          std::vector<char> dst(srcs[0]);
+          auto run = [&] {
+            if (name == "sum") {
+              reducer->sum(dst.data(), srcs[1].data(), len, dtype);
+            } else if (name == "sum_alpha") {
+              reducer->sum(dst.data(), srcs[1].data(), len, dtype, alpha);
+            } else if (name == "sum_4") {
+              reducer->sum(dst.data(), src_ptrs, len, dtype);
+            } else {
+              reducer->copy(dst.data(), srcs[1].data(), len);
+            }
+          };
+          // the result of one call from the initial dst
+          run();
+          if (expected.empty()) {
+            expected = dst;
+          } else {
+            for (size_t i = 0; i < len / elem; ++i) {
+              float x = Value(dst, i, dtype), y = Value(expected, i, dtype);
+              if (std::abs(x - y) > (elem == 4 ? 1e-6 : 1e-3) * std::abs(y)) {
+                printf("\nmismatch of %s at %zu: %g vs %g\n", op, i, x, y);
+                return 1;
+              }
+            }
+          }
+          // keep the values bounded over the repeated calls
+          if (name == "sum") dst = srcs[0];
+          printf(" %12.2f", GBps(len, run));
+        }
+        printf("\n");
+      }
+    }
+  }
+  return 0;
+}
@@ -0,0 +1,112 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// CPU burnt by idle core loops, 1us sleep-polling (BYTEPS_CORE_LOOP_POLLING=1)
+// against waiting on a TaskNotifier, and the wake-up latency of the latter.
+//
+//   make -C benchmark idle_wait_bench
+//   ./benchmark/idle_wait_bench [num_threads] [seconds]
+
+#include <sys/resource.h>
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <thread>
+#include <vector>
+
+#include "byteps/common/notifier.h"
+
+using byteps::common::TaskNotifier;
+using Clock = std::chrono::steady_clock;
+
+double CpuSeconds() {
+  struct rusage ru;
+  getrusage(RUSAGE_SELF, &ru);
+  return ru.ru_utime.tv_sec + ru.ru_stime.tv_sec +
+         (ru.ru_utime.tv_usec + ru.ru_stime.tv_usec) / 1e6;
+}
+
+// Returns the CPU usage in percent of one core while `num_threads` loops
+// idle for `seconds`.
+double IdleCpu(int num_threads, double seconds, bool polling) {
+  std::atomic_bool stop{false};
+  std::vector<TaskNotifier> notifiers(num_threads);
+  std::vector<std::thread> threads;
+  double cpu_start = CpuSeconds();
+  auto start = Clock::now();
+  for (int i = 0; i < num_threads; ++i) {
+    threads.emplace_back([&, i] {
+      while (!stop) {
+        auto epoch = notifiers[i].GetEpoch();
+        if (polling) {
+          std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+        } else {
+          notifiers[i].Wait(epoch, std::chrono::microseconds(10000));
+        }
+      }
+    });
+  }
+  std::this_thread::sleep_for(std::chrono::duration<double>(seconds));
+  stop = true;
+  for (auto& n : notifiers) n.Notify();
+  for (auto& t : threads) t.join();
+  double wall = std::chrono::duration<double>(Clock::now() - start).count();
+  return (CpuSeconds() - cpu_start) / wall * 100;
+}
+
+// Median latency from Notify() to the waiter running, in microseconds.
+double WakeupLatency(int rounds) {
+  TaskNotifier notifier;
+  std::atomic<int64_t> sent_ns{0};
+  std::atomic_bool stop{false};
+  std::vector<double> lat;
+  std::thread waiter([&] {
+    auto epoch = notifier.GetEpoch();
+    while (!stop) {
+      notifier.Wait(epoch, std::chrono::microseconds(10000));
+      auto now = Clock::now().time_since_epoch().count();
+      if (notifier.GetEpoch() != epoch) {
+        lat.push_back((now - sent_ns.load()) / 1e3);
+        epoch = notifier.GetEpoch();
+      }
+    }
+  });
+  for (int i = 0; i < rounds; ++i) {
+    std::this_thread::sleep_for(std::chrono::microseconds(200));
+    sent_ns = Clock::now().time_since_epoch().count();
+    notifier.Notify();
+  }
+  std::this_thread::sleep_for(std::chrono::milliseconds(1));
+  stop = true;
+  notifier.Notify();
+  waiter.join();
+  std::sort(lat.begin(), lat.end());
+  return lat.empty() ? 0 : lat[lat.size() / 2];
+}
+
+int main(int argc, char** argv) {
+  int num_threads = argc > 1 ? atoi(argv[1]) : 12;
+  double seconds = argc > 2 ? atof(argv[2]) : 2;
+
+  printf("idle CPU, %d loop threads, %.1fs\n", num_threads, seconds);
+  printf("  polling:  %6.1f%% of a core\n", IdleCpu(num_threads, seconds, true));
+  printf("  notifier: %6.1f%% of a core\n",
+         IdleCpu(num_threads, seconds, false));
+  printf("notifier wake-up latency (median): %.1f us\n", WakeupLatency(2000));
+  return 0;
+}
@@ -0,0 +1,113 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Throughput of the scaled onebit compressor on a float32 partition:
+// Compress, Decompress and the FastUpdateError of error feedback. It also
+// checks them against a bit-by-bit reference.
+//
+//   make -C benchmark onebit_bench
+//   OMP_NUM_THREADS=4 ./benchmark/onebit_bench [bytes]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <random>
+#include <vector>
+
+#include "byteps/common/compressor/impl/onebit.h"
+
+using byteps::common::BYTEPS_FLOAT32;
+using byteps::common::compressor::OnebitCompressor;
+using byteps::common::compressor::tensor_t;
+using Clock = std::chrono::steady_clock;
+
+template <typename F>
+double GBps(size_t bytes, int iters, F f) {
+  auto start = Clock::now();
+  for (int i = 0; i < iters; ++i) f();
+  double secs = std::chrono::duration<double>(Clock::now() - start).count();
+  return bytes * (double)iters / secs / 1e9;
+}
+
+int main(int argc, char** argv) {
+  size_t size = argc > 1 ? atol(argv[1]) : 4096000;
+  // not a multiple of 32, so that the last word is padded
+  size_t len = size / sizeof(float) - 7;
+  size = len * sizeof(float);
+  size_t words = (len + 31) / 32;
+
+  std::vector<float> grad(len), out(len), error(len);
+  std::mt19937 gen(0);
+  std::normal_distribution<float> dist(0, 1e-3);
+  double l1 = 0;
+  for (auto& x : grad) {
+    x = dist(gen);
+    l1 += std::abs(x);
+  }
+  float scale = l1 / len;
+  tensor_t t(reinterpret_cast<char*>(grad.data()), size, BYTEPS_FLOAT32);
+  OnebitCompressor c(size, BYTEPS_FLOAT32, true);
+
+  auto compressed = c.Compress(t);
+  auto bits = reinterpret_cast<const uint32_t*>(compressed.data);
+  if (compressed.size != words * 4 + sizeof(float) ||
+      std::abs(*reinterpret_cast<const float*>(bits + words) - scale) >
+          1e-6 * scale) {
+    printf("wrong size or scale\n");
+    return 1;
+  }
+  for (size_t i = 0; i < len; ++i) {
+    bool neg = (bits[i / 32] >> (31 - i % 32)) & 1;
+    if (neg != (grad[i] < 0)) {
+      printf("wrong sign at %zu\n", i);
+      return 1;
+    }
+  }
+  std::vector<char> copy(compressed.data, compressed.data + compressed.size);
+  tensor_t packed(copy.data(), copy.size(), BYTEPS_FLOAT32);
+  c.FastUpdateError(tensor_t(reinterpret_cast<char*>(error.data()), size,
+                             BYTEPS_FLOAT32),
+                    t, packed);
+  // in place on workers, into the buffer of the compressor on servers
+  std::memcpy(out.data(), copy.data(), copy.size());
+  auto decompressed = c.Decompress(tensor_t(
+      reinterpret_cast<char*>(out.data()), copy.size(), BYTEPS_FLOAT32));
+  std::memcpy(out.data(), decompressed.data, size);
+  for (size_t i = 0; i < len; ++i) {
+    float expected = grad[i] < 0 ? -scale : scale;
+    if (std::abs(out[i] - expected) > 1e-6 * scale ||
+        std::abs(error[i] - (grad[i] - out[i])) > 1e-6 * scale) {
+      printf("wrong value at %zu\n", i);
+      return 1;
+    }
+  }
+
+  int iters = std::max(10, (int)(4e9 / size));
+  printf("%zu floats\n", len);
+  printf("Compress:        %6.2f GB/s\n",
+         GBps(size, iters, [&] { c.Compress(t); }));
+  printf("Decompress:      %6.2f GB/s\n", GBps(size, iters, [&] {
+           c.Decompress(tensor_t(reinterpret_cast<char*>(out.data()),
+                                 copy.size(), BYTEPS_FLOAT32));
+         }));
+  printf("FastUpdateError: %6.2f GB/s\n", GBps(size, iters, [&] {
+           c.FastUpdateError(tensor_t(reinterpret_cast<char*>(error.data()),
+                                      size, BYTEPS_FLOAT32),
+                             t, packed);
+         }));
+  return 0;
+}
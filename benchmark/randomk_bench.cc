@@ -0,0 +1,151 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Runs the randomk compressors of a few workers and of the server in-process
+// for some steps, with and without compressor_randomk_shared_seed: each
+// worker compresses its gradient, the server decompresses and sums the
+// pushes and compresses the sum, and each worker decompresses that. It
+// checks that a shared seed gives every worker the sum of all gradients on
+// the same indices, and prints the bytes pushed per key.
+//
+//   make -C benchmark randomk_bench
+//   ./benchmark/randomk_bench [num_workers] [bytes]
+
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <memory>
+#include <random>
+#include <vector>
+
+#include "byteps/common/compressor/impl/randomk.h"
+
+using byteps::common::BYTEPS_FLOAT32;
+using byteps::common::compressor::RandomkCompressor;
+using byteps::common::compressor::tensor_t;
+
+constexpr unsigned kSeed = 2020;
+constexpr int kSteps = 5;
+
+tensor_t Tensor(std::vector<float>* v) {
+  return tensor_t(reinterpret_cast<char*>(v->data()), v->size() * sizeof(float),
+                  BYTEPS_FLOAT32);
+}
+
+tensor_t Tensor(std::vector<char>* v) {
+  return tensor_t(v->data(), v->size(), BYTEPS_FLOAT32);
+}
+
+std::vector<float> ToVector(tensor_t t) {
+  auto p = reinterpret_cast<const float*>(t.data);
+  return std::vector<float>(p, p + t.size / sizeof(float));
+}
+
+std::vector<char> ToBytes(tensor_t t) {
+  return std::vector<char>(t.data, t.data + t.size);
+}
+
+// runs the steps, returns the bytes of a push, or 0 if a check fails
+size_t Run(int num_workers, size_t len, unsigned k, bool shared_seed) {
+  size_t size = len * sizeof(float);
+  std::vector<std::unique_ptr<RandomkCompressor>> workers;
+  for (int w = 0; w < num_workers; ++w) {
+    workers.emplace_back(
+        new RandomkCompressor(size, BYTEPS_FLOAT32, k, kSeed, shared_seed));
+  }
+  RandomkCompressor server(size, BYTEPS_FLOAT32, k, kSeed, shared_seed);
+
+  std::mt19937 gen(0);
+  std::normal_distribution<float> dist(0, 1);
+  std::vector<bool> last_mask;
+  size_t push_bytes = 0;
+  for (int step = 0; step < kSteps; ++step) {
+    std::vector<std::vector<float>> grads(num_workers,
+                                          std::vector<float>(len));
+    std::vector<std::vector<char>> pushes;
+    for (int w = 0; w < num_workers; ++w) {
+      for (auto& x : grads[w]) x = dist(gen);
+      pushes.push_back(ToBytes(workers[w]->Compress(Tensor(&grads[w]))));
+      push_bytes = pushes.back().size();
+
+      // the error feedback of the worker zeroes what it sent
+      std::vector<float> error(len);
+      workers[w]->FastUpdateError(Tensor(&error), Tensor(&grads[w]),
+                                  Tensor(&pushes.back()));
+      for (size_t i = 0; i < len; ++i) {
+        if (error[i] != 0 && error[i] != grads[w][i]) {
+          printf("step %d: wrong error of worker %d at %zu\n", step, w, i);
+          return 0;
+        }
+      }
+    }
+
+    // the server sums the decompressed pushes and compresses the sum
+    std::vector<float> merged(len, 0);
+    std::vector<float> expected(len, 0);
+    for (int w = 0; w < num_workers; ++w) {
+      auto pushed = ToVector(server.Decompress(Tensor(&pushes[w])));
+      for (size_t i = 0; i < len; ++i) {
+        merged[i] += pushed[i];
+        expected[i] += grads[w][i];
+      }
+    }
+    auto pulled = ToBytes(server.Compress(Tensor(&merged)));
+
+    for (int w = 0; w < num_workers; ++w) {
+      auto copy = pulled;
+      auto result = ToVector(workers[w]->Decompress(Tensor(&copy)));
+      std::vector<bool> mask(len);
+      size_t nonzero = 0;
+      for (size_t i = 0; i < len; ++i) {
+        if (result[i] == 0) continue;
+        mask[i] = true;
+        ++nonzero;
+        if (!shared_seed) continue;
+        if (result[i] != expected[i]) {
+          printf("step %d: worker %d got %g at %zu, expected %g\n", step, w,
+                 result[i], i, expected[i]);
+          return 0;
+        }
+      }
+      if (nonzero == 0 || nonzero > k) {
+        printf("step %d: worker %d got %zu entries\n", step, w, nonzero);
+        return 0;
+      }
+      if (shared_seed && w == 0 && mask == last_mask) {
+        printf("step %d: the indices of the last step\n", step);
+        return 0;
+      }
+      if (w == 0) last_mask = mask;
+    }
+  }
+  return push_bytes;
+}
+
+int main(int argc, char** argv) {
+  int num_workers = argc > 1 ? atoi(argv[1]) : 4;
+  size_t size = argc > 2 ? atol(argv[2]) : 4096000;
+  size_t len = size / sizeof(float);
+  unsigned k = len / 100;
+
+  size_t pairs = Run(num_workers, len, k, false);
+  size_t values = Run(num_workers, len, k, true);
+  if (!pairs || !values) return 1;
+  printf("%d workers, %zu floats, k=%u, %d steps: OK\n", num_workers, len, k,
+         kSteps);
+  printf("bytes per push: %zu with indices, %zu with a shared seed\n", pairs,
+         values);
+  return 0;
+}
@@ -0,0 +1,182 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Contention on the ready table, the slot-indexed one against the previous
+// map behind one mutex. Several signaling threads (the other local ranks)
+// signal every key once per round, each in its own order, and a queue thread
+// takes the keys as they become ready, checks and clears them under its queue
+// lock, as BytePSScheduledQueue::getTask does. A round ends when all the keys
+// have been taken.
+//
+//   make -C benchmark ready_table_bench
+//   ./benchmark/ready_table_bench [signalers] [keys] [rounds]
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
+#include <cstdio>
+#include <cstdlib>
+#include <functional>
+#include <map>
+#include <mutex>
+#include <random>
+#include <thread>
+#include <unordered_map>
+#include <vector>
+
+#include "byteps/common/ready_table.h"
+
+using byteps::common::ReadyTable;
+
+// The previous ReadyTable: every access takes one mutex.
+class MapReadyTable {
+ public:
+  using Listener = std::function<void(uint64_t)>;
+  MapReadyTable(int ready_count, const char* name)
+      : _ready_count(ready_count) {}
+  bool IsKeyReady(uint64_t key) {
+    std::lock_guard<std::mutex> lock(_table_mutex);
+    return _ready_table[key] == _ready_count;
+  }
+  int AddReadyCount(uint64_t key) {
+    int cnt;
+    {
+      std::lock_guard<std::mutex> lock(_table_mutex);
+      cnt = ++_ready_table[key];
+    }
+    if (cnt == _ready_count) NotifyReady(key);
+    return cnt;
+  }
+  void ClearReadyCount(uint64_t key) {
+    std::lock_guard<std::mutex> lock(_table_mutex);
+    _ready_table[key] = 0;
+  }
+  int AddListener(Listener listener) {
+    std::lock_guard<std::mutex> lock(_listener_mutex);
+    _listeners[_next_listener_id] = std::move(listener);
+    return _next_listener_id++;
+  }
+  void RemoveListener(int id) {
+    std::lock_guard<std::mutex> lock(_listener_mutex);
+    _listeners.erase(id);
+  }
+
+ private:
+  void NotifyReady(uint64_t key) {
+    std::lock_guard<std::mutex> lock(_listener_mutex);
+    for (auto& it : _listeners) it.second(key);
+  }
+
+  std::unordered_map<uint64_t, int> _ready_table;
+  std::mutex _table_mutex;
+  int _ready_count;
+  std::mutex _listener_mutex;
+  std::map<int, Listener> _listeners;
+  int _next_listener_id = 0;
+};
+
+// keys of tensors of 1 to 8 partitions, as declared_key << 16 | partition
+std::vector<uint64_t> MakeKeys(size_t n) {
+  std::vector<uint64_t> keys;
+  std::mt19937 gen(0);
+  std::uniform_int_distribution<int> parts(1, 8);
+  for (uint64_t declared_key = 0; keys.size() < n; ++declared_key) {
+    int num_parts = parts(gen);
+    for (int p = 0; p < num_parts && keys.size() < n; ++p) {
+      keys.push_back((declared_key << 16) | p);
+    }
+  }
+  return keys;
+}
+
+// seconds for all the rounds
+template <typename Table>
+double Run(int num_signalers, const std::vector<uint64_t>& keys,
+           int rounds) {
+  Table table(num_signalers, "BENCH");
+  // the queue: the keys its listener was told about
+  std::mutex queue_mu;
+  std::condition_variable queue_cond;
+  std::vector<uint64_t> ready;
+  int id = table.AddListener([&](uint64_t key) {
+    {
+      std::lock_guard<std::mutex> lock(queue_mu);
+      ready.push_back(key);
+    }
+    queue_cond.notify_one();
+  });
+  std::atomic<int> taken_rounds{0};
+
+  auto start = std::chrono::steady_clock::now();
+  std::vector<std::thread> signalers;
+  for (int s = 0; s < num_signalers; ++s) {
+    signalers.emplace_back([&, s] {
+      auto order = keys;
+      std::mt19937 gen(s);
+      for (int r = 0; r < rounds; ++r) {
+        std::shuffle(order.begin(), order.end(), gen);
+        for (auto key : order) table.AddReadyCount(key);
+        // the key is not signaled again before it is taken
+        while (taken_rounds.load() <= r) std::this_thread::yield();
+      }
+    });
+  }
+  std::thread queue([&] {
+    size_t taken = 0;
+    std::vector<uint64_t> batch;
+    for (int r = 0; r < rounds; ++r) {
+      while (taken < keys.size() * (r + 1)) {
+        std::unique_lock<std::mutex> lock(queue_mu);
+        queue_cond.wait(lock, [&] { return !ready.empty(); });
+        batch.swap(ready);
+        for (auto key : batch) {
+          if (!table.IsKeyReady(key)) {
+            fprintf(stderr, "key %llu is not ready\n",
+                    (unsigned long long)key);
+            exit(1);
+          }
+          table.ClearReadyCount(key);
+        }
+        taken += batch.size();
+        batch.clear();
+      }
+      taken_rounds = r + 1;
+    }
+  });
+  for (auto& t : signalers) t.join();
+  queue.join();
+  table.RemoveListener(id);
+  return std::chrono::duration<double>(std::chrono::steady_clock::now() -
+                                       start).count();
+}
+
+int main(int argc, char** argv) {
+  int num_signalers = argc > 1 ? atoi(argv[1]) : 4;
+  size_t num_keys = argc > 2 ? atol(argv[2]) : 4096;
+  int rounds = argc > 3 ? atoi(argv[3]) : 20;
+  auto keys = MakeKeys(num_keys);
+  double signals = (double)num_signalers * num_keys * rounds;
+
+  printf("%d signalers, %zu keys, %d rounds\n", num_signalers, num_keys,
+         rounds);
+  for (int m = 0; m < 2; ++m) {
+    double secs = m ? Run<MapReadyTable>(num_signalers, keys, rounds)
+                    : Run<ReadyTable>(num_signalers, keys, rounds);
+    printf("%-12s %8.2f ms, %8.2f M signals/s\n", m ? "map+mutex" : "slots",
+           secs * 1e3, signals / secs / 1e6);
+  }
+  return 0;
+}
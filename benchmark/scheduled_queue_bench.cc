@@ -0,0 +1,149 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Enqueue/dequeue cost of the scheduled queue, the indexed queue against the
+// old sort-on-insert vector.
+//
+//   make -C benchmark scheduled_queue_bench
+//   ./benchmark/scheduled_queue_bench [num_tasks ...]
+
+#include <algorithm>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <memory>
+#include <random>
+#include <vector>
+
+#include "byteps/common/indexed_queue.h"
+
+using byteps::common::IndexedTaskQueue;
+
+struct Task {
+  uint64_t key;
+  int priority;
+  unsigned int len;
+  bool ready;
+};
+using TaskPtr = std::shared_ptr<Task>;
+using Indexed = IndexedTaskQueue<Task>;
+
+// The previous BytePSScheduledQueue: sort on every insert, linear scan and
+// erase from the middle on every pop.
+class VectorQueue {
+ public:
+  void push(TaskPtr task) {
+    _sq.push_back(task);
+    std::sort(_sq.begin(), _sq.end(), [](const TaskPtr& a, const TaskPtr& b) {
+      if (a->priority == b->priority) return a->key < b->key;
+      return a->priority > b->priority;
+    });
+  }
+  template <typename CheckFn>
+  TaskPtr pop(uint64_t credits, CheckFn&& check) {
+    for (auto it = _sq.begin(); it != _sq.end(); ++it) {
+      if ((*it)->len > credits || check(*it) != Indexed::READY) continue;
+      auto task = *it;
+      _sq.erase(it);
+      return task;
+    }
+    return nullptr;
+  }
+  void unpark(uint64_t key) {}
+
+ private:
+  std::vector<TaskPtr> _sq;
+};
+
+// Tensors of a model with `n` partitions in total, in the order the
+// backward pass produces them: the last layer (lowest priority) first.
+std::vector<TaskPtr> MakeTasks(int n) {
+  std::vector<TaskPtr> tasks;
+  std::mt19937 gen(0);
+  std::uniform_int_distribution<int> parts(1, 8);
+  int declared_key = 0;
+  while ((int)tasks.size() < n) {
+    int num_parts = std::min(parts(gen), n - (int)tasks.size());
+    for (int p = 0; p < num_parts; ++p) {
+      auto t = std::make_shared<Task>();
+      t->key = ((uint64_t)declared_key << 16) + p;
+      t->priority = declared_key - n;
+      t->len = 4096000;
+      t->ready = (gen() % 4) != 0;
+      tasks.push_back(t);
+    }
+    ++declared_key;
+  }
+  return tasks;
+}
+
+template <typename Q>
+double Run(Q& q, const std::vector<TaskPtr>& tasks, int cycles) {
+  // not-ready tasks stand for tasks waiting on the ready table
+  auto ready = [](const TaskPtr& t) {
+    return t->ready ? Indexed::READY : Indexed::PARK;
+  };
+  auto start = std::chrono::steady_clock::now();
+  size_t popped = 0;
+  for (int c = 0; c < cycles; ++c) {
+    for (auto& t : tasks) q.push(t);
+    // drain ready tasks, then flip the rest to ready and drain again, like
+    // tasks waiting on other local ranks
+    while (q.pop(34359738368ULL, ready)) ++popped;
+    for (auto& t : tasks) {
+      if (!t->ready) {
+        t->ready = true;
+        q.unpark(t->key);
+      }
+    }
+    while (q.pop(34359738368ULL, ready)) ++popped;
+  }
+  auto end = std::chrono::steady_clock::now();
+  if (popped != tasks.size() * cycles) {
+    fprintf(stderr, "lost tasks: %zu of %zu\n", popped, tasks.size() * cycles);
+    exit(1);
+  }
+  return std::chrono::duration<double, std::milli>(end - start).count();
+}
+
+int main(int argc, char** argv) {
+  std::vector<int> sizes;
+  for (int i = 1; i < argc; ++i) sizes.push_back(atoi(argv[i]));
+  if (sizes.empty()) sizes = {1000, 10000, 100000};
+
+  printf("%10s %14s %14s\n", "tasks", "indexed(ms)", "vector(ms)");
+  for (int n : sizes) {
+    auto tasks = MakeTasks(n);
+    std::vector<bool> init;
+    for (auto& t : tasks) init.push_back(t->ready);
+
+    Indexed indexed(true);
+    double t_indexed = Run(indexed, tasks, 1);
+
+    // the vector queue is quadratic, skip it where it would take minutes
+    double t_vector = -1;
+    if (n <= 20000) {
+      for (size_t i = 0; i < tasks.size(); ++i) tasks[i]->ready = init[i];
+      VectorQueue vec;
+      t_vector = Run(vec, tasks, 1);
+    }
+    if (t_vector < 0) {
+      printf("%10d %14.2f %14s\n", n, t_indexed, "skipped");
+    } else {
+      printf("%10d %14.2f %14.2f\n", n, t_indexed, t_vector);
+    }
+  }
+  return 0;
+}
@@ -0,0 +1,183 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Opens the shared memory of many keys from several processes, like the
+// local workers do at init: with one shm file and mapping per key (as without
+// BYTEPS_SHM_ARENA), and with a ShmArena. Every process opens the keys in its
+// own order. With the arena, each process then writes to every region and
+// checks that the others see its writes, i.e., that they all got the same
+// regions, and that the regions do not overlap. No GPU is needed, the regions
+// are not pinned.
+//
+//   make -C benchmark shm_arena_bench
+//   ./benchmark/shm_arena_bench [processes] [keys] [max bytes per key]
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <new>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "byteps/common/shm_arena.h"
+
+using byteps::common::ShmArena;
+using Clock = std::chrono::steady_clock;
+
+// shared by the processes, set up before the fork
+struct Shared {
+  std::atomic<int> arrived;
+  std::atomic<int> errors;
+  double secs[2][64];
+};
+
+void Barrier(Shared* shared, int num_procs, int round) {
+  shared->arrived.fetch_add(1);
+  while (shared->arrived.load() < num_procs * round) sched_yield();
+}
+
+void* OpenShm(const std::string& name, size_t size) {
+  int fd = shm_open(name.c_str(), O_CREAT | O_RDWR, 0666);
+  if (fd < 0 || ftruncate(fd, size) < 0) {
+    perror(name.c_str());
+    exit(1);
+  }
+  void* ptr = mmap(0, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  // BytePS keeps it open, which also counts against the limit of fds
+  close(fd);
+  return ptr;
+}
+
+int Run(int p, int num_procs, const std::vector<size_t>& sizes,
+        Shared* shared) {
+  size_t num_keys = sizes.size();
+  std::vector<size_t> order(num_keys);
+  for (size_t i = 0; i < num_keys; ++i) order[i] = i;
+  std::shuffle(order.begin(), order.end(), std::mt19937(p));
+  int round = 0;
+
+  // one file per key
+  Barrier(shared, num_procs, ++round);
+  auto start = Clock::now();
+  std::vector<void*> files(num_keys);
+  for (auto k : order) {
+    files[k] = OpenShm("BytePS_Bench_ShM_" + std::to_string(k), sizes[k]);
+  }
+  shared->secs[0][p] =
+      std::chrono::duration<double>(Clock::now() - start).count();
+  Barrier(shared, num_procs, ++round);
+  for (size_t k = 0; k < num_keys; ++k) {
+    munmap(files[k], sizes[k]);
+    if (p == 0) shm_unlink(("BytePS_Bench_ShM_" + std::to_string(k)).c_str());
+  }
+
+  // the arena
+  Barrier(shared, num_procs, ++round);
+  start = Clock::now();
+  ShmArena arena("BytePS_Bench_Arena", 1 << 30, false);
+  std::vector<char*> regions(num_keys);
+  for (auto k : order) {
+    // keys of the first partition of each tensor, as in InitTensor
+    regions[k] = static_cast<char*>(arena.Open(k << 16, sizes[k]));
+  }
+  shared->secs[1][p] =
+      std::chrono::duration<double>(Clock::now() - start).count();
+
+  // each process writes its slot at the start of every region, the last one
+  // the key at the end
+  for (size_t k = 0; k < num_keys; ++k) {
+    reinterpret_cast<uint64_t*>(regions[k])[p] = (k << 8) | p;
+    if (p == num_procs - 1) {
+      reinterpret_cast<uint64_t*>(regions[k] + sizes[k])[-1] = k;
+    }
+  }
+  Barrier(shared, num_procs, ++round);
+  for (size_t k = 0; k < num_keys; ++k) {
+    bool ok = reinterpret_cast<uint64_t*>(regions[k] + sizes[k])[-1] == k;
+    for (int q = 0; q < num_procs; ++q) {
+      ok &= reinterpret_cast<uint64_t*>(regions[k])[q] == ((k << 8) | q);
+    }
+    if (!ok) {
+      fprintf(stderr, "process %d: wrong region of key %zu\n", p, k);
+      shared->errors.fetch_add(1);
+      break;
+    }
+  }
+  if (p == 0) {
+    printf("arena: %zu segment(s) for %zu keys\n", arena.NumSegments(),
+           num_keys);
+    fflush(stdout);
+  }
+  // all checked before the first one unlinks
+  Barrier(shared, num_procs, ++round);
+  return 0;
+}
+
+int main(int argc, char** argv) {
+  int num_procs = argc > 1 ? atoi(argv[1]) : 4;
+  size_t num_keys = argc > 2 ? atol(argv[2]) : 2000;
+  size_t max_bytes = argc > 3 ? atol(argv[3]) : 256 << 10;
+  if (num_procs < 1 || num_procs > 64 || max_bytes < 64 * 8) {
+    fprintf(stderr, "1 to 64 processes, at least 512 bytes per key\n");
+    return 1;
+  }
+
+  // page rounded like the BytePS buffers, the same in all processes
+  std::mt19937 gen(0);
+  std::uniform_int_distribution<size_t> dist(1, max_bytes / 4096);
+  std::vector<size_t> sizes(num_keys);
+  for (auto& size : sizes) size = dist(gen) * 4096;
+
+  auto shared = static_cast<Shared*>(mmap(0, sizeof(Shared),
+                                          PROT_READ | PROT_WRITE,
+                                          MAP_SHARED | MAP_ANONYMOUS, -1, 0));
+  new (shared) Shared();
+  std::vector<pid_t> pids;
+  for (int p = 0; p < num_procs; ++p) {
+    pid_t pid = fork();
+    if (pid == 0) _exit(Run(p, num_procs, sizes, shared));
+    pids.push_back(pid);
+  }
+  int failed = 0;
+  for (auto pid : pids) {
+    int status;
+    waitpid(pid, &status, 0);
+    failed += !WIFEXITED(status) || WEXITSTATUS(status);
+  }
+  if (failed || shared->errors) {
+    printf("FAILED: %d process(es), %d error(s)\n", failed,
+           shared->errors.load());
+    return 1;
+  }
+
+  const char* modes[] = {"file per key", "arena"};
+  for (int m = 0; m < 2; ++m) {
+    double secs = *std::max_element(shared->secs[m],
+                                    shared->secs[m] + num_procs);
+    printf("%-12s %d processes x %zu keys: %8.2f ms, %6.2f us per key\n",
+           modes[m], num_procs, num_keys, secs * 1e3,
+           secs * 1e6 / num_keys);
+  }
+  return 0;
+}
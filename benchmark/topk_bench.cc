@@ -0,0 +1,88 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Compress time of the topk compressor, heap against select
+// (compressor_topk_select), across k ratios on a 4 MB float32 partition. It
+// also checks that both pick entries of the same magnitudes.
+//
+//   make -C benchmark topk_bench
+//   ./benchmark/topk_bench [num_threads] [bytes]
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+#include "byteps/common/compressor/impl/topk.h"
+
+using byteps::common::BYTEPS_FLOAT32;
+using byteps::common::compressor::TopkCompressor;
+using byteps::common::compressor::tensor_t;
+using Clock = std::chrono::steady_clock;
+
+// the sorted magnitudes of the selected entries
+std::vector<float> Magnitudes(const tensor_t& compressed) {
+  auto pairs = reinterpret_cast<const std::pair<uint32_t, float>*>(
+      compressed.data);
+  std::vector<float> mags;
+  for (size_t i = 0; i < compressed.size / sizeof(*pairs); ++i) {
+    mags.push_back(std::abs(pairs[i].second));
+  }
+  std::sort(mags.begin(), mags.end());
+  return mags;
+}
+
+double CompressUs(TopkCompressor* c, tensor_t grad, int iters) {
+  auto start = Clock::now();
+  for (int i = 0; i < iters; ++i) c->Compress(grad);
+  return std::chrono::duration<double, std::micro>(Clock::now() - start)
+             .count() /
+         iters;
+}
+
+int main(int argc, char** argv) {
+  int num_threads = argc > 1 ? atoi(argv[1]) : 4;
+  size_t size = argc > 2 ? atol(argv[2]) : 4096000;
+  size_t len = size / sizeof(float);
+  size = len * sizeof(float);
+
+  std::vector<float> grad(len);
+  std::mt19937 gen(0);
+  std::normal_distribution<float> dist(0, 1e-3);
+  for (auto& x : grad) x = dist(gen);
+  tensor_t t(reinterpret_cast<char*>(grad.data()), size, BYTEPS_FLOAT32);
+
+  printf("%zu floats, %d threads\n", len, num_threads);
+  printf("%8s %10s %12s %12s %8s\n", "ratio", "k", "heap (us)", "select (us)",
+         "speedup");
+  for (double ratio : {0.001, 0.005, 0.01, 0.05, 0.1}) {
+    unsigned k = std::max<unsigned>(1, ratio * len);
+    TopkCompressor heap(size, BYTEPS_FLOAT32, k);
+    TopkCompressor select(size, BYTEPS_FLOAT32, k, true, num_threads);
+    if (Magnitudes(heap.Compress(t)) != Magnitudes(select.Compress(t))) {
+      printf("ratio %g: heap and select disagree\n", ratio);
+      return 1;
+    }
+    int iters = std::max(3, (int)(2e5 / len / std::max(ratio, 0.01)));
+    double heap_us = CompressUs(&heap, t, iters);
+    double select_us = CompressUs(&select, t, iters);
+    printf("%8g %10u %12.1f %12.1f %7.1fx\n", ratio, k, heap_us, select_us,
+           heap_us / select_us);
+  }
+  return 0;
+}
@@ -0,0 +1,99 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_BFLOAT16_H
+#define BYTEPS_BFLOAT16_H
+
+#include <stdint.h>
+
+#include <cstring>
+
+namespace byteps {
+namespace common {
+
+// round to nearest even, NaNs stay NaNs
+inline uint16_t FloatToBFloat16(float x) {
+  uint32_t u;
+  std::memcpy(&u, &x, sizeof(u));
+  if ((u & 0x7fffffff) > 0x7f800000) return (u >> 16) | 0x40;
+  return (u + 0x7fff + ((u >> 16) & 1)) >> 16;
+}
+
+inline float BFloat16ToFloat(uint16_t x) {
+  uint32_t u = static_cast<uint32_t>(x) << 16;
+  float f;
+  std::memcpy(&f, &u, sizeof(f));
+  return f;
+}
+
+/*!
+ * \brief bfloat16, the upper 16 bits of a float32
+ *
+ * \par
+ * It has the range of float32 with 8 bits of mantissa. Like half_t, it is
+ * computed in float: the operands convert to float, and the result rounds to
+ * nearest even when it is stored back.
+ */
+class bfloat16_t {
+ public:
+  uint16_t bits_;
+
+  static bfloat16_t Binary(uint16_t value) {
+    bfloat16_t res;
+    res.bits_ = value;
+    return res;
+  }
+
+  bfloat16_t() = default;
+  bfloat16_t(const float& value) : bits_(FloatToBFloat16(value)) {}
+  explicit bfloat16_t(const double& value)
+      : bits_(FloatToBFloat16(static_cast<float>(value))) {}
+  explicit bfloat16_t(const int32_t& value)
+      : bits_(FloatToBFloat16(static_cast<float>(value))) {}
+  explicit bfloat16_t(const uint32_t& value)
+      : bits_(FloatToBFloat16(static_cast<float>(value))) {}
+  explicit bfloat16_t(const int64_t& value)
+      : bits_(FloatToBFloat16(static_cast<float>(value))) {}
+  explicit bfloat16_t(const uint64_t& value)
+      : bits_(FloatToBFloat16(static_cast<float>(value))) {}
+
+  operator float() const { return BFloat16ToFloat(bits_); }
+
+  template <typename T>
+  bfloat16_t& operator+=(const T& a) {
+    return *this = bfloat16_t(float(*this) + float(a));
+  }
+  template <typename T>
+  bfloat16_t& operator-=(const T& a) {
+    return *this = bfloat16_t(float(*this) - float(a));
+  }
+  template <typename T>
+  bfloat16_t& operator*=(const T& a) {
+    return *this = bfloat16_t(float(*this) * float(a));
+  }
+  template <typename T>
+  bfloat16_t& operator/=(const T& a) {
+    return *this = bfloat16_t(float(*this) / float(a));
+  }
+
+  bfloat16_t operator-() const { return Binary(bits_ ^ 0x8000); }
+};
+
+static_assert(sizeof(bfloat16_t) == 2, "bfloat16_t should be 2 bytes");
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_BFLOAT16_H
@@ -64,6 +64,7 @@ enum DataType {
   BYTEPS_INT32 = 4,
   BYTEPS_INT8 = 5,
   BYTEPS_INT64 = 6,
+  BYTEPS_BFLOAT16 = 12,  // kBfloat16 in mshadow
   // below are not in mshadow, should avoid using these
   // BYTEPS_UINT16 = 7,
   // BYTEPS_INT16 = 8,
@@ -233,8 +234,8 @@ struct TensorTableEntry {
   int priority = 0;
   // The version of tensor
   int version = 0;
-  // Root rank for broadcast operation.
-  int root_rank = 0;
+  // Root rank for broadcast operation, -1 for push_pull
+  int root_rank = -1;
   // Event indicating that data is ready.
   std::shared_ptr<ReadyEvent> ready_event;
   // GPU to do reduction on, or CPU_DEVICE_ID in case of CPU.
@@ -267,7 +268,8 @@ using TensorTable = std::unordered_map<std::string, TensorTableEntry>;
 enum class RequestType {
   kDefaultPushPull,
   kRowSparsePushPull,
-  kCompressedPushPull
+  kCompressedPushPull,
+  kBroadcast
 };
 
 int GetCommandType(RequestType requestType, int d);
@@ -0,0 +1,124 @@
+// Copyright 2019 Amazon Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#include <atomic>
+#include <cstdint>
+#include <cstdlib>
+
+#include "../bfloat16.h"
+#include "../logging.h"
+#include "buffer_arena.h"
+
+namespace byteps {
+namespace common {
+namespace compressor {
+namespace {
+std::atomic<size_t> arena_bytes{0};
+
+struct Arena {
+  std::unique_ptr<byte_t[]> buf;
+  size_t size = 0;
+  ~Arena() { arena_bytes -= size; }
+};
+
+thread_local Arena arena;
+}  // namespace
+
+byte_t* BufferArena::Get(size_t size) {
+  if (arena.size < size) {
+    arena.buf.reset(new byte_t[size]);
+    arena_bytes += size - arena.size;
+    arena.size = size;
+  }
+  return arena.buf.get();
+}
+
+size_t BufferArena::Bytes() { return arena_bytes; }
+
+StateBuffer::StateBuffer(size_t size, DataType dtype, Precision precision)
+    : _size(size), _precision(precision) {
+  if (dtype != BYTEPS_FLOAT32) _precision = Precision::FULL;
+  _bytes = _precision == Precision::FULL ? size : size / 2;
+  _data.reset(new byte_t[_bytes]());
+  if (getenv("BYTEPS_OMP_THREAD_PER_GPU")) {
+    _num_threads = atoi(getenv("BYTEPS_OMP_THREAD_PER_GPU"));
+  } else {
+    _num_threads = 4;
+  }
+}
+
+byte_t* StateBuffer::Load() {
+  if (_precision == Precision::FULL) return _data.get();
+  auto view = reinterpret_cast<float*>(BufferArena::Get(_size));
+  size_t len = _size / sizeof(float);
+  if (_precision == Precision::FLOAT16) {
+    auto state = reinterpret_cast<const half_t*>(_data.get());
+#pragma omp parallel for simd num_threads(_num_threads)
+    for (size_t i = 0; i < len; ++i) view[i] = state[i];
+  } else {
+    auto state = reinterpret_cast<const uint16_t*>(_data.get());
+#pragma omp parallel for simd num_threads(_num_threads)
+    for (size_t i = 0; i < len; ++i) view[i] = BFloat16ToFloat(state[i]);
+  }
+  return reinterpret_cast<byte_t*>(view);
+}
+
+byte_t* StateBuffer::View() {
+  if (_precision == Precision::FULL) return _data.get();
+  return BufferArena::Get(_size);
+}
+
+void StateBuffer::Store() {
+  if (_precision == Precision::FULL) return;
+  auto view = reinterpret_cast<const float*>(BufferArena::Get(_size));
+  size_t len = _size / sizeof(float);
+  if (_precision == Precision::FLOAT16) {
+    auto state = reinterpret_cast<half_t*>(_data.get());
+#pragma omp parallel for simd num_threads(_num_threads)
+    for (size_t i = 0; i < len; ++i) state[i] = half_t(view[i]);
+  } else {
+    auto state = reinterpret_cast<uint16_t*>(_data.get());
+#pragma omp parallel for simd num_threads(_num_threads)
+    for (size_t i = 0; i < len; ++i) state[i] = FloatToBFloat16(view[i]);
+  }
+}
+
+StateBuffer::Precision StatePrecision(const kwargs_t& kwargs, DataType dtype) {
+  auto iter = kwargs.find("compressor_state_dtype");
+  if (iter == kwargs.end() || iter->second == "float32") {
+    return StateBuffer::Precision::FULL;
+  }
+  auto precision = StateBuffer::Precision::FULL;
+  if (iter->second == "float16") {
+    precision = StateBuffer::Precision::FLOAT16;
+  } else if (iter->second == "bfloat16") {
+    precision = StateBuffer::Precision::BFLOAT16;
+  } else {
+    BPS_LOG(FATAL) << "Hyper-parameter 'compressor_state_dtype' should not be "
+                   << iter->second << "! Aborted.";
+  }
+  if (dtype != BYTEPS_FLOAT32) {
+    BPS_LOG(INFO) << "compressor_state_dtype=" << iter->second
+                  << " only applies to float32 gradients, dtype=" << dtype;
+    return StateBuffer::Precision::FULL;
+  }
+  BPS_LOG(INFO) << "Register hyper-parameter 'compressor_state_dtype'="
+                << iter->second;
+  return precision;
+}
+
+}  // namespace compressor
+}  // namespace common
+}  // namespace byteps
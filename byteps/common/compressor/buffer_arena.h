@@ -0,0 +1,106 @@
+// Copyright 2019 Amazon Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_COMPRESSOR_BUFFER_ARENA_H
+#define BYTEPS_COMPRESSOR_BUFFER_ARENA_H
+
+#include <memory>
+
+#include "../common.h"
+#include "common.h"
+
+namespace byteps {
+namespace common {
+namespace compressor {
+
+/*!
+ * \brief Scratch buffer shared by the compressors of a thread
+ *
+ * \par
+ * Some results of a compressor are only read by the caller right away, e.g.,
+ * the decompressed push on servers, which is summed before the next message.
+ * Instead of a full-size buffer in every compressor of every partition, they
+ * are written to the arena of the calling thread, which grows to the largest
+ * partition and is shared by all the compressors run on the thread.
+ *
+ * \note The buffer is valid until the next `Get` on the same thread. So it
+ * must not be held across calls of other compressors, e.g., by decorators
+ * around the compressor they wrap.
+ */
+class BufferArena {
+ public:
+  /*!
+   * \brief buffer of the calling thread
+   *
+   * \param size bytes needed
+   * \return buffer of at least `size` bytes, its content is undefined
+   */
+  static byte_t* Get(size_t size);
+
+  /*! \brief bytes held by the arenas of all threads */
+  static size_t Bytes();
+};
+
+/*!
+ * \brief State of a decorator, e.g., the error of error-feedback
+ *
+ * \par
+ * The state is kept in the dtype of the gradient. For float32 gradients, it
+ * can be kept in float16 or bfloat16 instead (`compressor_state_dtype`), which
+ * halves its memory at the cost of its precision and of a conversion on every
+ * access. Then it is accessed through a float32 view in the `BufferArena`.
+ *
+ * \par
+ * `Load` returns the view with the values of the state, `View` the view to be
+ * overwritten, and `Store` writes the view back to the state. In full
+ * precision the view is the state itself.
+ */
+class StateBuffer {
+ public:
+  enum class Precision { FULL = 0, FLOAT16 = 1, BFLOAT16 = 2 };
+
+  // the state is cleared to zeros
+  StateBuffer(size_t size, DataType dtype, Precision precision);
+  ~StateBuffer() = default;
+
+  byte_t* Load();
+
+  byte_t* View();
+
+  void Store();
+
+  /*! \brief bytes of the state */
+  size_t bytes() const { return _bytes; }
+
+ private:
+  size_t _size;
+  size_t _bytes;
+  Precision _precision;
+  std::unique_ptr<byte_t[]> _data;
+  int _num_threads;
+};
+
+/*!
+ * \brief precision of the decorator states from `compressor_state_dtype`,
+ * one of float32 (default), float16 and bfloat16. Only float32 gradients are
+ * kept in lower precision.
+ */
+StateBuffer::Precision StatePrecision(const kwargs_t& kwargs, DataType dtype);
+
+}  // namespace compressor
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_COMPRESSOR_BUFFER_ARENA_H
@@ -16,11 +16,14 @@
 #ifndef BYTEPS_COMPRESSOR_COMMON_H
 #define BYTEPS_COMPRESSOR_COMMON_H
 
+#include <cstdint>
+#include <type_traits>
 #include <unordered_map>
 #if __F16C__
 #include "../half.h"
 using half_t = mshadow::half::half_t;
 #endif
+#include "../bfloat16.h"
 
 namespace byteps {
 namespace common {
@@ -41,12 +44,28 @@ typedef struct BPSTensor {
 
 using kwargs_t = std::unordered_map<std::string, std::string>;
 
+/*!
+ * \brief (index, value) pair of the sparse compressors
+ *
+ * The index_t of the switches below has the size of the value, which would
+ * wrap the indices of 16-bit values past 65536 elements, so they take 32 bits.
+ */
+template <typename index_t, typename scalar_t>
+using sparse_pair_t =
+    std::pair<typename std::conditional<(sizeof(index_t) < 4), uint32_t,
+                                        index_t>::type,
+              scalar_t>;
+
 #define COMPRESS_IMPL_SWITCH(dtype, func, dst, src, size)                     \
   switch (dtype) {                                                            \
     case BYTEPS_FLOAT16:                                                      \
       return func(reinterpret_cast<uint16_t*>(dst),                           \
                   reinterpret_cast<const half_t*>(src),                       \
                   size / sizeof(half_t));                                     \
+    case BYTEPS_BFLOAT16:                                                     \
+      return func(reinterpret_cast<uint16_t*>(dst),                           \
+                  reinterpret_cast<const bfloat16_t*>(src),                   \
+                  size / sizeof(bfloat16_t));                                 \
     case BYTEPS_FLOAT32:                                                      \
       return func(reinterpret_cast<uint32_t*>(dst),                           \
                   reinterpret_cast<const float*>(src), size / sizeof(float)); \
@@ -63,6 +82,9 @@ using kwargs_t = std::unordered_map<std::string, std::string>;
     case BYTEPS_FLOAT16:                                                    \
       return func(reinterpret_cast<half_t*>(dst),                           \
                   reinterpret_cast<const uint16_t*>(src), compressed_size); \
+    case BYTEPS_BFLOAT16:                                                   \
+      return func(reinterpret_cast<bfloat16_t*>(dst),                       \
+                  reinterpret_cast<const uint16_t*>(src), compressed_size); \
     case BYTEPS_FLOAT32:                                                    \
       return func(reinterpret_cast<float*>(dst),                            \
                   reinterpret_cast<const uint32_t*>(src), compressed_size); \
@@ -80,6 +102,10 @@ using kwargs_t = std::unordered_map<std::string, std::string>;
       return func(reinterpret_cast<half_t*>(dst),                            \
                   reinterpret_cast<half_t*>(src1),                           \
                   reinterpret_cast<const uint16_t*>(src2), compressed_size); \
+    case BYTEPS_BFLOAT16:                                                    \
+      return func(reinterpret_cast<bfloat16_t*>(dst),                        \
+                  reinterpret_cast<bfloat16_t*>(src1),                       \
+                  reinterpret_cast<const uint16_t*>(src2), compressed_size); \
     case BYTEPS_FLOAT32:                                                     \
       return func(reinterpret_cast<float*>(dst),                             \
                   reinterpret_cast<float*>(src1),                            \
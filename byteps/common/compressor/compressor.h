@@ -77,12 +77,12 @@ class Compressor {
    * \brief Decompress function
    *
    * \note For servers, decompression is not an inplace operation. The
-   * decompressed results locates in the buffer of the compressor. For workers,
-   * it is an inplace operation.
+   * decompressed results locates in the `BufferArena` of the calling thread,
+   * valid until its next use. For workers, it is an inplace operation.
    *
    * \param compressed compressed tensor.
-   * \return decompressed tensor. For servers, it is the buffer of the
-   * compressor, which contains the decompressed data. For workers, its pointer
+   * \return decompressed tensor. For servers, it is the arena of the thread,
+   * which contains the decompressed data. For workers, its pointer
    * is the same as the input's, while the size is decompressed size, which is
    * also the original size.
    */
@@ -116,7 +116,43 @@ class Compressor {
     BPS_LOG(FATAL) << "FastUpdateError is not implemented";
   };
 
+  /*!
+   * \brief sum a compressed push without decompressing it, on servers
+   *
+   * \par
+   * By default, servers decompress every push, sum them densely and compress
+   * the sum. Compressors that can sum in the compressed domain override this
+   * and `CompressSum`, e.g., topk merges the sparse pushes. Decorators like
+   * error-feedback do not, since they need the dense sum. It is optional to
+   * override.
+   *
+   * \param compressed compressed push
+   * \param first whether it is the first push of a round, which starts a new
+   * sum
+   * \return whether it is summed. If not, the caller decompresses it and sums
+   * densely, for the whole round.
+   */
+  virtual bool SumCompressed(tensor_t compressed, bool first) { return false; }
+
+  /*!
+   * \brief compressed sum of the round, the pushes given to `SumCompressed`
+   *
+   * \return compressed tensor, the same as `Compress` on the dense sum
+   * returns. it is the buffer of the compressor.
+   */
+  virtual tensor_t CompressSum() {
+    BPS_LOG(FATAL) << "CompressSum is not implemented";
+    return {};
+  }
+
  protected:
+  /*!
+   * \brief for decorators, which return the buffer of the compressor they wrap
+   * and keep none of their own
+   */
+  Compressor(size_t size, DataType dtype, std::nullptr_t)
+      : _size(size), _dtype(dtype){};
+
   /*! \brief original size */
   size_t _size;
 
@@ -38,8 +38,9 @@ tensor_t ErrorFeedback::Decompress(tensor_t compressed) {
 }
 
 void ErrorFeedback::UpdateError(tensor_t corrected, tensor_t compressed) {
-  tensor_t error{_error.get(), _size, corrected.dtype};
+  tensor_t error{_error.View(), _size, corrected.dtype};
   _cptr->FastUpdateError(error, corrected, compressed);
+  _error.Store();
 }
 
 }  // namespace compressor
@@ -17,6 +17,7 @@
 #define BYTEPS_COMPRESSOR_ERROR_FEEDBACK_H
 
 #include "../cpu_reducer.h"
+#include "buffer_arena.h"
 #include "compressor.h"
 
 namespace byteps {
@@ -49,9 +50,11 @@ namespace compressor {
 class ErrorFeedback : public Compressor {
  public:
   // error buffer should be cleared to zeros at the beginning.
-  ErrorFeedback(size_t size, DataType dtype, std::unique_ptr<Compressor> cptr)
-      : Compressor(size, dtype),
-        _error(new byte_t[size]()),
+  ErrorFeedback(size_t size, DataType dtype, std::unique_ptr<Compressor> cptr,
+                StateBuffer::Precision precision =
+                    StateBuffer::Precision::FULL)
+      : Compressor(size, dtype, nullptr),
+        _error(size, dtype, precision),
         _cpu_reducer(new CpuReducer(nullptr)),
         _cptr(std::move(cptr)) {}
   virtual ~ErrorFeedback() = default;
@@ -85,7 +88,7 @@ class ErrorFeedback : public Compressor {
 
  protected:
   /*! \brief buffer of error */
-  std::unique_ptr<byte_t[]> _error;
+  StateBuffer _error;
 
   std::unique_ptr<CpuReducer> _cpu_reducer;
 
@@ -16,6 +16,7 @@
 #include <cmath>
 #include <cstring>
 
+#include "../buffer_arena.h"
 #include "../compressor_registry.h"
 #include "dithering.h"
 
@@ -163,7 +164,7 @@ tensor_t DitheringCompressor::DecompressImpl(scalar_t* dst, const index_t* src,
 
 tensor_t DitheringCompressor::Decompress(tensor_t compressed) {
 #ifdef BYTEPS_BUILDING_SERVER
-  auto dst = _buf.get();
+  auto dst = BufferArena::Get(_size);
 #else
   auto dst = compressed.data;
 #endif
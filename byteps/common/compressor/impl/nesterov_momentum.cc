@@ -31,20 +31,24 @@ CompressorRegistry::Register reg(
       BPS_CHECK_NE(cptr, nullptr);
       // find \mu
       auto mu = HyperParamFinder<float>(kwargs, "momentum_mu");
+      auto precision = StatePrecision(kwargs, dtype);
       return std::unique_ptr<NesterovMomentumCompressor>(
-          new NesterovMomentumCompressor(size, dtype, std::move(cptr), mu));
+          new NesterovMomentumCompressor(size, dtype, std::move(cptr), mu,
+                                         precision));
     });
 }
 
 void NesterovMomentumCompressor::UpdateMom(tensor_t grad) {
   // m_t = \mu * m_{t-1} + g_t
-  this->_cpu_reducer->sum(_mom.get(), grad.data, _mom.get(), grad.size,
+  auto mom = _mom.Load();
+  this->_cpu_reducer->sum(mom, grad.data, mom, grad.size,
                           static_cast<DataType>(grad.dtype), _mu);
+  _mom.Store();
 }
 
 void NesterovMomentumCompressor::UpdateGradient(tensor_t grad) {
   // p_t = \mu m_t + g_t
-  this->_cpu_reducer->sum(grad.data, _mom.get(), grad.size,
+  this->_cpu_reducer->sum(grad.data, _mom.Load(), grad.size,
                           static_cast<DataType>(grad.dtype), _mu);
 }
 
@@ -34,9 +34,10 @@ namespace compressor {
  */
 class NesterovMomentumCompressor : public Momentum {
  public:
-  NesterovMomentumCompressor(size_t size, DataType dtype,
-                             std::unique_ptr<Compressor> cptr, float mu)
-      : Momentum(size, dtype, std::move(cptr), mu){};
+  NesterovMomentumCompressor(
+      size_t size, DataType dtype, std::unique_ptr<Compressor> cptr, float mu,
+      StateBuffer::Precision precision = StateBuffer::Precision::FULL)
+      : Momentum(size, dtype, std::move(cptr), mu, precision){};
   virtual ~NesterovMomentumCompressor() = default;
 
  protected:
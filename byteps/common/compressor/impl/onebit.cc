@@ -13,9 +13,12 @@
 // limitations under the License.
 // =============================================================================
 
+#include <cmath>
 #include <cstring>
+#include <type_traits>
 
 #include "onebit.h"
+#include "../buffer_arena.h"
 #include "../compressor_registry.h"
 
 namespace byteps {
@@ -29,6 +32,12 @@ CompressorRegistry::Register reg("onebit_compressor", [](const kwargs_t& kwargs,
       HyperParamFinder<bool>(kwargs, "compressor_onebit_scaling", true);
   return std::unique_ptr<Compressor>(new OnebitCompressor(size, dtype, scaled));
 });
+
+// float16 is computed in float
+template <typename scalar_t>
+using real_type =
+    typename std::conditional<std::is_same<scalar_t, double>::value, double,
+                              float>::type;
 }
 
 template <typename index_t, typename scalar_t>
@@ -36,34 +45,45 @@ tensor_t OnebitCompressor::CompressImpl(index_t* dst, const scalar_t* src,
                                         size_t len) {
   static_assert(sizeof(index_t) == sizeof(scalar_t),
                 "index_t should be the same size as scalar_t");
+  using real_t = real_type<scalar_t>;
   constexpr size_t PACKING_SIZE = sizeof(scalar_t) * 8;
-  size_t padding_len = (PACKING_SIZE - (len % PACKING_SIZE)) % PACKING_SIZE;
-  const size_t chunk_len = (len + padding_len) / PACKING_SIZE;
-
-  float scale = 1.0f;
-  if (_use_scale) {
-    double sum = 0.0f;
-    for (size_t i = 0; i < len; ++i) {
-      sum += std::abs(src[i]);
+  const size_t full_len = len / PACKING_SIZE;
+  const size_t chunk_len = (len + PACKING_SIZE - 1) / PACKING_SIZE;
+
+  // signs and the L1 norm in one pass, a word at a time with branch-free
+  // lanes, the first element in the most significant bit
+  double sum = 0.0;
+#pragma omp parallel for reduction(+ : sum)
+  for (size_t i = 0; i < full_len; ++i) {
+    const scalar_t* p = src + i * PACKING_SIZE;
+    index_t x = 0;
+    real_t l1 = 0;
+#pragma omp simd reduction(| : x) reduction(+ : l1)
+    for (size_t j = 0; j < PACKING_SIZE; ++j) {
+      real_t v = static_cast<real_t>(p[j]);
+      x |= static_cast<index_t>(v < 0) << (PACKING_SIZE - 1 - j);
+      l1 += std::abs(v);
     }
-    scale = sum / len;
+    dst[i] = x;
+    sum += l1;
   }
-
-#pragma omp parallel for simd
-  for (size_t i = 0; i < chunk_len; ++i) {
-    index_t x = src[i * PACKING_SIZE] < 0;
-    for (size_t j = 1; j < PACKING_SIZE; ++j) {
-      x <<= 1;
-      x |= src[i * PACKING_SIZE + j] < 0;
+  // the last word is padded with positive signs
+  if (full_len < chunk_len) {
+    index_t x = 0;
+    for (size_t j = 0; j < len - full_len * PACKING_SIZE; ++j) {
+      real_t v = static_cast<real_t>(src[full_len * PACKING_SIZE + j]);
+      x |= static_cast<index_t>(v < 0) << (PACKING_SIZE - 1 - j);
+      sum += std::abs(v);
     }
-    dst[i] = x;
+    dst[full_len] = x;
   }
 
+  float scale = _use_scale ? sum / len : 1.0f;
   float* p_scale = reinterpret_cast<float*>(&dst[chunk_len]);
   *p_scale = scale;
 
   return {dst, chunk_len * sizeof(index_t) + sizeof(float)};
-}  // namespace compressor
+}
 
 tensor_t OnebitCompressor::Compress(tensor_t grad) {
   COMPRESS_IMPL_SWITCH(grad.dtype, CompressImpl, _buf.get(), grad.data,
@@ -77,32 +97,40 @@ tensor_t OnebitCompressor::DecompressImpl(scalar_t* dst, const index_t* src,
                 "scalar_t should be the same size as index_t");
   constexpr size_t PACKING_SIZE = sizeof(index_t) * 8;
   const size_t chunk_len = (compressed_size - sizeof(float)) / sizeof(index_t);
+  const size_t len = _size / sizeof(scalar_t);
+  const size_t full_len = len / PACKING_SIZE;
 
   auto* pf = reinterpret_cast<const float*>(src + chunk_len);
-  float scale = *pf;
+  const scalar_t pos = static_cast<scalar_t>(*pf);
+  const scalar_t neg = static_cast<scalar_t>(-*pf);
 
-  index_t* ptr = const_cast<index_t*>(src);
+  const index_t* ptr = src;
   if ((void*)dst == (void*)src) {
-    ptr = reinterpret_cast<index_t*>(_buf.get());
-    std::memcpy(ptr, src, compressed_size);
+    auto buf = reinterpret_cast<index_t*>(_buf.get());
+    std::memcpy(buf, src, compressed_size);
+    ptr = buf;
   }
 
-#pragma omp parallel for simd
-  for (int i = chunk_len - 1; i >= 0; --i) {
-    index_t x = ptr[i];
-    for (int j = PACKING_SIZE - 1; j >= 0; --j) {
-      int sign = 1 - ((x & 0x01) << 1);
-      dst[i * PACKING_SIZE + j] = sign * scale;
-      x >>= 1;
+#pragma omp parallel for
+  for (size_t i = 0; i < full_len; ++i) {
+    const index_t x = ptr[i];
+    scalar_t* out = dst + i * PACKING_SIZE;
+#pragma omp simd
+    for (size_t j = 0; j < PACKING_SIZE; ++j) {
+      out[j] = ((x >> (PACKING_SIZE - 1 - j)) & 1) ? neg : pos;
     }
   }
+  for (size_t j = 0; j < len - full_len * PACKING_SIZE; ++j) {
+    dst[full_len * PACKING_SIZE + j] =
+        ((ptr[full_len] >> (PACKING_SIZE - 1 - j)) & 1) ? neg : pos;
+  }
 
   return {dst, _size};
 }
 
 tensor_t OnebitCompressor::Decompress(tensor_t compressed) {
 #ifdef BYTEPS_BUILDING_SERVER
-  auto dst = _buf.get();
+  auto dst = BufferArena::Get(_size);
 #else
   auto dst = compressed.data;
 #endif
@@ -114,21 +142,20 @@ template <typename scalar_t, typename index_t>
 void OnebitCompressor::FastUpdateErrorImpl(scalar_t* error, scalar_t* corrected,
                                            const index_t* compressed,
                                            size_t compressed_size) {
-  constexpr size_t PACKING_SIZE = sizeof(index_t) * 8;
+  using real_t = real_type<scalar_t>;
   const size_t chunk_len = (compressed_size - sizeof(float)) / sizeof(index_t);
+  const size_t len = _size / sizeof(scalar_t);
 
   auto* pf = reinterpret_cast<const float*>(compressed + chunk_len);
-  float scale = *pf;
+  const real_t scale = *pf;
 
+  // error = corrected - Decompress(compressed), where the signs are those of
+  // corrected, so the bits need not be unpacked
 #pragma omp parallel for simd
-  for (int i = chunk_len - 1; i >= 0; --i) {
-    index_t x = compressed[i];
-    for (int j = PACKING_SIZE - 1; j >= 0; --j) {
-      int sign = ((x & 0x01) << 1) - 1;
-      error[i * PACKING_SIZE + j] =
-          corrected[i * PACKING_SIZE + j] + sign * scale;
-      x >>= 1;
-    }
+  for (size_t i = 0; i < len; ++i) {
+    real_t v = static_cast<real_t>(corrected[i]);
+    real_t decompressed = scale * (1 - 2 * static_cast<int>(v < 0));
+    error[i] = static_cast<scalar_t>(v - decompressed);
   }
 }
 
@@ -138,6 +165,77 @@ void OnebitCompressor::FastUpdateError(tensor_t error, tensor_t corrected,
                                 corrected.data, compressed.data,
                                 compressed.size);
 }
+
+bool OnebitCompressor::SumCompressed(tensor_t compressed, bool first) {
+  if (first) {
+    _pushes.clear();
+    _num_pushes = 0;
+  }
+  _pushes.insert(_pushes.end(), compressed.data,
+                 compressed.data + compressed.size);
+  ++_num_pushes;
+  return true;
+}
+
+tensor_t OnebitCompressor::CompressSum() {
+  COMPRESS_IMPL_SWITCH(_dtype, CompressSumImpl, _buf.get(), _pushes.data(),
+                       _size);
+}
+
+template <typename index_t, typename scalar_t>
+tensor_t OnebitCompressor::CompressSumImpl(index_t* dst,
+                                           const scalar_t* pushes,
+                                           size_t len) {
+  static_assert(sizeof(index_t) == sizeof(scalar_t),
+                "index_t should be the same size as scalar_t");
+  using real_t = real_type<scalar_t>;
+  constexpr size_t PACKING_SIZE = sizeof(scalar_t) * 8;
+  const size_t chunk_len = (len + PACKING_SIZE - 1) / PACKING_SIZE;
+  const size_t push_size = chunk_len * sizeof(index_t) + sizeof(float);
+  BPS_CHECK_EQ(_pushes.size(), push_size * _num_pushes);
+
+  auto base = reinterpret_cast<const byte_t*>(pushes);
+  std::vector<const index_t*> bits(_num_pushes);
+  std::vector<real_t> scales(_num_pushes);
+  for (size_t w = 0; w < _num_pushes; ++w) {
+    bits[w] = reinterpret_cast<const index_t*>(base + w * push_size);
+    scales[w] = *reinterpret_cast<const float*>(bits[w] + chunk_len);
+  }
+
+  // a word at a time: the weighted votes of its entries, in the order of the
+  // pushes like the dense sum, then their signs and the L1 norm
+  double sum = 0.0;
+#pragma omp parallel for reduction(+ : sum)
+  for (size_t i = 0; i < chunk_len; ++i) {
+    real_t votes[PACKING_SIZE] = {};
+    for (size_t w = 0; w < _num_pushes; ++w) {
+      const index_t x = bits[w][i];
+      const real_t pos = scales[w], neg = -scales[w];
+#pragma omp simd
+      for (size_t j = 0; j < PACKING_SIZE; ++j) {
+        votes[j] += ((x >> (PACKING_SIZE - 1 - j)) & 1) ? neg : pos;
+      }
+    }
+    // the padding of the last word is not summed
+    const size_t valid = std::min(PACKING_SIZE, len - i * PACKING_SIZE);
+    index_t x = 0;
+    real_t l1 = 0;
+#pragma omp simd reduction(| : x) reduction(+ : l1)
+    for (size_t j = 0; j < PACKING_SIZE; ++j) {
+      x |= static_cast<index_t>(votes[j] < 0 && j < valid)
+           << (PACKING_SIZE - 1 - j);
+      l1 += j < valid ? std::abs(votes[j]) : 0;
+    }
+    dst[i] = x;
+    sum += l1;
+  }
+
+  float scale = _use_scale ? sum / len : 1.0f;
+  float* p_scale = reinterpret_cast<float*>(&dst[chunk_len]);
+  *p_scale = scale;
+
+  return {dst, chunk_len * sizeof(index_t) + sizeof(float)};
+}
 }  // namespace compressor
 }  // namespace common
 }  // namespace byteps
\ No newline at end of file
@@ -16,6 +16,8 @@
 #ifndef BYTEPS_COMPRESSOR_IMPL_ONEBIT_H
 #define BYTEPS_COMPRESSOR_IMPL_ONEBIT_H
 
+#include <vector>
+
 #include "../compressor.h"
 
 namespace byteps {
@@ -35,6 +37,9 @@ namespace compressor {
  *    sign(\sum_i c_i)
  *
  * \note 0 represents positive and 1 represents negative.
+ *
+ * On servers, the packed pushes are kept and voted in one pass: each entry of
+ * the sum is the sum of the signs weighted by the scales, packed right away.
  */
 class OnebitCompressor : public Compressor {
  public:
@@ -46,7 +51,8 @@ class OnebitCompressor : public Compressor {
    * \brief Compress function
    *
    * compress and pack into byte array.
-   * each bit represents a sign.
+   * each bit represents a sign. the signs and the scale are computed in the
+   * same pass.
    *
    * \param grad gradient tensor
    * \param compressed compressed tensor
@@ -66,6 +72,9 @@ class OnebitCompressor : public Compressor {
   /*!
    * \brief help function for error feedback `UpdateError`
    *
+   * the signs are taken from `corrected`, so it is read once and the bits are
+   * not unpacked.
+   *
    * \param corrected gradient corrected with error
    * \param error error
    * \param compressed compressed gradient
@@ -73,6 +82,16 @@ class OnebitCompressor : public Compressor {
   void FastUpdateError(tensor_t error, tensor_t corrected,
                        tensor_t compressed) override;
 
+  /*!
+   * \brief keep the packed signs and the scale of a push
+   */
+  bool SumCompressed(tensor_t compressed, bool first) override;
+
+  /*!
+   * \brief vote the kept pushes and pack the signs of the sum
+   */
+  tensor_t CompressSum() override;
+
  private:
   template <typename index_t, typename scalar_t>
   tensor_t CompressImpl(index_t* dst, const scalar_t* src, size_t len);
@@ -85,8 +104,15 @@ class OnebitCompressor : public Compressor {
   void FastUpdateErrorImpl(scalar_t* error, scalar_t* corrected,
                            const index_t* compressed, size_t compressed_size);
 
+  template <typename index_t, typename scalar_t>
+  tensor_t CompressSumImpl(index_t* dst, const scalar_t* pushes, size_t len);
+
  private:
   bool _use_scale;
+
+  // the pushes of a round on servers, back to back
+  std::vector<byte_t> _pushes;
+  size_t _num_pushes = 0;
 };
 }  // namespace compressor
 }  // namespace common
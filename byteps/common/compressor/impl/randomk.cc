@@ -15,6 +15,7 @@
 
 #include <cstring>
 
+#include "../buffer_arena.h"
 #include "../compressor_registry.h"
 #include "randomk.h"
 
@@ -38,19 +39,64 @@ CompressorRegistry::Register reg(
 
       auto seed = HyperParamFinder<unsigned>(kwargs, "seed", true,
                                              [](unsigned x) { return x != 0; });
+      auto shared_seed = HyperParamFinder<bool>(
+          kwargs, "compressor_randomk_shared_seed", true);
+      BPS_CHECK(!shared_seed || seed != 0)
+          << "compressor_randomk_shared_seed needs the same seed on all "
+             "workers, please set seed";
 
       return std::unique_ptr<Compressor>(
-          new RandomkCompressor(size, dtype, k, seed));
+          new RandomkCompressor(size, dtype, k, seed, shared_seed));
     });
+
+// splitmix64 of the seed and the step, never 0
+uint64_t StepSeed(uint64_t seed, uint64_t step) {
+  uint64_t z = seed + (step + 1) * 0x9E3779B97F4A7C15ULL;
+  z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+  z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+  z ^= z >> 31;
+  return z ? z : 1;
+}
+}
+
+void RandomkCompressor::GenerateIndices(uint64_t seed, size_t len) {
+  if (seed == _indices_seed) return;
+  _rng.set_seed(seed);
+  _indices.resize(this->_k);
+  for (auto& index : _indices) index = _rng.Randint(0, len);
+  _indices_seed = seed;
+}
+
+uint64_t RandomkCompressor::PayloadSeed(const void* compressed,
+                                        size_t compressed_size) const {
+  uint64_t seed;
+  std::memcpy(&seed,
+              reinterpret_cast<const char*>(compressed) + compressed_size -
+                  sizeof(seed),
+              sizeof(seed));
+  return seed;
 }
 
 template <typename index_t, typename scalar_t>
 tensor_t RandomkCompressor::CompressImpl(index_t* dst, const scalar_t* src,
                                          size_t len) {
-  static_assert(sizeof(index_t) == sizeof(scalar_t),
-                "index_t should be the same size as scalar_t");
-  BPS_CHECK_LE(this->_k, len / 2);
-  using pair_t = std::pair<index_t, scalar_t>;
+  if (_shared_seed) {
+    BPS_CHECK_LE(this->_k, len / 2);
+    uint64_t seed = _indices_seed != _compressed_seed
+                        ? _indices_seed
+                        : StepSeed(_seed, _step++);
+    GenerateIndices(seed, len);
+    _compressed_seed = seed;
+    auto values = reinterpret_cast<scalar_t*>(dst);
+    for (size_t i = 0; i < this->_k; ++i) {
+      values[i] = src[_indices[i]];
+    }
+    std::memcpy(values + this->_k, &seed, sizeof(seed));
+    return {dst, this->_k * sizeof(scalar_t) + sizeof(seed)};
+  }
+
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
+  BPS_CHECK_LE(this->_k * sizeof(pair_t), len * sizeof(scalar_t));
   auto ptr = reinterpret_cast<pair_t*>(dst);
 
   for (size_t i = 0; i < this->_k; ++i) {
@@ -69,9 +115,23 @@ tensor_t RandomkCompressor::Compress(tensor_t grad) {
 template <typename index_t, typename scalar_t>
 tensor_t RandomkCompressor::DecompressImpl(scalar_t* dst, const index_t* src,
                                            size_t compressed_size) {
-  static_assert(sizeof(index_t) == sizeof(scalar_t),
-                "index_t should be the same size as scalar_t");
-  using pair_t = std::pair<index_t, scalar_t>;
+  if (_shared_seed) {
+    GenerateIndices(PayloadSeed(src, compressed_size),
+                    _size / sizeof(scalar_t));
+    auto values = reinterpret_cast<const scalar_t*>(src);
+    if ((void*)dst == (void*)src) {
+      auto buf = reinterpret_cast<scalar_t*>(_buf.get());
+      std::memcpy(buf, values, this->_k * sizeof(scalar_t));
+      values = buf;
+    }
+    std::memset(dst, 0, _size);
+    for (size_t i = 0; i < this->_k; ++i) {
+      dst[_indices[i]] = values[i];
+    }
+    return {dst, _size};
+  }
+
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
 
   auto ptr = reinterpret_cast<const pair_t*>(src);
   if ((void*)dst == (void*)src) {
@@ -93,7 +153,7 @@ tensor_t RandomkCompressor::DecompressImpl(scalar_t* dst, const index_t* src,
 
 tensor_t RandomkCompressor::Decompress(tensor_t compressed) {
 #ifdef BYTEPS_BUILDING_SERVER
-  auto dst = _buf.get();
+  auto dst = BufferArena::Get(_size);
 #else
   auto dst = compressed.data;
 #endif
@@ -106,12 +166,15 @@ void RandomkCompressor::FastUpdateErrorImpl(scalar_t* error,
                                             scalar_t* corrected,
                                             const index_t* compressed,
                                             size_t compressed_size) {
-  static_assert(sizeof(index_t) == sizeof(scalar_t),
-                "index_t should be the same size as scalar_t");
-  using pair_t = std::pair<index_t, scalar_t>;
-
   std::memcpy(error, corrected, _size);
+  if (_shared_seed) {
+    GenerateIndices(PayloadSeed(compressed, compressed_size),
+                    _size / sizeof(scalar_t));
+    for (auto index : _indices) error[index] = 0;
+    return;
+  }
 
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
   auto ptr = reinterpret_cast<const pair_t*>(compressed);
   for (size_t i = 0; i < this->_k; ++i) {
     auto& pair = ptr[i];
@@ -125,6 +188,40 @@ void RandomkCompressor::FastUpdateError(tensor_t error, tensor_t corrected,
                                 corrected.data, compressed.data,
                                 compressed.size);
 }
+
+bool RandomkCompressor::SumCompressed(tensor_t compressed, bool first) {
+  if (!_shared_seed) return false;
+  if (first) {
+    _value_sum.assign(compressed.data, compressed.data + compressed.size);
+    return true;
+  }
+  BPS_CHECK_EQ(_value_sum.size(), compressed.size);
+  BPS_CHECK_EQ(PayloadSeed(_value_sum.data(), _value_sum.size()),
+               PayloadSeed(compressed.data, compressed.size))
+      << "the workers are not at the same step";
+  AddValues(compressed);
+  return true;
+}
+
+tensor_t RandomkCompressor::AddValues(tensor_t compressed) {
+  DECOMPRESS_IMPL_SWITCH(_dtype, AddValuesImpl, _value_sum.data(),
+                         compressed.data, compressed.size);
+}
+
+template <typename index_t, typename scalar_t>
+tensor_t RandomkCompressor::AddValuesImpl(scalar_t* sum, const index_t* src,
+                                          size_t compressed_size) {
+  auto values = reinterpret_cast<const scalar_t*>(src);
+  for (size_t i = 0; i < this->_k; ++i) {
+    sum[i] += values[i];
+  }
+  return {sum, compressed_size};
+}
+
+tensor_t RandomkCompressor::CompressSum() {
+  std::memcpy(_buf.get(), _value_sum.data(), _value_sum.size());
+  return {_buf.get(), _value_sum.size()};
+}
 }  // namespace compressor
 }  // namespace common
 }  // namespace byteps
\ No newline at end of file
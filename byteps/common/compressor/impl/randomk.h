@@ -17,6 +17,7 @@
 #define BYTEPS_COMPRESSOR_IMPL_RANDOMK_H
 
 #include <random>
+#include <vector>
 
 #include "../compressor.h"
 #include "../utils.h"
@@ -35,11 +36,20 @@ namespace compressor {
  *
  * \note it is a stochastic algorithm. If you want to have deterministic
  * behavior, please set a seed in the configurations.
+ *
+ * \par
+ * With a shared seed, the k indices of a step are drawn from a seed derived
+ * from the configured seed and the step, which is the same on all workers and
+ * is sent after the k values instead of the indices. The server and the
+ * workers draw the same indices from it, which halves the traffic. It needs
+ * synchronous training, where every worker compresses each key once per step.
+ * Servers then sum the values of the pushes as they are.
  */
 class RandomkCompressor : public Compressor {
  public:
-  RandomkCompressor(size_t size, DataType dtype, unsigned int k, unsigned int seed = 0)
-      : Compressor(size, dtype), _k(k) {
+  RandomkCompressor(size_t size, DataType dtype, unsigned int k,
+                    unsigned int seed = 0, bool shared_seed = false)
+      : Compressor(size, dtype), _k(k), _seed(seed), _shared_seed(shared_seed) {
     if (seed != 0) {
       BPS_LOG(INFO) << "SET SEED = " << seed;
       _rng.set_seed(seed);
@@ -50,7 +60,8 @@ class RandomkCompressor : public Compressor {
   /*!
    * \brief Compress function
    *
-   * randomly select k entries and corresponding indices
+   * randomly select k entries and corresponding indices, or only the entries
+   * and the seed of the indices with a shared seed
    *
    * \param grad gradient tensor
    * \param compressed compressed tensor
@@ -80,6 +91,16 @@ class RandomkCompressor : public Compressor {
   void FastUpdateError(tensor_t error, tensor_t corrected,
                        tensor_t compressed) override;
 
+  /*!
+   * \brief sum the values of a push, with a shared seed only
+   */
+  bool SumCompressed(tensor_t compressed, bool first) override;
+
+  /*!
+   * \brief the summed values and their seed
+   */
+  tensor_t CompressSum() override;
+
  private:
   template <typename index_t, typename scalar_t>
   tensor_t CompressImpl(index_t* dst, const scalar_t* src, size_t len);
@@ -92,10 +113,34 @@ class RandomkCompressor : public Compressor {
   void FastUpdateErrorImpl(scalar_t* error, scalar_t* corrected,
                            const index_t* compressed, size_t compressed_size);
 
+  // draws the indices of `seed` into _indices, unless they are there
+  void GenerateIndices(uint64_t seed, size_t len);
+
+  tensor_t AddValues(tensor_t compressed);
+
+  template <typename index_t, typename scalar_t>
+  tensor_t AddValuesImpl(scalar_t* sum, const index_t* src,
+                         size_t compressed_size);
+
+  // the seed of the indices of a shared-seed payload
+  uint64_t PayloadSeed(const void* compressed, size_t compressed_size) const;
+
  private:
   unsigned int _k;
+  unsigned int _seed;
   std::random_device _rd;
   XorShift128PlusBitShifterRNG _rng;
+
+  bool _shared_seed;
+  // the step of the next Compress on a worker
+  uint64_t _step = 0;
+  // the seed of _indices, and of the last Compress. On a server, a Compress
+  // follows the Decompress of the pushes of the step, and reuses their seed.
+  uint64_t _indices_seed = 0;
+  uint64_t _compressed_seed = 0;
+  std::vector<size_t> _indices;
+  // the sum of the pushes of a round on servers, in the same format
+  std::vector<byte_t> _value_sum;
 };
 }  // namespace compressor
 }  // namespace common
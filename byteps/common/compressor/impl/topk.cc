@@ -13,9 +13,14 @@
 // limitations under the License.
 // =============================================================================
 
+#include <algorithm>
+#include <cstdlib>
 #include <cstring>
 #include <queue>
+#include <type_traits>
+#include <vector>
 
+#include "../buffer_arena.h"
 #include "../compressor_registry.h"
 #include "topk.h"
 
@@ -36,17 +41,101 @@ CompressorRegistry::Register reg(
       } else {
         k = static_cast<unsigned>(factor);
       }
-      return std::unique_ptr<Compressor>(new TopkCompressor(size, dtype, k));
+      auto select =
+          HyperParamFinder<bool>(kwargs, "compressor_topk_select", true);
+      int num_threads = 4;
+      if (getenv("BYTEPS_OMP_THREAD_PER_GPU")) {
+        num_threads = std::max(1, atoi(getenv("BYTEPS_OMP_THREAD_PER_GPU")));
+      }
+      return std::unique_ptr<Compressor>(
+          new TopkCompressor(size, dtype, k, select, num_threads));
     });
+
+// smaller partitions are not worth sampling
+constexpr size_t kSelectMinLen = 1 << 15;
+constexpr size_t kSelectSamples = 4096;
+// for fewer candidates than 1/256 of the entries, the heap stays small and
+// mostly rejects at its top, which beats the parallel filter (select took
+// 0.7x the speed of the heap at k = 0.1% of 1M float32 entries)
+constexpr size_t kSelectMinRatio = 256;
 }
 
 template <typename index_t, typename scalar_t>
 tensor_t TopkCompressor::CompressImpl(index_t* dst, const scalar_t* src,
                                       size_t len) {
-  static_assert(sizeof(index_t) == sizeof(scalar_t),
-                "index_t should be the same size as scalar_t");
-  BPS_CHECK_LE(this->_k, len / 2);
-  using pair_t = std::pair<index_t, scalar_t>;
+  if (_select) return SelectCompressImpl(dst, src, len);
+  return HeapCompressImpl(dst, src, len);
+}
+
+template <typename index_t, typename scalar_t>
+tensor_t TopkCompressor::SelectCompressImpl(index_t* dst, const scalar_t* src,
+                                            size_t len) {
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
+  // the pairs that fit in the buffer of the dense values
+  size_t max_pairs = len * sizeof(scalar_t) / sizeof(pair_t);
+  BPS_CHECK_LE(this->_k, max_pairs);
+  using mag_t = typename std::conditional<std::is_same<scalar_t, double>::value,
+                                          double, float>::type;
+  auto mag = [](scalar_t x) { return std::abs(static_cast<mag_t>(x)); };
+
+  // gather about twice k candidates, so that a rough estimate still has k
+  size_t want = 2 * static_cast<size_t>(this->_k) + 64;
+  if (len < kSelectMinLen || want > max_pairs / 2 ||
+      want < len / kSelectMinRatio) {
+    return HeapCompressImpl(dst, src, len);
+  }
+
+  // estimate the magnitude of the want-th largest entry from a strided sample
+  size_t num_samples = std::min(len, kSelectSamples);
+  std::vector<mag_t> samples(num_samples);
+  for (size_t j = 0; j < num_samples; ++j) {
+    samples[j] = mag(src[j * len / num_samples]);
+  }
+  size_t rank = std::max<size_t>(1, (want * num_samples + len - 1) / len);
+  std::nth_element(samples.begin(), samples.begin() + rank - 1, samples.end(),
+                   std::greater<mag_t>());
+  mag_t threshold = samples[rank - 1];
+
+  // count the candidates of each chunk, then write them in order, in parallel
+  size_t num_chunks = _num_threads;
+  size_t chunk = (len + num_chunks - 1) / num_chunks;
+  std::vector<size_t> offsets(num_chunks + 1, 0);
+#pragma omp parallel for num_threads(_num_threads) schedule(static)
+  for (size_t c = 0; c < num_chunks; ++c) {
+    size_t end = std::min(len, (c + 1) * chunk);
+    size_t n = 0;
+    for (size_t i = c * chunk; i < end; ++i) n += (mag(src[i]) >= threshold);
+    offsets[c + 1] = n;
+  }
+  for (size_t c = 0; c < num_chunks; ++c) offsets[c + 1] += offsets[c];
+  size_t total = offsets[num_chunks];
+  // a bad estimate, either too few candidates or more than dst holds
+  if (total < this->_k || total > max_pairs) {
+    return HeapCompressImpl(dst, src, len);
+  }
+
+  auto beg = reinterpret_cast<pair_t*>(dst);
+#pragma omp parallel for num_threads(_num_threads) schedule(static)
+  for (size_t c = 0; c < num_chunks; ++c) {
+    size_t end = std::min(len, (c + 1) * chunk);
+    auto out = beg + offsets[c];
+    for (size_t i = c * chunk; i < end; ++i) {
+      if (mag(src[i]) >= threshold) *out++ = std::make_pair(i, src[i]);
+    }
+  }
+  std::nth_element(beg, beg + this->_k - 1, beg + total,
+                   [&mag](const pair_t& lhs, const pair_t& rhs) {
+                     return mag(lhs.second) > mag(rhs.second);
+                   });
+
+  return {dst, this->_k * sizeof(pair_t)};
+}
+
+template <typename index_t, typename scalar_t>
+tensor_t TopkCompressor::HeapCompressImpl(index_t* dst, const scalar_t* src,
+                                          size_t len) {
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
+  BPS_CHECK_LE(this->_k * sizeof(pair_t), len * sizeof(scalar_t));
   auto comp = [](const pair_t& lhs, const pair_t& rhs) {
     return std::abs(lhs.second) > std::abs(rhs.second);
   };
@@ -80,9 +169,7 @@ tensor_t TopkCompressor::Compress(tensor_t grad) {
 template <typename index_t, typename scalar_t>
 tensor_t TopkCompressor::DecompressImpl(scalar_t* dst, const index_t* src,
                                         size_t compressed_size) {
-  static_assert(sizeof(index_t) == sizeof(scalar_t),
-                "index_t should be the same size as scalar_t");
-  using pair_t = std::pair<index_t, scalar_t>;
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
 
   auto ptr = reinterpret_cast<const pair_t*>(src);
   if ((void*)dst == (void*)src) {
@@ -104,7 +191,7 @@ tensor_t TopkCompressor::DecompressImpl(scalar_t* dst, const index_t* src,
 
 tensor_t TopkCompressor::Decompress(tensor_t compressed) {
 #ifdef BYTEPS_BUILDING_SERVER
-  auto dst = _buf.get();
+  auto dst = BufferArena::Get(_size);
 #else
   auto dst = compressed.data;
 #endif
@@ -116,9 +203,7 @@ template <typename index_t, typename scalar_t>
 void TopkCompressor::FastUpdateErrorImpl(scalar_t* error, scalar_t* corrected,
                                          const index_t* compressed,
                                          size_t compressed_size) {
-  static_assert(sizeof(index_t) == sizeof(scalar_t),
-                "index_t should be the same size as scalar_t");
-  using pair_t = std::pair<index_t, scalar_t>;
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
 
   std::memcpy(error, corrected, _size);
 
@@ -135,6 +220,76 @@ void TopkCompressor::FastUpdateError(tensor_t error, tensor_t corrected,
                                 corrected.data, compressed.data,
                                 compressed.size);
 }
+
+bool TopkCompressor::SumCompressed(tensor_t compressed, bool first) {
+  if (!_sum) {
+    _sum.reset(new byte_t[_size]);
+    _touched_mask.assign(_size / getDataTypeLength(_dtype), 0);
+  }
+  if (first) {
+    for (auto index : _touched) _touched_mask[index] = 0;
+    _touched.clear();
+  }
+  AddCompressed(compressed);
+  return true;
+}
+
+tensor_t TopkCompressor::AddCompressed(tensor_t compressed) {
+  DECOMPRESS_IMPL_SWITCH(_dtype, AddCompressedImpl, _sum.get(),
+                         compressed.data, compressed.size);
+}
+
+template <typename index_t, typename scalar_t>
+tensor_t TopkCompressor::AddCompressedImpl(scalar_t* sum, const index_t* src,
+                                           size_t compressed_size) {
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
+
+  auto ptr = reinterpret_cast<const pair_t*>(src);
+  size_t len = compressed_size / sizeof(pair_t);
+  for (size_t i = 0; i < len; ++i) {
+    auto& pair = ptr[i];
+    if (_touched_mask[pair.first]) {
+      sum[pair.first] += pair.second;
+    } else {
+      _touched_mask[pair.first] = 1;
+      _touched.push_back(pair.first);
+      sum[pair.first] = pair.second;
+    }
+  }
+
+  return {sum, _size};
+}
+
+tensor_t TopkCompressor::CompressSum() {
+  COMPRESS_IMPL_SWITCH(_dtype, CompressSumImpl, _buf.get(), _sum.get(), _size);
+}
+
+template <typename index_t, typename scalar_t>
+tensor_t TopkCompressor::CompressSumImpl(index_t* dst, const scalar_t* sum,
+                                         size_t len) {
+  using pair_t = sparse_pair_t<index_t, scalar_t>;
+  BPS_CHECK_LE(this->_k * sizeof(pair_t), len * sizeof(scalar_t));
+
+  // the untouched entries are zeros, so the topk of the touched ones is that
+  // of the dense sum
+  size_t n = std::min<size_t>(this->_k, _touched.size());
+  if (_touched.size() > this->_k) {
+    std::nth_element(_touched.begin(), _touched.begin() + this->_k - 1,
+                     _touched.end(), [sum](uint32_t lhs, uint32_t rhs) {
+                       return std::abs(sum[lhs]) > std::abs(sum[rhs]);
+                     });
+  }
+  auto beg = reinterpret_cast<pair_t*>(dst);
+  for (size_t i = 0; i < n; ++i) {
+    beg[i] = std::make_pair(_touched[i], sum[_touched[i]]);
+  }
+  // fewer than k were touched, fill up with zeros like the dense sum has
+  for (size_t i = 0; n < this->_k; ++i) {
+    if (!_touched_mask[i]) beg[n++] = std::make_pair(i, scalar_t(0));
+  }
+
+  return {dst, this->_k * sizeof(pair_t)};
+}
 }  // namespace compressor
 }  // namespace common
 }  // namespace byteps
\ No newline at end of file
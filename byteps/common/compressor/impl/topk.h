@@ -16,6 +16,8 @@
 #ifndef BYTEPS_COMPRESSOR_IMPL_TOPK_H
 #define BYTEPS_COMPRESSOR_IMPL_TOPK_H
 
+#include <vector>
+
 #include "../compressor.h"
 
 namespace byteps {
@@ -30,11 +32,22 @@ namespace compressor {
  *
  * sending the most significant entries of the stochastic gradient
  *
+ * By default the entries are selected with a heap of size k. With `select`
+ * on, the k-th largest magnitude is estimated from a sample, the entries
+ * above it are gathered in parallel, and the top k of those are selected
+ * with nth_element. Both give k (index, value) pairs in no particular order.
+ *
+ * On servers, the pushes are merged as sparse lists, and the top k of the
+ * entries they touched are selected, without a dense buffer per push.
  */
 class TopkCompressor : public Compressor {
  public:
-  TopkCompressor(size_t size, DataType dtype, unsigned int k)
-      : Compressor(size, dtype), _k(k){};
+  TopkCompressor(size_t size, DataType dtype, unsigned int k,
+                 bool select = false, int num_threads = 1)
+      : Compressor(size, dtype),
+        _k(k),
+        _select(select),
+        _num_threads(num_threads){};
   virtual ~TopkCompressor() = default;
 
   /*!
@@ -72,10 +85,26 @@ class TopkCompressor : public Compressor {
   void FastUpdateError(tensor_t error, tensor_t corrected,
                        tensor_t compressed) override;
 
+  /*!
+   * \brief sum the (index, value) pairs of a push into the touched entries
+   */
+  bool SumCompressed(tensor_t compressed, bool first) override;
+
+  /*!
+   * \brief select the topk of the touched entries
+   */
+  tensor_t CompressSum() override;
+
  private:
   template <typename index_t, typename scalar_t>
   tensor_t CompressImpl(index_t* dst, const scalar_t* src, size_t len);
 
+  template <typename index_t, typename scalar_t>
+  tensor_t HeapCompressImpl(index_t* dst, const scalar_t* src, size_t len);
+
+  template <typename index_t, typename scalar_t>
+  tensor_t SelectCompressImpl(index_t* dst, const scalar_t* src, size_t len);
+
   template <typename index_t, typename scalar_t>
   tensor_t DecompressImpl(scalar_t* dst, const index_t* src,
                           size_t compressed_size);
@@ -84,8 +113,25 @@ class TopkCompressor : public Compressor {
   void FastUpdateErrorImpl(scalar_t* error, scalar_t* corrected,
                            const index_t* compressed, size_t compressed_size);
 
+  tensor_t AddCompressed(tensor_t compressed);
+
+  template <typename index_t, typename scalar_t>
+  tensor_t AddCompressedImpl(scalar_t* sum, const index_t* src,
+                             size_t compressed_size);
+
+  template <typename index_t, typename scalar_t>
+  tensor_t CompressSumImpl(index_t* dst, const scalar_t* sum, size_t len);
+
  private:
   unsigned int _k;
+  bool _select;
+  int _num_threads;
+
+  // the sum of the pushes of a round on servers, valid at the touched
+  // entries, which are listed and marked
+  std::unique_ptr<byte_t[]> _sum;
+  std::vector<uint32_t> _touched;
+  std::vector<uint8_t> _touched_mask;
 };
 }  // namespace compressor
 }  // namespace common
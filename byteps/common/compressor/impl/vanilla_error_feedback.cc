@@ -34,14 +34,17 @@ CompressorRegistry::Register reg(
       kwargs_clone.erase("ef_type");
       auto cptr = CompressorRegistry::Create(kwargs_clone, size, dtype);
       BPS_CHECK_NE(cptr, nullptr);
+      auto precision = StatePrecision(kwargs, dtype);
       return std::unique_ptr<VanillaErrorFeedbackCompressor>(
-          new VanillaErrorFeedbackCompressor(size, dtype, std::move(cptr)));
+          new VanillaErrorFeedbackCompressor(size, dtype, std::move(cptr),
+                                             precision));
     });
 }
 
 VanillaErrorFeedbackCompressor::VanillaErrorFeedbackCompressor(
-    size_t size, DataType dtype, std::unique_ptr<Compressor> cptr)
-    : ErrorFeedback(size, dtype, std::move(cptr)) {
+    size_t size, DataType dtype, std::unique_ptr<Compressor> cptr,
+    StateBuffer::Precision precision)
+    : ErrorFeedback(size, dtype, std::move(cptr), precision) {
   _fd = open("lr.s", O_RDONLY);
   BPS_CHECK(_fd > 0) << "open lr.s failed, errno=" << strerror(errno);
   void* ptr = mmap(0, 8, PROT_READ, MAP_SHARED, _fd, 0);
@@ -57,7 +60,7 @@ VanillaErrorFeedbackCompressor::~VanillaErrorFeedbackCompressor() {
 
 void VanillaErrorFeedbackCompressor::UpdateGradient(tensor_t grad) {
   _cur_lr = *reinterpret_cast<double*>(_mm);
-  this->_cpu_reducer->sum(grad.data, _error.get(), grad.size,
+  this->_cpu_reducer->sum(grad.data, _error.Load(), grad.size,
                           static_cast<DataType>(grad.dtype),
                           (_pre_lr / _cur_lr));
   _pre_lr = _cur_lr;
@@ -43,8 +43,9 @@ namespace compressor {
  */
 class VanillaErrorFeedbackCompressor : public ErrorFeedback {
  public:
-  VanillaErrorFeedbackCompressor(size_t size, DataType dtype,
-                                 std::unique_ptr<Compressor> cptr);
+  VanillaErrorFeedbackCompressor(
+      size_t size, DataType dtype, std::unique_ptr<Compressor> cptr,
+      StateBuffer::Precision precision = StateBuffer::Precision::FULL);
   virtual ~VanillaErrorFeedbackCompressor();
 
  protected:
@@ -17,6 +17,7 @@
 #define BYTEPS_COMPRESSOR_MOMENTUM_H
 
 #include "../cpu_reducer.h"
+#include "buffer_arena.h"
 #include "compressor.h"
 
 namespace byteps {
@@ -44,9 +45,10 @@ class Momentum : public Compressor {
  public:
   // momentum should be cleared to zeros
   Momentum(size_t size, DataType dtype, std::unique_ptr<Compressor> cptr,
-           float mu)
-      : Compressor(size, dtype),
-        _mom(new byte_t[size]()),
+           float mu,
+           StateBuffer::Precision precision = StateBuffer::Precision::FULL)
+      : Compressor(size, dtype, nullptr),
+        _mom(size, dtype, precision),
         _mu(mu),
         _cpu_reducer(new CpuReducer(nullptr)),
         _cptr(std::move(cptr)){};
@@ -77,7 +79,7 @@ class Momentum : public Compressor {
 
  protected:
   /*! \brief buffer of momentum */
-  std::unique_ptr<byte_t[]> _mom;
+  StateBuffer _mom;
 
   /*! \brief momentum factor */
   float _mu;
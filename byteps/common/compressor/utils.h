@@ -163,7 +163,7 @@ class BitReader {
       _accum = _dptr[_blocks++];
       _used_bits = PACKING_SIZE;
     }
-    return _accum & (1 << --_used_bits);
+    return _accum & (T(1) << --_used_bits);
   }
 
   size_t bits() const { return _blocks * PACKING_SIZE - _used_bits; }
@@ -138,6 +138,7 @@ void FinishOrProceed(std::shared_ptr<TensorTableEntry> task) {
 
 bool RunCoordinateLoopOnce(QueueType this_op) {
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
   if (task) {
     int rank = BytePSGlobal::GetLocalRank();
@@ -182,7 +183,7 @@ bool RunCoordinateLoopOnce(QueueType this_op) {
                    << "Signal=" << sig << ", rank=" << rank << ", key=" << key;
 
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
   return true;
 }
@@ -281,6 +282,10 @@ bool RunRootNcclLoopOnce() {
   auto &tasks = nccl_entry->tasks;
   auto &queues = nccl_entry->queues;
 
+  // REDUCE and BROADCAST share one notifier
+  auto reduce_q = BytePSGlobal::GetScheduledQueue(REDUCE);
+  auto epoch = reduce_q->getEpoch();
+
   NCCLCHECK(ncclGroupStart());
   for (auto this_op : nccl_ops) {
     auto q = BytePSGlobal::GetScheduledQueue(this_op);
@@ -310,7 +315,7 @@ bool RunRootNcclLoopOnce() {
     BytePSGlobal::GetNccl()->EnqueueGroup(nccl_entry);
   } else {
     NCCLCHECK(ncclGroupEnd());
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    reduce_q->wait(epoch);
   }
 
   return true;
@@ -360,7 +365,9 @@ bool RunNonRootNcclLoopOnce() {
 }
 
 bool RunSyncNcclOnce() {
-  auto nccl_entry = BytePSGlobal::GetNccl()->DequeueGroup();
+  auto nccl = BytePSGlobal::GetNccl();
+  auto epoch = nccl->GetGroupEpoch();
+  auto nccl_entry = nccl->DequeueGroup();
   if (nccl_entry) {
     nccl_entry->SynchronizeEvents();
     for (size_t i = 0; i < nccl_entry->tasks.size(); i++) {
@@ -370,7 +377,7 @@ bool RunSyncNcclOnce() {
     BPS_LOG(TRACE) << "Finished NCCL Group size=" << nccl_entry->tasks.size()
                    << " rank=" << BytePSGlobal::GetLocalRank();
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    nccl->WaitGroup(epoch);
   }
   return true;
 }
@@ -378,6 +385,7 @@ bool RunSyncNcclOnce() {
 bool RunCopyDevice2HostLoopOnce() {
   QueueType this_op = COPYD2H;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
 
   if (task) {
@@ -437,7 +445,7 @@ bool RunCopyDevice2HostLoopOnce() {
 
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
   return true;
 }
@@ -446,6 +454,7 @@ bool RunPcieReduceLoopOnce() {
   BPS_CHECK(BytePSGlobal::IsCrossPcieSwitch());
   QueueType this_op = PCIE_REDUCE;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
   if (task) {
     auto reducer = BytePSGlobal::GetCpuReducer();
@@ -490,7 +499,7 @@ bool RunPcieReduceLoopOnce() {
 
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
   return true;
 }
@@ -498,6 +507,7 @@ bool RunPcieReduceLoopOnce() {
 bool RunCompressLoopOnce() {
   QueueType this_op = COMPRESS;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
   if (task) {
     BPS_CHECK(BytePSGlobal::IsRootDevice())
@@ -529,7 +539,7 @@ bool RunCompressLoopOnce() {
     });
 
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
 
   return true;
@@ -538,12 +548,18 @@ bool RunCompressLoopOnce() {
 bool RunPushLoopOnce() {
   QueueType this_op = PUSH;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
   if (task) {
     BPS_CHECK(BytePSGlobal::IsRootDevice())
         << "only root device should enter PUSH loop";
 
-    if (BytePSGlobal::IsDistributed()) {
+    if (BytePSGlobal::IsDistributed() && task->root_rank >= 0 &&
+        task->root_rank / BytePSGlobal::GetLocalSize() !=
+            BytePSGlobal::GetWorkerID()) {
+      // broadcast: only the worker of the root rank pushes, others just pull
+      FinishOrProceed(task);
+    } else if (BytePSGlobal::IsDistributed()) {
       auto offset = task->offset;
       auto len = task->len;
 
@@ -566,7 +582,10 @@ bool RunPushLoopOnce() {
       // false means not to delete data when SArray is deleted
       ps::SArray<char> vals(data, len, false);
 
-      int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
+      int cmd = GetCommandType(task->root_rank >= 0
+                                   ? RequestType::kBroadcast
+                                   : RequestType::kDefaultPushPull,
+                               dtype);
       auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, len);
       BytePSGlobal::GetPS()->ZPush(pskv.keys, vals, pskv.lens, cmd,
                                    [task, q]() { FinishOrProceed(task); });
@@ -576,7 +595,7 @@ bool RunPushLoopOnce() {
       FinishOrProceed(task);
     }
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
   return true;
 }
@@ -584,6 +603,7 @@ bool RunPushLoopOnce() {
 bool RunPullLoopOnce() {
   QueueType this_op = PULL;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
   if (task) {
     BPS_CHECK(BytePSGlobal::IsRootDevice())
@@ -603,7 +623,10 @@ bool RunPullLoopOnce() {
     // false means not to delete data when SArray is deleted
     auto vals = new ps::SArray<char>(data, len, false);
 
-    int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
+    int cmd = GetCommandType(task->root_rank >= 0
+                                 ? RequestType::kBroadcast
+                                 : RequestType::kDefaultPushPull,
+                             dtype);
     auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, len);
     // issue pull
     BytePSGlobal::GetPS()->ZPull(pskv.keys, vals, &pskv.lens, cmd,
@@ -612,7 +635,7 @@ bool RunPullLoopOnce() {
                                    FinishOrProceed(task);
                                  });
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
   return true;
 }
@@ -620,6 +643,7 @@ bool RunPullLoopOnce() {
 bool RunDecompressLoopOnce() {
   QueueType this_op = DECOMPRESS;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
   if (task) {
     BPS_CHECK(BytePSGlobal::IsRootDevice())
@@ -641,7 +665,7 @@ bool RunDecompressLoopOnce() {
     });
 
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
 
   return true;
@@ -696,6 +720,7 @@ void CopyHost2Device(std::shared_ptr<byteps::common::TensorTableEntry> task) {
 bool RunRootCopyHost2DeviceLoopOnce() {
   QueueType this_op = COPYH2D;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
 
   if (task) {
@@ -713,7 +738,7 @@ bool RunRootCopyHost2DeviceLoopOnce() {
 
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
   return true;
 }
@@ -741,13 +766,14 @@ bool RunNonRootCopyListenLoopOnce() {
 bool RunNonRootCopyHost2DeviceLoopOnce() {
   QueueType this_op = COPYH2D;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto epoch = q->getEpoch();
   auto task = q->getTask();
 
   if (task) {
     CopyHost2Device(task);
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    q->wait(epoch);
   }
   return true;
 }
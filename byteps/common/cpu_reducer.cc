@@ -17,7 +17,13 @@
 #include "global.h"
 #endif
 
+#if defined(__x86_64__) || defined(__i386__)
+#include <immintrin.h>
+#endif
+
+#include <algorithm>
 #include <cmath>
+#include <string>
 
 #include "cpu_reducer.h"
 
@@ -43,10 +49,43 @@ CpuReducer::CpuReducer(std::shared_ptr<BytePSComm> comm) {
   } else {
     _num_threads = 4;
   }
+  if (getenv("BYTEPS_REDUCER_SINGLE_THREAD_BYTES")) {
+    _single_thread_threshold =
+        atol(getenv("BYTEPS_REDUCER_SINGLE_THREAD_BYTES"));
+  } else {
+    _single_thread_threshold = 65536;
+  }
+  _simd = DetectSimd();
+  if (getenv("BYTEPS_REDUCER_SIMD")) {
+    std::string simd(getenv("BYTEPS_REDUCER_SIMD"));
+    BPS_CHECK(simd == "generic" || simd == "avx2" || simd == "avx512")
+        << "BYTEPS_REDUCER_SIMD should be generic, avx2 or avx512, not "
+        << simd;
+    auto cap = simd == "generic" ? Simd::GENERIC
+                                 : simd == "avx2" ? Simd::AVX2 : Simd::AVX512;
+    _simd = std::min(_simd, cap);
+  }
+  BPS_LOG(DEBUG) << "CpuReducer simd=" << static_cast<int>(_simd)
+                 << " single_thread_threshold=" << _single_thread_threshold;
 
   return;
 }
 
+CpuReducer::Simd CpuReducer::DetectSimd() {
+  static const Simd simd = [] {
+    auto simd = Simd::GENERIC;
+#if defined(__x86_64__) || defined(__i386__)
+    __builtin_cpu_init();
+    if (__builtin_cpu_supports("avx2") && __builtin_cpu_supports("f16c")) {
+      simd = Simd::AVX2;
+      if (__builtin_cpu_supports("avx512f")) simd = Simd::AVX512;
+    }
+#endif
+    return simd;
+  }();
+  return simd;
+}
+
 #ifndef BYTEPS_BUILDING_SERVER
 bool CpuReducer::isRoot() {
   if (!_comm) {
@@ -56,6 +95,279 @@ bool CpuReducer::isRoot() {
 }
 #endif
 
+template <typename F>
+void CpuReducer::_parallel_for(size_t n, size_t elem_size, F&& f) {
+  if (n * elem_size < _single_thread_threshold || _num_threads <= 1) {
+    // a fork of the omp team costs more than reducing a small partition
+    f(0, n);
+    return;
+  }
+  size_t block = kReduceBlockBytes / elem_size;
+  size_t chunk = (n + _num_threads - 1) / _num_threads;
+  chunk = (chunk + block - 1) / block * block;
+#pragma omp parallel for num_threads(_num_threads)
+  for (int t = 0; t < _num_threads; ++t) {
+    size_t begin = std::min(n, t * chunk);
+    size_t end = std::min(n, begin + chunk);
+    if (begin < end) f(begin, end);
+  }
+}
+
+void CpuReducer::_sum_float(float* dst, const float* a, const float* b,
+                            float alpha, size_t n) {
+  switch (_simd) {
+#if defined(__x86_64__) || defined(__i386__)
+    case Simd::AVX512:
+      return _sum_float_avx512(dst, a, b, alpha, n);
+    case Simd::AVX2:
+      return _sum_float_avx2(dst, a, b, alpha, n);
+#endif
+    default:
+      return _sum_float_generic(dst, a, b, alpha, n);
+  }
+}
+
+void CpuReducer::_sum_half(uint16_t* dst, const uint16_t* a, const uint16_t* b,
+                           float alpha, size_t n, bool bf16) {
+  switch (_simd) {
+#if defined(__x86_64__) || defined(__i386__)
+    case Simd::AVX512:
+      return _sum_half_avx512(dst, a, b, alpha, n, bf16);
+    case Simd::AVX2:
+      return _sum_half_avx2(dst, a, b, alpha, n, bf16);
+#endif
+    default:
+      return _sum_half_generic(dst, a, b, alpha, n, bf16);
+  }
+}
+
+void CpuReducer::_half_to_float(float* acc, const uint16_t* in, size_t n,
+                                bool accumulate, bool bf16) {
+  switch (_simd) {
+#if defined(__x86_64__) || defined(__i386__)
+    case Simd::AVX512:
+      return _half_to_float_avx512(acc, in, n, accumulate, bf16);
+    case Simd::AVX2:
+      return _half_to_float_avx2(acc, in, n, accumulate, bf16);
+#endif
+    default:
+      return _half_to_float_generic(acc, in, n, accumulate, bf16);
+  }
+}
+
+void CpuReducer::_float_to_half(uint16_t* out, const float* acc, size_t n,
+                                bool bf16) {
+  switch (_simd) {
+#if defined(__x86_64__) || defined(__i386__)
+    case Simd::AVX512:
+      return _float_to_half_avx512(out, acc, n, bf16);
+    case Simd::AVX2:
+      return _float_to_half_avx2(out, acc, n, bf16);
+#endif
+    default:
+      return _float_to_half_generic(out, acc, n, bf16);
+  }
+}
+
+void CpuReducer::_sum_float_generic(float* dst, const float* a, const float* b,
+                                    float alpha, size_t n) {
+#pragma omp simd
+  for (size_t i = 0; i < n; ++i) {
+    dst[i] = a[i] + alpha * b[i];
+  }
+}
+
+void CpuReducer::_sum_half_generic(uint16_t* dst, const uint16_t* a,
+                                   const uint16_t* b, float alpha, size_t n,
+                                   bool bf16) {
+  for (size_t i = 0; i < n; ++i) {
+    float out = Half2Float(a + i, bf16) + alpha * Half2Float(b + i, bf16);
+    Float2Half(out, dst + i, bf16);
+  }
+}
+
+void CpuReducer::_half_to_float_generic(float* acc, const uint16_t* in,
+                                        size_t n, bool accumulate, bool bf16) {
+  for (size_t i = 0; i < n; ++i) {
+    float in_float = Half2Float(in + i, bf16);
+    acc[i] = accumulate ? acc[i] + in_float : in_float;
+  }
+}
+
+void CpuReducer::_float_to_half_generic(uint16_t* out, const float* acc,
+                                        size_t n, bool bf16) {
+  for (size_t i = 0; i < n; ++i) {
+    Float2Half(acc[i], out + i, bf16);
+  }
+}
+
+#if defined(__x86_64__) || defined(__i386__)
+namespace {
+// 8 float16 or bfloat16 to float32, a bfloat16 is the upper half of a float32
+__attribute__((target("avx2,f16c"))) inline __m256 LoadHalf8(const uint16_t* p,
+                                                             bool bf16) {
+  __m128i x = _mm_loadu_si128((const __m128i*)p);
+  if (!bf16) return _mm256_cvtph_ps(x);
+  return _mm256_castsi256_ps(_mm256_slli_epi32(_mm256_cvtepu16_epi32(x), 16));
+}
+
+// 8 float32 to float16 or bfloat16, rounded to nearest even like
+// FloatToBFloat16, NaNs stay NaNs
+__attribute__((target("avx2,f16c"))) inline void StoreHalf8(uint16_t* p,
+                                                            __m256 v,
+                                                            bool bf16) {
+  if (!bf16) {
+    _mm_storeu_si128((__m128i*)p, _mm256_cvtps_ph(v, 0));
+    return;
+  }
+  __m256i u = _mm256_castps_si256(v);
+  __m256i lsb =
+      _mm256_and_si256(_mm256_srli_epi32(u, 16), _mm256_set1_epi32(1));
+  __m256i r =
+      _mm256_add_epi32(u, _mm256_add_epi32(lsb, _mm256_set1_epi32(0x7fff)));
+  __m256i nan = _mm256_castps_si256(_mm256_cmp_ps(v, v, _CMP_UNORD_Q));
+  __m256i quiet = _mm256_or_si256(u, _mm256_set1_epi32(0x400000));
+  r = _mm256_blendv_epi8(r, quiet, nan);
+  r = _mm256_srli_epi32(r, 16);
+  __m128i out = _mm_packus_epi32(_mm256_castsi256_si128(r),
+                                 _mm256_extracti128_si256(r, 1));
+  _mm_storeu_si128((__m128i*)p, out);
+}
+
+__attribute__((target("avx512f"))) inline __m512 LoadHalf16(const uint16_t* p,
+                                                           bool bf16) {
+  __m256i x = _mm256_loadu_si256((const __m256i*)p);
+  if (!bf16) return _mm512_cvtph_ps(x);
+  return _mm512_castsi512_ps(_mm512_slli_epi32(_mm512_cvtepu16_epi32(x), 16));
+}
+
+__attribute__((target("avx512f"))) inline void StoreHalf16(uint16_t* p,
+                                                          __m512 v,
+                                                          bool bf16) {
+  if (!bf16) {
+    _mm256_storeu_si256((__m256i*)p, _mm512_cvtps_ph(v, 0));
+    return;
+  }
+  __m512i u = _mm512_castps_si512(v);
+  __m512i lsb =
+      _mm512_and_si512(_mm512_srli_epi32(u, 16), _mm512_set1_epi32(1));
+  __m512i r =
+      _mm512_add_epi32(u, _mm512_add_epi32(lsb, _mm512_set1_epi32(0x7fff)));
+  __mmask16 nan = _mm512_cmp_ps_mask(v, v, _CMP_UNORD_Q);
+  r = _mm512_mask_or_epi32(r, nan, u, _mm512_set1_epi32(0x400000));
+  r = _mm512_srli_epi32(r, 16);
+  _mm256_storeu_si256((__m256i*)p, _mm512_cvtepi32_epi16(r));
+}
+}  // namespace
+
+void CpuReducer::_sum_float_avx2(float* dst, const float* a, const float* b,
+                                 float alpha, size_t n) {
+  __m256 alpha_m256 = _mm256_set1_ps(alpha);
+  size_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    __m256 b_m256 = _mm256_mul_ps(_mm256_loadu_ps(b + i), alpha_m256);
+    _mm256_storeu_ps(dst + i, _mm256_add_ps(_mm256_loadu_ps(a + i), b_m256));
+  }
+  _sum_float_generic(dst + i, a + i, b + i, alpha, n - i);
+}
+
+void CpuReducer::_sum_half_avx2(uint16_t* dst, const uint16_t* a,
+                                const uint16_t* b, float alpha, size_t n,
+                                bool bf16) {
+  __m256 alpha_m256 = _mm256_set1_ps(alpha);
+  size_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    __m256 b_m256 = _mm256_mul_ps(LoadHalf8(b + i, bf16), alpha_m256);
+    StoreHalf8(dst + i, _mm256_add_ps(LoadHalf8(a + i, bf16), b_m256), bf16);
+  }
+  _sum_half_generic(dst + i, a + i, b + i, alpha, n - i, bf16);
+}
+
+void CpuReducer::_half_to_float_avx2(float* acc, const uint16_t* in, size_t n,
+                                     bool accumulate, bool bf16) {
+  size_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    __m256 in_m256 = LoadHalf8(in + i, bf16);
+    if (accumulate) in_m256 = _mm256_add_ps(in_m256, _mm256_loadu_ps(acc + i));
+    _mm256_storeu_ps(acc + i, in_m256);
+  }
+  _half_to_float_generic(acc + i, in + i, n - i, accumulate, bf16);
+}
+
+void CpuReducer::_float_to_half_avx2(uint16_t* out, const float* acc, size_t n,
+                                     bool bf16) {
+  size_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    StoreHalf8(out + i, _mm256_loadu_ps(acc + i), bf16);
+  }
+  _float_to_half_generic(out + i, acc + i, n - i, bf16);
+}
+
+void CpuReducer::_sum_float_avx512(float* dst, const float* a, const float* b,
+                                   float alpha, size_t n) {
+  __m512 alpha_m512 = _mm512_set1_ps(alpha);
+  size_t i = 0;
+  for (; i + 16 <= n; i += 16) {
+    __m512 b_m512 = _mm512_mul_ps(_mm512_loadu_ps(b + i), alpha_m512);
+    _mm512_storeu_ps(dst + i, _mm512_add_ps(_mm512_loadu_ps(a + i), b_m512));
+  }
+  _sum_float_avx2(dst + i, a + i, b + i, alpha, n - i);
+}
+
+void CpuReducer::_sum_half_avx512(uint16_t* dst, const uint16_t* a,
+                                  const uint16_t* b, float alpha, size_t n,
+                                  bool bf16) {
+  __m512 alpha_m512 = _mm512_set1_ps(alpha);
+  size_t i = 0;
+  for (; i + 16 <= n; i += 16) {
+    __m512 b_m512 = _mm512_mul_ps(LoadHalf16(b + i, bf16), alpha_m512);
+    StoreHalf16(dst + i, _mm512_add_ps(LoadHalf16(a + i, bf16), b_m512), bf16);
+  }
+  _sum_half_avx2(dst + i, a + i, b + i, alpha, n - i, bf16);
+}
+
+void CpuReducer::_half_to_float_avx512(float* acc, const uint16_t* in,
+                                       size_t n, bool accumulate, bool bf16) {
+  size_t i = 0;
+  for (; i + 16 <= n; i += 16) {
+    __m512 in_m512 = LoadHalf16(in + i, bf16);
+    if (accumulate) in_m512 = _mm512_add_ps(in_m512, _mm512_loadu_ps(acc + i));
+    _mm512_storeu_ps(acc + i, in_m512);
+  }
+  _half_to_float_avx2(acc + i, in + i, n - i, accumulate, bf16);
+}
+
+void CpuReducer::_float_to_half_avx512(uint16_t* out, const float* acc,
+                                       size_t n, bool bf16) {
+  size_t i = 0;
+  for (; i + 16 <= n; i += 16) {
+    StoreHalf16(out + i, _mm512_loadu_ps(acc + i), bf16);
+  }
+  _float_to_half_avx2(out + i, acc + i, n - i, bf16);
+}
+#endif
+
+template <typename T>
+int CpuReducer::_sum(T* dst, const T* src, size_t len) {
+  _parallel_for(len / sizeof(T), sizeof(T), [&](size_t begin, size_t end) {
+#pragma omp simd
+    for (size_t i = begin; i < end; ++i) {
+      dst[i] = dst[i] + src[i];
+    }
+  });
+  return 0;
+}
+
+template <>
+int CpuReducer::_sum(float* dst, const float* src, size_t len) {
+  _parallel_for(len / sizeof(float), sizeof(float),
+                [&](size_t begin, size_t end) {
+                  _sum_float(dst + begin, dst + begin, src + begin, 1.0,
+                             end - begin);
+                });
+  return 0;
+}
+
 int CpuReducer::sum(void* dst, const void* src, size_t len, DataType dtype) {
   switch (dtype) {
     case BYTEPS_FLOAT32:
@@ -65,7 +377,8 @@ int CpuReducer::sum(void* dst, const void* src, size_t len, DataType dtype) {
       return _sum(reinterpret_cast<double*>(dst),
                   reinterpret_cast<const double*>(src), len);
     case BYTEPS_FLOAT16:
-      return _sum_float16(dst, src, len);
+    case BYTEPS_BFLOAT16:
+      return _sum_float16(dst, dst, src, len, 1.0, dtype);
     case BYTEPS_UINT8:
       return _sum(reinterpret_cast<uint8_t*>(dst),
                   reinterpret_cast<const uint8_t*>(src), len);
@@ -85,58 +398,24 @@ int CpuReducer::sum(void* dst, const void* src, size_t len, DataType dtype) {
 }
 
 template <typename T>
-int CpuReducer::_sum(T* dst, const T* src, size_t len) {
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < len / (size_t)sizeof(T); ++i) {
-    dst[i] = dst[i] + src[i];
-  }
+int CpuReducer::_sum(T* dst, const T* src1, const T* src2, size_t len) {
+  _parallel_for(len / sizeof(T), sizeof(T), [&](size_t begin, size_t end) {
+#pragma omp simd
+    for (size_t i = begin; i < end; ++i) {
+      dst[i] = src1[i] + src2[i];
+    }
+  });
   return 0;
 }
 
-int CpuReducer::_sum_float16(void* dst, const void* src, size_t len) {
-  // cast src and dst to your float16 type
-  auto in = reinterpret_cast<const unsigned short*>(src);
-  auto inout = reinterpret_cast<unsigned short*>(dst);
-  len = len / (size_t)2;
-
-#if __AVX__ && __F16C__
-  if (is_avx_and_f16c()) {
-#pragma omp parallel for simd num_threads(_num_threads)
-    for (size_t i = 0; i < (size_t)(len / 8) * 8; i += 8) {
-      // convert in & inout to m256
-      __m256 in_m256 = _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(in + i)));
-      __m256 inout_m256 =
-          _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(inout + i)));
-
-      // add them together to new_inout_m256
-      __m256 new_inout_m256 = _mm256_add_ps(in_m256, inout_m256);
-
-      // convert back and store in inout
-      __m128i new_inout_m128i = _mm256_cvtps_ph(new_inout_m256, 0);
-      _mm_storeu_si128((__m128i*)(inout + i), new_inout_m128i);
-    }
-  }
-
-  for (size_t i = (len / 8) * 8; i < (size_t)len; ++i) {
-    float in_float;
-    float inout_float;
-    HalfBits2Float(in + i, &in_float);
-    HalfBits2Float(inout + i, &inout_float);
-    inout_float += in_float;
-    Float2HalfBits(&inout_float, inout + i);
-  }
-#else
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < (size_t)len; ++i) {
-    float in_float;
-    float inout_float;
-    HalfBits2Float(in + i, &in_float);
-    HalfBits2Float(inout + i, &inout_float);
-    inout_float += in_float;
-    Float2HalfBits(&inout_float, inout + i);
-  }
-#endif
-
+template <>
+int CpuReducer::_sum(float* dst, const float* src1, const float* src2,
+                     size_t len) {
+  _parallel_for(len / sizeof(float), sizeof(float),
+                [&](size_t begin, size_t end) {
+                  _sum_float(dst + begin, src1 + begin, src2 + begin, 1.0,
+                             end - begin);
+                });
   return 0;
 }
 
@@ -152,7 +431,8 @@ int CpuReducer::sum(void* dst, const void* src1, const void* src2, size_t len,
                   reinterpret_cast<const double*>(src1),
                   reinterpret_cast<const double*>(src2), len);
     case BYTEPS_FLOAT16:
-      return _sum_float16(dst, src1, src2, len);
+    case BYTEPS_BFLOAT16:
+      return _sum_float16(dst, src1, src2, len, 1.0, dtype);
     case BYTEPS_UINT8:
       return _sum(reinterpret_cast<uint8_t*>(dst),
                   reinterpret_cast<const uint8_t*>(src1),
@@ -176,60 +456,23 @@ int CpuReducer::sum(void* dst, const void* src1, const void* src2, size_t len,
 }
 
 template <typename T>
-int CpuReducer::_sum(T* dst, const T* src1, const T* src2, size_t len) {
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < len / (size_t)sizeof(T); ++i) {
-    dst[i] = src1[i] + src2[i];
-  }
+int CpuReducer::_sum(T* dst, const T* src, size_t len, float alpha) {
+  _parallel_for(len / sizeof(T), sizeof(T), [&](size_t begin, size_t end) {
+#pragma omp simd
+    for (size_t i = begin; i < end; ++i) {
+      dst[i] = dst[i] + alpha * src[i];
+    }
+  });
   return 0;
 }
 
-int CpuReducer::_sum_float16(void* dst, const void* src1, const void* src2,
-                             size_t len) {
-  // cast src and dst to your float16 type
-  auto in1 = reinterpret_cast<const unsigned short*>(src1);
-  auto in2 = reinterpret_cast<const unsigned short*>(src2);
-  auto out = reinterpret_cast<unsigned short*>(dst);
-  len = len / (size_t)2;
-
-#if __AVX__ && __F16C__
-  if (is_avx_and_f16c()) {
-#pragma omp parallel for simd num_threads(_num_threads)
-    for (size_t i = 0; i < (size_t)(len / 8) * 8; i += 8) {
-      // convert in1 & in2 to m256
-      __m256 in_m256 = _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(in1 + i)));
-      __m256 inout_m256 = _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(in2 + i)));
-
-      // add them together to new_inout_m256
-      __m256 new_inout_m256 = _mm256_add_ps(in_m256, inout_m256);
-
-      // convert back and store in out
-      __m128i new_inout_m128i = _mm256_cvtps_ph(new_inout_m256, 0);
-      _mm_storeu_si128((__m128i*)(out + i), new_inout_m128i);
-    }
-  }
-
-  for (size_t i = (size_t)(len / 8) * 8; i < (size_t)len; ++i) {
-    float in1_float;
-    float in2_float;
-    float out_float;
-    HalfBits2Float(in1 + i, &in1_float);
-    HalfBits2Float(in2 + i, &in2_float);
-    out_float = in1_float + in2_float;
-    Float2HalfBits(&out_float, out + i);
-  }
-#else
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < (size_t)len; ++i) {
-    float in1_float;
-    float in2_float;
-    float out_float;
-    HalfBits2Float(in1 + i, &in1_float);
-    HalfBits2Float(in2 + i, &in2_float);
-    out_float = in1_float + in2_float;
-    Float2HalfBits(&out_float, out + i);
-  }
-#endif
+template <>
+int CpuReducer::_sum(float* dst, const float* src, size_t len, float alpha) {
+  _parallel_for(len / sizeof(float), sizeof(float),
+                [&](size_t begin, size_t end) {
+                  _sum_float(dst + begin, dst + begin, src + begin, alpha,
+                             end - begin);
+                });
   return 0;
 }
 
@@ -243,7 +486,8 @@ int CpuReducer::sum(void* dst, const void* src, size_t len, DataType dtype,
       return _sum(reinterpret_cast<double*>(dst),
                   reinterpret_cast<const double*>(src), len, alpha);
     case BYTEPS_FLOAT16:
-      return _sum_float16(dst, src, len, alpha);
+    case BYTEPS_BFLOAT16:
+      return _sum_float16(dst, dst, src, len, alpha, dtype);
     case BYTEPS_UINT8:
       return _sum(reinterpret_cast<uint8_t*>(dst),
                   reinterpret_cast<const uint8_t*>(src), len, alpha);
@@ -263,64 +507,37 @@ int CpuReducer::sum(void* dst, const void* src, size_t len, DataType dtype,
 }
 
 template <typename T>
-int CpuReducer::_sum(T* dst, const T* src, size_t len, float alpha) {
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < len / (size_t)sizeof(T); ++i) {
-    dst[i] = dst[i] + alpha * src[i];
-  }
+int CpuReducer::_sum(T* dst, const T* src1, const T* src2, size_t len,
+                     float alpha) {
+  _parallel_for(len / sizeof(T), sizeof(T), [&](size_t begin, size_t end) {
+#pragma omp simd
+    for (size_t i = begin; i < end; ++i) {
+      dst[i] = src1[i] + alpha * src2[i];
+    }
+  });
   return 0;
 }
 
-int CpuReducer::_sum_float16(void* dst, const void* src, size_t len,
-                             float alpha) {
-  // cast src and dst to your float16 type
-  auto in = reinterpret_cast<const unsigned short*>(src);
-  auto inout = reinterpret_cast<unsigned short*>(dst);
-  len = len / (size_t)2;
-
-#if __AVX__ && __F16C__
-  float mm256_alpha[8];
-  for (int i = 0; i < 8; ++i) mm256_alpha[i] = alpha;
-
-  if (is_avx_and_f16c()) {
-    __m256 __mm256_alpha = _mm256_loadu_ps(mm256_alpha);
-#pragma omp parallel for simd num_threads(_num_threads)
-    for (size_t i = 0; i < (size_t)(len / 8) * 8; i += 8) {
-      // convert in & inout to m256
-      __m256 in_m256 = _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(in + i)));
-      __m256 inout_m256 =
-          _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(inout + i)));
-
-      __m256 scaled_in_m256 = _mm256_mul_ps(in_m256, __mm256_alpha);
-      // add them together to new_inout_m256
-      __m256 new_inout_m256 = _mm256_add_ps(scaled_in_m256, inout_m256);
-
-      // convert back and store in inout
-      __m128i new_inout_m128i = _mm256_cvtps_ph(new_inout_m256, 0);
-      _mm_storeu_si128((__m128i*)(inout + i), new_inout_m128i);
-    }
-  }
-
-  for (size_t i = (len / 8) * 8; i < (size_t)len; ++i) {
-    float in_float;
-    float inout_float;
-    HalfBits2Float(in + i, &in_float);
-    HalfBits2Float(inout + i, &inout_float);
-    inout_float += in_float * alpha;
-    Float2HalfBits(&inout_float, inout + i);
-  }
-#else
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < (size_t)len; ++i) {
-    float in_float;
-    float inout_float;
-    HalfBits2Float(in + i, &in_float);
-    HalfBits2Float(inout + i, &inout_float);
-    inout_float += in_float * alpha;
-    Float2HalfBits(&inout_float, inout + i);
-  }
-#endif
+template <>
+int CpuReducer::_sum(float* dst, const float* src1, const float* src2,
+                     size_t len, float alpha) {
+  _parallel_for(len / sizeof(float), sizeof(float),
+                [&](size_t begin, size_t end) {
+                  _sum_float(dst + begin, src1 + begin, src2 + begin, alpha,
+                             end - begin);
+                });
+  return 0;
+}
 
+int CpuReducer::_sum_float16(void* dst, const void* src1, const void* src2,
+                             size_t len, float alpha, DataType dtype) {
+  auto in1 = reinterpret_cast<const uint16_t*>(src1);
+  auto in2 = reinterpret_cast<const uint16_t*>(src2);
+  auto out = reinterpret_cast<uint16_t*>(dst);
+  bool bf16 = dtype == BYTEPS_BFLOAT16;
+  _parallel_for(len / 2, 2, [&](size_t begin, size_t end) {
+    _sum_half(out + begin, in1 + begin, in2 + begin, alpha, end - begin, bf16);
+  });
   return 0;
 }
 
@@ -336,7 +553,8 @@ int CpuReducer::sum(void* dst, const void* src1, const void* src2, size_t len,
                   reinterpret_cast<const double*>(src1),
                   reinterpret_cast<const double*>(src2), len, alpha);
     case BYTEPS_FLOAT16:
-      return _sum_float16(dst, src1, src2, len, alpha);
+    case BYTEPS_BFLOAT16:
+      return _sum_float16(dst, src1, src2, len, alpha, dtype);
     case BYTEPS_UINT8:
       return _sum(reinterpret_cast<uint8_t*>(dst),
                   reinterpret_cast<const uint8_t*>(src1),
@@ -360,80 +578,124 @@ int CpuReducer::sum(void* dst, const void* src1, const void* src2, size_t len,
 }
 
 template <typename T>
-int CpuReducer::_sum(T* dst, const T* src1, const T* src2, size_t len,
-                     float alpha) {
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < len / (size_t)sizeof(T); ++i) {
-    dst[i] = src1[i] + alpha * src2[i];
-  }
+int CpuReducer::_sum(T* dst, const std::vector<const void*>& srcs,
+                     size_t len) {
+  const size_t block = kReduceBlockBytes / sizeof(T);
+  auto num_srcs = srcs.size();
+  _parallel_for(len / sizeof(T), sizeof(T), [&](size_t begin, size_t end) {
+    for (size_t b = begin; b < end; b += block) {
+      auto e = std::min(end, b + block);
+      auto in0 = reinterpret_cast<const T*>(srcs[0]);
+      if (num_srcs == 1) {
+#pragma omp simd
+        for (size_t i = b; i < e; ++i) dst[i] = in0[i];
+        continue;
+      }
+      // the block of dst stays in cache while the sources stream through
+      auto in1 = reinterpret_cast<const T*>(srcs[1]);
+#pragma omp simd
+      for (size_t i = b; i < e; ++i) dst[i] = in0[i] + in1[i];
+      for (size_t k = 2; k < num_srcs; ++k) {
+        auto in = reinterpret_cast<const T*>(srcs[k]);
+#pragma omp simd
+        for (size_t i = b; i < e; ++i) dst[i] = dst[i] + in[i];
+      }
+    }
+  });
   return 0;
 }
 
-int CpuReducer::_sum_float16(void* dst, const void* src1, const void* src2,
-                             size_t len, float alpha) {
-  // cast src and dst to your float16 type
-  auto in1 = reinterpret_cast<const unsigned short*>(src1);
-  auto in2 = reinterpret_cast<const unsigned short*>(src2);
-  auto out = reinterpret_cast<unsigned short*>(dst);
-  len = len / (size_t)2;
-
-#if __AVX__ && __F16C__
-  float mm256_alpha[8];
-  for (int i = 0; i < 8; ++i) mm256_alpha[i] = alpha;
-
-  if (is_avx_and_f16c()) {
-    __m256 __mm256_alpha = _mm256_loadu_ps(mm256_alpha);
-#pragma omp parallel for simd num_threads(_num_threads)
-    for (size_t i = 0; i < (size_t)(len / 8) * 8; i += 8) {
-      // convert in1 & in2 to m256
-      __m256 in1_m256 = _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(in1 + i)));
-      __m256 in2_m256 = _mm256_cvtph_ps(_mm_loadu_si128((__m128i*)(in2 + i)));
-
-      __m256 scaled_in2_m256 = _mm256_mul_ps(in2_m256, __mm256_alpha);
-      // add them together to new_inout_m256
-      __m256 new_out_m256 = _mm256_add_ps(in1_m256, scaled_in2_m256);
-
-      // convert back and store in out
-      __m128i new_out_m128i = _mm256_cvtps_ph(new_out_m256, 0);
-      _mm_storeu_si128((__m128i*)(out + i), new_out_m128i);
+template <>
+int CpuReducer::_sum(float* dst, const std::vector<const void*>& srcs,
+                     size_t len) {
+  const size_t block = kReduceBlockBytes / sizeof(float);
+  auto num_srcs = srcs.size();
+  _parallel_for(len / sizeof(float), sizeof(float),
+                [&](size_t begin, size_t end) {
+    for (size_t b = begin; b < end; b += block) {
+      auto cnt = std::min(end, b + block) - b;
+      auto in0 = reinterpret_cast<const float*>(srcs[0]) + b;
+      if (num_srcs == 1) {
+        std::memcpy(dst + b, in0, cnt * sizeof(float));
+        continue;
+      }
+      // the block of dst stays in cache while the sources stream through
+      auto in1 = reinterpret_cast<const float*>(srcs[1]) + b;
+      _sum_float(dst + b, in0, in1, 1.0, cnt);
+      for (size_t k = 2; k < num_srcs; ++k) {
+        auto in = reinterpret_cast<const float*>(srcs[k]) + b;
+        _sum_float(dst + b, dst + b, in, 1.0, cnt);
+      }
     }
-  }
+  });
+  return 0;
+}
 
-  for (size_t i = (size_t)(len / 8) * 8; i < (size_t)len; ++i) {
-    float in1_float;
-    float in2_float;
-    float out_float;
-    HalfBits2Float(in1 + i, &in1_float);
-    HalfBits2Float(in2 + i, &in2_float);
-    out_float = in1_float + in2_float * alpha;
-    Float2HalfBits(&out_float, out + i);
-  }
-#else
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < (size_t)len; ++i) {
-    float in1_float;
-    float in2_float;
-    float out_float;
-    HalfBits2Float(in1 + i, &in1_float);
-    HalfBits2Float(in2 + i, &in2_float);
-    out_float = in1_float + in2_float * alpha;
-    Float2HalfBits(&out_float, out + i);
-  }
-#endif
+int CpuReducer::_sum_float16(void* dst, const std::vector<const void*>& srcs,
+                             size_t len, DataType dtype) {
+  auto out = reinterpret_cast<uint16_t*>(dst);
+  bool bf16 = dtype == BYTEPS_BFLOAT16;
+  const size_t block = kReduceBlockBytes / 2;
+  auto num_srcs = srcs.size();
+  _parallel_for(len / 2, 2, [&](size_t begin, size_t end) {
+    for (size_t b = begin; b < end; b += block) {
+      // accumulate the block in fp32 and round once at the end
+      float acc[block];
+      auto cnt = std::min(end, b + block) - b;
+      for (size_t k = 0; k < num_srcs; ++k) {
+        auto in = reinterpret_cast<const uint16_t*>(srcs[k]) + b;
+        _half_to_float(acc, in, cnt, k > 0, bf16);
+      }
+      _float_to_half(out + b, acc, cnt, bf16);
+    }
+  });
   return 0;
 }
 
-int CpuReducer::copy(void* dst, const void* src, size_t len) {
-  auto in = (float*)src;
-  auto out = (float*)dst;
-#pragma omp parallel for simd num_threads(_num_threads)
-  for (size_t i = 0; i < len / 4; ++i) {
-    out[i] = in[i];
+int CpuReducer::sum(void* dst, const std::vector<const void*>& in_srcs,
+                    size_t len, DataType dtype) {
+  BPS_CHECK_GE(in_srcs.size(), 1);
+  // the kernels write srcs[0] + srcs[1] to dst before they read srcs[2],
+  // so a later source that is dst goes first
+  std::vector<const void*> reordered;
+  auto aliased = in_srcs.size() > 2
+                     ? std::find(in_srcs.begin() + 2, in_srcs.end(), dst)
+                     : in_srcs.end();
+  if (aliased != in_srcs.end()) {
+    reordered = in_srcs;
+    std::swap(reordered[0], reordered[aliased - in_srcs.begin()]);
   }
-  if (len % 4) {
-    std::memcpy(out + len / 4, in + len / 4, len % 4);
+  auto& srcs = reordered.empty() ? in_srcs : reordered;
+  switch (dtype) {
+    case BYTEPS_FLOAT32:
+      return _sum(reinterpret_cast<float*>(dst), srcs, len);
+    case BYTEPS_FLOAT64:
+      return _sum(reinterpret_cast<double*>(dst), srcs, len);
+    case BYTEPS_FLOAT16:
+    case BYTEPS_BFLOAT16:
+      return _sum_float16(dst, srcs, len, dtype);
+    case BYTEPS_UINT8:
+      return _sum(reinterpret_cast<uint8_t*>(dst), srcs, len);
+    case BYTEPS_INT32:
+      return _sum(reinterpret_cast<int32_t*>(dst), srcs, len);
+    case BYTEPS_INT8:
+      return _sum(reinterpret_cast<int8_t*>(dst), srcs, len);
+    case BYTEPS_INT64:
+      return _sum(reinterpret_cast<int64_t*>(dst), srcs, len);
+    default:
+      BPS_CHECK(0) << "Unsupported data type: " << dtype;
   }
   return 0;
 }
+
+int CpuReducer::copy(void* dst, const void* src, size_t len) {
+  // memcpy of glibc picks its vector instructions at run time
+  auto in = reinterpret_cast<const char*>(src);
+  auto out = reinterpret_cast<char*>(dst);
+  _parallel_for(len, 1, [&](size_t begin, size_t end) {
+    std::memcpy(out + begin, in + begin, end - begin);
+  });
+  return 0;
+}
 }  // namespace common
 }  // namespace byteps
@@ -16,13 +16,10 @@
 #ifndef BYTEPS_CPU_REDUCER_H
 #define BYTEPS_CPU_REDUCER_H
 
-#if __AVX__ && __F16C__
-#include <cpuid.h>
-#include <immintrin.h>
-#endif
-
 #include <cstring>
 #include <memory>
+#include <vector>
+#include "bfloat16.h"
 #include "common.h"
 #include "logging.h"
 
@@ -53,8 +50,19 @@ class CpuReducer {
   int sum(void* dst, const void* src1, const void* src2, size_t len,
           DataType dtype, float alpha);
 
+  // dst = srcs[0] + ... + srcs[n-1] in one cache-blocked pass, so that every
+  // source is read from memory once and dst is written once.
+  // dst may be any of srcs.
+  int sum(void* dst, const std::vector<const void*>& srcs, size_t len,
+          DataType dtype);
+
   int copy(void* dst, const void* src, size_t len);
 
+  // vector instruction set of the float32 and 16-bit kernels, the best one
+  // of the CPU unless capped by BYTEPS_REDUCER_SIMD
+  enum class Simd { GENERIC = 0, AVX2 = 1, AVX512 = 2 };
+  Simd GetSimd() const { return _simd; }
+
 #ifndef BYTEPS_BUILDING_SERVER
   bool isRoot();
   std::shared_ptr<BytePSComm> getComm() { return _comm; }
@@ -64,21 +72,7 @@ class CpuReducer {
 
  private:
 
-#if __AVX__ && __F16C__
-  // Query CPUID to determine AVX and F16C runtime support.
-  bool is_avx_and_f16c() {
-    static bool initialized = false;
-    static bool result = false;
-    if (!initialized) {
-      unsigned int eax, ebx, ecx, edx;
-      if (__get_cpuid(1, &eax, &ebx, &ecx, &edx)) {
-        result = (ecx & bit_AVX) && (ecx & bit_F16C);
-      }
-      initialized = true;
-    }
-    return result;
-  }
-#endif
+  static Simd DetectSimd();
 
   inline void HalfBits2Float(const unsigned short* src, float* res) {
     unsigned h = *src;
@@ -178,30 +172,97 @@ class CpuReducer {
     *dest = u;
   }
 
+  inline float Half2Float(const uint16_t* src, bool bf16) {
+    if (bf16) return BFloat16ToFloat(*src);
+    float res;
+    HalfBits2Float(src, &res);
+    return res;
+  }
+
+  inline void Float2Half(float value, uint16_t* dest, bool bf16) {
+    if (bf16) {
+      *dest = FloatToBFloat16(value);
+    } else {
+      Float2HalfBits(&value, dest);
+    }
+  }
+
   template <typename T>
   int _sum(T* dst, const T* src, size_t len);
   template <typename T>
   int _sum(T* dst, const T* src1, const T* src2, size_t len);
 
-  int _sum_float16(void* dst, const void* src, size_t len);
-  int _sum_float16(void* dst, const void* src1, const void* src2, size_t len);
-
   template <typename T>
   int _sum(T* dst, const T* src, size_t len, float alpha);
 
   template <typename T>
   int _sum(T* dst, const T* src1, const T* src2, size_t len, float alpha);
 
-  int _sum_float16(void* dst, const void* src, size_t len, float alpha);
+  // float16 and bfloat16, computed in float32: dst = src1 + alpha * src2
   int _sum_float16(void* dst, const void* src1, const void* src2, size_t len,
-                   float alpha);
+                   float alpha, DataType dtype);
+
+  template <typename T>
+  int _sum(T* dst, const std::vector<const void*>& srcs, size_t len);
+  int _sum_float16(void* dst, const std::vector<const void*>& srcs,
+                   size_t len, DataType dtype);
+
+  // bytes of dst reduced at a time by the N-ary sum, kept in L1/L2
+  static const size_t kReduceBlockBytes = 16384;
+
+  // f(begin, end) over [0, n) elements, split into one range of whole blocks
+  // per thread, or on the calling thread below _single_thread_threshold bytes
+  template <typename F>
+  void _parallel_for(size_t n, size_t elem_size, F&& f);
+
+  // kernels on n elements: dst = a + alpha * b, and the conversions of the
+  // N-ary sum (acc = in, or acc += in when accumulate). The 16-bit ones take
+  // float16, or bfloat16 when bf16.
+  void _sum_float(float* dst, const float* a, const float* b, float alpha,
+                  size_t n);
+  void _sum_half(uint16_t* dst, const uint16_t* a, const uint16_t* b,
+                 float alpha, size_t n, bool bf16);
+  void _half_to_float(float* acc, const uint16_t* in, size_t n,
+                      bool accumulate, bool bf16);
+  void _float_to_half(uint16_t* out, const float* acc, size_t n, bool bf16);
+
+  // one version per Simd, each finishes the tail with the previous one
+  void _sum_float_generic(float* dst, const float* a, const float* b,
+                          float alpha, size_t n);
+  void _sum_half_generic(uint16_t* dst, const uint16_t* a, const uint16_t* b,
+                         float alpha, size_t n, bool bf16);
+  void _half_to_float_generic(float* acc, const uint16_t* in, size_t n,
+                              bool accumulate, bool bf16);
+  void _float_to_half_generic(uint16_t* out, const float* acc, size_t n,
+                              bool bf16);
+#if defined(__x86_64__) || defined(__i386__)
+  __attribute__((target("avx2,f16c"))) void _sum_float_avx2(
+      float* dst, const float* a, const float* b, float alpha, size_t n);
+  __attribute__((target("avx2,f16c"))) void _sum_half_avx2(
+      uint16_t* dst, const uint16_t* a, const uint16_t* b, float alpha,
+      size_t n, bool bf16);
+  __attribute__((target("avx2,f16c"))) void _half_to_float_avx2(
+      float* acc, const uint16_t* in, size_t n, bool accumulate, bool bf16);
+  __attribute__((target("avx2,f16c"))) void _float_to_half_avx2(
+      uint16_t* out, const float* acc, size_t n, bool bf16);
+  __attribute__((target("avx512f"))) void _sum_float_avx512(
+      float* dst, const float* a, const float* b, float alpha, size_t n);
+  __attribute__((target("avx512f"))) void _sum_half_avx512(
+      uint16_t* dst, const uint16_t* a, const uint16_t* b, float alpha,
+      size_t n, bool bf16);
+  __attribute__((target("avx512f"))) void _half_to_float_avx512(
+      float* acc, const uint16_t* in, size_t n, bool accumulate, bool bf16);
+  __attribute__((target("avx512f"))) void _float_to_half_avx512(
+      uint16_t* out, const float* acc, size_t n, bool bf16);
+#endif
 
   float _convert_half_to_full_precision(uint16_t h);
   uint16_t _convert_full_to_half_precision(float f);
 
   std::shared_ptr<BytePSComm> _comm;
   int _num_threads;
-  size_t _single_thread_threshold; 
+  size_t _single_thread_threshold;
+  Simd _simd;
 };
 
 }  // namespace common
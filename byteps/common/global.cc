@@ -28,6 +28,7 @@ namespace common {
 std::mutex BytePSGlobal::_init_mutex;
 volatile bool BytePSGlobal::_initialized = false;
 volatile bool BytePSGlobal::_should_shutdown = false;
+bool BytePSGlobal::_core_loop_polling = false;
 
 int BytePSGlobal::_rank = 0;
 int BytePSGlobal::_local_rank = 0;
@@ -41,6 +42,7 @@ bool BytePSGlobal::_is_distributed_job;
 bool BytePSGlobal::_is_cross_pcie_switch;
 uint32_t BytePSGlobal::_partition_bytes = 4096000;
 uint32_t BytePSGlobal::_min_compress_bytes = (1 << 16);
+uint32_t BytePSGlobal::_init_batch_bytes = (1 << 26);
 
 int BytePSGlobal::_is_trace = 0;
 int BytePSGlobal::_start_step = 10;
@@ -97,7 +99,13 @@ BytePSScheduledQueue* BytePSGlobal::GetScheduledQueue(QueueType queueType) {
 void BytePSGlobal::CreateScheduledQueue(QueueType queueType) {
   std::lock_guard<std::mutex> lock(_queues_mutex[queueType]);
   if (!_queues[queueType]) {
-    _queues[queueType] = new BytePSScheduledQueue(queueType);
+    std::shared_ptr<TaskNotifier> notifier;
+    if (queueType == BROADCAST) {
+      // the root NCCL loop waits on REDUCE and BROADCAST at the same time
+      CreateScheduledQueue(REDUCE);
+      notifier = GetScheduledQueue(REDUCE)->getNotifier();
+    }
+    _queues[queueType] = new BytePSScheduledQueue(queueType, notifier);
   }
   return;
 }
@@ -123,6 +131,11 @@ void BytePSGlobal::Init() {
                    ? std::string(getenv("BYTEPS_TRACE_DIR"))
                    : "./trace";
 
+  // sleep-polling loops instead of waiting for notifications
+  _core_loop_polling = getenv("BYTEPS_CORE_LOOP_POLLING")
+                           ? atoi(getenv("BYTEPS_CORE_LOOP_POLLING"))
+                           : false;
+
   _basic_comm = std::make_shared<BytePSCommSocket>();
 
   _basic_comm->init(&_rank, &_size, &_local_rank, &_local_size, &_worker_id,
@@ -137,6 +150,9 @@ void BytePSGlobal::Init() {
   if (getenv("BYTEPS_MIN_COMPRESS_BYTES")) {
     _min_compress_bytes = atoi(getenv("BYTEPS_MIN_COMPRESS_BYTES"));
   }
+  if (getenv("BYTEPS_INIT_BATCH_BYTES")) {
+    _init_batch_bytes = atoi(getenv("BYTEPS_INIT_BATCH_BYTES"));
+  }
   _pagesize = sysconf(_SC_PAGESIZE);
   BPS_CHECK_GT(_pagesize, 0);
   _partition_bytes = RoundUp(_partition_bytes, _local_size * _pagesize);
@@ -322,6 +338,16 @@ void BytePSGlobal::Shutdown() {
   _should_shutdown = true;
   int total_thread_num = _threads.size();
 
+  // wake up loops waiting for tasks so that they see _should_shutdown
+  for (size_t i = 0; i < QueueNum; i++) {
+    if (_queues[i]) {
+      ((BytePSScheduledQueue*)_queues[i])->notify();
+    }
+  }
+  if (_nccl_manager) {
+    _nccl_manager->NotifyGroup();
+  }
+
   for (size_t i = 0; i < _threads.size(); i++) {
     if (_threads[i]->joinable()) {
       _threads[i]->join();
@@ -56,6 +56,7 @@ class BytePSGlobal {
   static Status CheckInit();
   static bool ShouldShutdown() { return _should_shutdown; }
   static void Shutdown();
+  static bool IsCoreLoopPolling() { return _core_loop_polling; }
 
   static int GetRank() { return _rank; }
   static int GetLocalRank() { return _local_rank; }
@@ -102,6 +103,7 @@ class BytePSGlobal {
 
   static uint32_t GetPartitionBound() { return _partition_bytes; }
   static uint32_t GetMinCompressBound() { return _min_compress_bytes; }
+  static uint32_t GetInitBatchBound() { return _init_batch_bytes; }
 
   static cudaStream_t* GetCopyDevice2HostStream();
   static cudaStream_t* GetCopyHost2DeviceStream();
@@ -144,6 +146,7 @@ class BytePSGlobal {
   static std::mutex _init_mutex;
   static volatile bool _initialized;
   static volatile bool _should_shutdown;
+  static bool _core_loop_polling;
 
   static int _rank;
   static int _local_rank;
@@ -182,6 +185,7 @@ class BytePSGlobal {
 
   static uint32_t _partition_bytes;
   static uint32_t _min_compress_bytes;
+  static uint32_t _init_batch_bytes;
 
   // (key, ready_signal_count) pair, only valid for root device
   static ReadyTable* _reduce_table;
@@ -0,0 +1,171 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_INDEXED_QUEUE_H
+#define BYTEPS_INDEXED_QUEUE_H
+
+#include <cstdint>
+#include <map>
+#include <memory>
+#include <set>
+#include <unordered_map>
+#include <utility>
+
+namespace byteps {
+namespace common {
+
+/**
+ * Pending tasks of a scheduled queue, indexed for O(log n) insert and removal:
+ *   - by order: (priority desc, key asc) when `ordered`, FIFO otherwise
+ *   - by key: for pop(key) and for waking parked tasks
+ *   - by length: so a pop that cannot fit any task in the credits returns
+ *     without looking at the tasks at all
+ * Tasks waiting on an external signal for their key can be parked by the
+ * readiness check; they are left out of every scan until unpark(key).
+ * Not thread-safe, the owner locks.
+ *
+ * T must expose `key`, `priority` and `len`.
+ */
+template <typename T>
+class IndexedTaskQueue {
+ public:
+  using TaskPtr = std::shared_ptr<T>;
+
+  // what the readiness check passed to pop() decides for a task
+  enum Readiness {
+    READY,      // take it
+    NOT_READY,  // skip it, look again on the next pop
+    PARK        // skip it until unpark() is called with its key
+  };
+
+  explicit IndexedTaskQueue(bool ordered) : _ordered(ordered), _seq(0) {}
+
+  void push(TaskPtr task) {
+    Slot slot{_ordered ? task->priority : 0, _ordered ? task->key : 0, _seq++};
+    activate(slot, std::move(task));
+  }
+
+  // Pop the first task in order whose length fits in `credits` and for which
+  // `check(task)` returns READY. `check` is only called on tasks that fit,
+  // and the scan stops at the first task that is taken.
+  template <typename CheckFn>
+  TaskPtr pop(uint64_t credits, CheckFn&& check) {
+    if (_tasks.empty() || *_lens.begin() > credits) {
+      return nullptr;
+    }
+    for (auto it = _tasks.begin(); it != _tasks.end();) {
+      if (it->second->len > credits) {
+        ++it;
+        continue;
+      }
+      switch (check(it->second)) {
+        case READY:
+          return deactivate(it++);
+        case PARK: {
+          auto slot = it->first;
+          auto task = deactivate(it++);
+          _parked.emplace(task->key, std::make_pair(slot, task));
+          break;
+        }
+        default:
+          ++it;
+          break;
+      }
+    }
+    return nullptr;
+  }
+
+  // Pop the earliest queued task with this key, parked or not, or nullptr if
+  // there is none.
+  TaskPtr pop(uint64_t key) {
+    unpark(key);
+    auto range = _by_key.equal_range(key);
+    if (range.first == range.second) {
+      return nullptr;
+    }
+    auto first = range.first;
+    for (auto it = range.first; it != range.second; ++it) {
+      if (SlotLess()(it->second, first->second)) first = it;
+    }
+    return deactivate(_tasks.find(first->second));
+  }
+
+  // Put the tasks parked on this key back into the scan.
+  void unpark(uint64_t key) {
+    auto range = _parked.equal_range(key);
+    for (auto it = range.first; it != range.second; ++it) {
+      activate(it->second.first, std::move(it->second.second));
+    }
+    _parked.erase(range.first, range.second);
+  }
+
+  size_t size() const { return _tasks.size() + _parked.size(); }
+  bool empty() const { return size() == 0; }
+
+ private:
+  struct Slot {
+    int priority;
+    uint64_t key;
+    uint64_t seq;
+  };
+
+  struct SlotLess {
+    bool operator()(const Slot& a, const Slot& b) const {
+      if (a.priority != b.priority) {
+        return a.priority > b.priority;  // from higher priority to lower
+      }
+      if (a.key != b.key) {
+        return a.key < b.key;  // from the first partition to the last
+      }
+      return a.seq < b.seq;
+    }
+  };
+
+  using TaskMap = std::map<Slot, TaskPtr, SlotLess>;
+
+  void activate(const Slot& slot, TaskPtr task) {
+    _by_key.emplace(task->key, slot);
+    _lens.insert(task->len);
+    _tasks.emplace(slot, std::move(task));
+  }
+
+  TaskPtr deactivate(typename TaskMap::iterator it) {
+    TaskPtr task = std::move(it->second);
+    auto range = _by_key.equal_range(task->key);
+    for (auto k = range.first; k != range.second; ++k) {
+      if (k->second.seq == it->first.seq) {
+        _by_key.erase(k);
+        break;
+      }
+    }
+    _lens.erase(_lens.find(task->len));
+    _tasks.erase(it);
+    return task;
+  }
+
+  bool _ordered;
+  uint64_t _seq;
+  // tasks visible to pop(credits, check)
+  TaskMap _tasks;
+  std::unordered_multimap<uint64_t, Slot> _by_key;
+  std::multiset<uint64_t> _lens;
+  // tasks waiting for unpark(key)
+  std::unordered_multimap<uint64_t, std::pair<Slot, TaskPtr>> _parked;
+};
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_INDEXED_QUEUE_H
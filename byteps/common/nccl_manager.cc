@@ -165,8 +165,11 @@ void NcclManager::InitGlobalEnv() {  // init all global env/param here
 }
 
 void NcclManager::EnqueueGroup(std::shared_ptr<NcclGroupEntry> e) {
-  std::lock_guard<std::mutex> lock(_nccl_mutex);
-  _nccl_pipeline.push(e);
+  {
+    std::lock_guard<std::mutex> lock(_nccl_mutex);
+    _nccl_pipeline.push(e);
+  }
+  _nccl_notifier.Notify();
   return;
 }
 
@@ -180,6 +183,14 @@ std::shared_ptr<NcclGroupEntry> NcclManager::DequeueGroup() {
   return r;
 }
 
+void NcclManager::WaitGroup(uint64_t epoch) {
+  if (BytePSGlobal::IsCoreLoopPolling()) {
+    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    return;
+  }
+  _nccl_notifier.Wait(epoch, std::chrono::microseconds(10000));
+}
+
 // Example:
 // 4 reduce rings:
 // 0 1 2 3 | 4 5 6 7
@@ -21,6 +21,7 @@
 #include <vector>
 #include "common.h"
 #include "communicator.h"
+#include "notifier.h"
 #include "scheduled_queue.h"
 
 namespace byteps {
@@ -66,6 +67,10 @@ class NcclManager {
   int GetGroupSize() { return _nccl_group_size; }
   void EnqueueGroup(std::shared_ptr<NcclGroupEntry> e);
   std::shared_ptr<NcclGroupEntry> DequeueGroup();
+  // same protocol as BytePSScheduledQueue::getEpoch()/wait()
+  uint64_t GetGroupEpoch() { return _nccl_notifier.GetEpoch(); }
+  void WaitGroup(uint64_t epoch);
+  void NotifyGroup() { _nccl_notifier.Notify(); }
 
   virtual cudaStream_t GetStream(uint64_t key, QueueType op);
   virtual ncclComm_t GetComm(uint64_t key, QueueType op);
@@ -95,6 +100,7 @@ class NcclManager {
   // for pipelining nccl
   std::mutex _nccl_mutex;
   std::queue<std::shared_ptr<NcclGroupEntry>> _nccl_pipeline;
+  TaskNotifier _nccl_notifier;
 
   std::shared_ptr<BytePSComm> _signal_comm;
   std::shared_ptr<BytePSComm> _global_comm;
@@ -0,0 +1,66 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_NOTIFIER_H
+#define BYTEPS_NOTIFIER_H
+
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
+#include <cstdint>
+#include <mutex>
+
+namespace byteps {
+namespace common {
+
+/**
+ * Wakes up a loop thread when the queue(s) it serves may have work.
+ * A waiter reads the epoch before it looks for work and passes it to Wait(),
+ * so a Notify() that lands in between is never lost:
+ *
+ *   auto epoch = notifier->GetEpoch();
+ *   if (!TryWork()) notifier->Wait(epoch, timeout);
+ */
+class TaskNotifier {
+ public:
+  uint64_t GetEpoch() { return _epoch.load(std::memory_order_acquire); }
+
+  void Notify() {
+    {
+      std::lock_guard<std::mutex> lock(_mutex);
+      _epoch.fetch_add(1, std::memory_order_release);
+    }
+    _cv.notify_all();
+  }
+
+  // Block until Notify() is called after `epoch` was read, or `timeout`
+  // passes. Returns false on timeout.
+  bool Wait(uint64_t epoch, std::chrono::microseconds timeout) {
+    std::unique_lock<std::mutex> lock(_mutex);
+    return _cv.wait_for(lock, timeout, [this, epoch] {
+      return _epoch.load(std::memory_order_acquire) != epoch;
+    });
+  }
+
+ private:
+  std::mutex _mutex;
+  std::condition_variable _cv;
+  std::atomic<uint64_t> _epoch{0};
+};
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_NOTIFIER_H
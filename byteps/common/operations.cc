@@ -16,7 +16,9 @@
 #include <cuda_runtime.h>
 #include <unistd.h>
 
+#include <algorithm>
 #include <cstring>
+#include <deque>
 #include <memory>
 #include <thread>
 
@@ -157,6 +159,7 @@ void PartitionTensor(
     e->device = entry->device;
     e->priority = entry->priority;
     e->version = entry->version;
+    e->root_rank = entry->root_rank;
     e->callback = entry->callback;
     e->cpubuff = entry->cpubuff;
     e->gpu_ptr = entry->gpu_ptr;
@@ -184,12 +187,15 @@ Status EnqueueTensor(BPSContext &context, std::shared_ptr<Tensor> input,
                      std::shared_ptr<ReadyEvent> ready_event, const int device,
                      const int priority, const int version,
                      StatusCallback callback,
-                     std::shared_ptr<std::vector<QueueType>> queue_list) {
+                     std::shared_ptr<std::vector<QueueType>> queue_list,
+                     const int root_rank) {
   if (BytePSGlobal::ShouldShutdown()) {
     return Status::OK();
   }
 
   auto &name = context.tensor_name;
+  BPS_CHECK(root_rank < 0 || context.compressor_list.empty())
+      << name << " cannot be broadcast with compression";
   if (input && output) {
     BPS_CHECK_EQ(input->size(), output->size())
         << name << " output tensor size does not match";
@@ -212,6 +218,7 @@ Status EnqueueTensor(BPSContext &context, std::shared_ptr<Tensor> input,
   e->device = device;
   e->priority = priority;
   e->version = version;
+  e->root_rank = root_rank;
   e->callback = callback;
 
   if (device == CPU_DEVICE_ID) {
@@ -280,6 +287,78 @@ Status EnqueueTensor(BPSContext &context, std::shared_ptr<Tensor> input,
   return Status::OK();
 }
 
+namespace {
+
+// Batches of copied values in flight at once, which bounds the extra host
+// memory to this many times BYTEPS_INIT_BATCH_BYTES for any tensor size.
+const size_t kMaxCopiedInitBatches = 4;
+
+// Pushes lens[i] bytes at vals[i] to the (encoded) keys[i], in requests of
+// many keys of up to BYTEPS_INIT_BATCH_BYTES, and waits for all of them. A
+// request needs its keys in ascending order and its values in one buffer. If
+// the values of a batch are already adjacent, e.g., the partitions of a tensor
+// on one server, they are pushed from where they are; otherwise they are
+// copied, and the oldest batch is waited for before copying too many.
+void BatchedPush(const std::vector<ps::Key> &keys,
+                 const std::vector<const char *> &vals,
+                 const std::vector<int> &lens, int cmd) {
+  auto ps = BytePSGlobal::GetOrInitPS();
+  auto bound = BytePSGlobal::GetInitBatchBound();
+  std::vector<size_t> order(keys.size());
+  for (size_t i = 0; i < order.size(); ++i) order[i] = i;
+  std::sort(order.begin(), order.end(),
+            [&keys](size_t a, size_t b) { return keys[a] < keys[b]; });
+
+  std::vector<int> timestamps;
+  std::deque<int> copied;  // timestamps of the batches of copied values
+  size_t begin = 0;
+  while (begin < order.size()) {
+    size_t end = begin, bytes = 0;
+    bool adjacent = true;
+    do {
+      auto i = order[end];
+      if (end > begin) {
+        auto prev = order[end - 1];
+        adjacent &= vals[prev] + lens[prev] == vals[i];
+      }
+      bytes += lens[i];
+      ++end;
+    } while (end < order.size() && bytes + lens[order[end]] <= bound);
+
+    ps::SArray<ps::Key> batch_keys;
+    ps::SArray<int> batch_lens;
+    for (size_t j = begin; j < end; ++j) {
+      batch_keys.push_back(keys[order[j]]);
+      batch_lens.push_back(lens[order[j]]);
+    }
+    if (adjacent) {
+      // false means not to delete data when SArray is deleted
+      ps::SArray<char> batch_vals(const_cast<char *>(vals[order[begin]]),
+                                  bytes, false);
+      timestamps.push_back(
+          ps->ZPush(batch_keys, batch_vals, batch_lens, cmd));
+    } else {
+      if (copied.size() == kMaxCopiedInitBatches) {
+        ps->Wait(copied.front());
+        copied.pop_front();
+      }
+      ps::SArray<char> batch_vals(bytes);
+      size_t offset = 0;
+      for (size_t j = begin; j < end; ++j) {
+        auto i = order[j];
+        memcpy(batch_vals.data() + offset, vals[i], lens[i]);
+        offset += lens[i];
+      }
+      copied.push_back(ps->ZPush(batch_keys, batch_vals, batch_lens, cmd));
+    }
+    begin = end;
+  }
+  for (auto ts : timestamps) ps->Wait(ts);
+  for (auto ts : copied) ps->Wait(ts);
+}
+
+}  // namespace
+
 void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff) {
   std::lock_guard<std::mutex> lock(context.init_mutex);
   if (context.initialized) {
@@ -362,20 +441,20 @@ void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff) {
   if (size < BytePSGlobal::GetMinCompressBound()) {
     context.kwargs.clear();
   }
+  // the encoded keys, the data and the length of every part
+  std::vector<ps::Key> ps_keys;
+  std::vector<const char *> ps_vals;
+  std::vector<int> ps_lens;
   while (accumulated < size) {
     auto key = key_list[i];
     int len = ((size - accumulated) > bound) ? bound : (size - accumulated);
 
     if (BytePSGlobal::IsDistributed() && BytePSGlobal::IsRootDevice()) {
-      auto ps = BytePSGlobal::GetOrInitPS();
       // encode the key for pskv scattering
       auto &pskv = BytePSGlobal::EncodeDefaultKey(key, len);
-      // false means not to delete data when SArray is deleted
-      ps::SArray<char> vals(data + accumulated, len, false);
-      // cmd type
-      int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
-      // blocking push, also as a global barrirer
-      ps->Wait(ps->ZPush(pskv.keys, vals, pskv.lens, cmd));
+      ps_keys.push_back(pskv.keys[0]);
+      ps_vals.push_back(data + accumulated);
+      ps_lens.push_back(len);
 
       // register
       if (!context.kwargs.empty()) {
@@ -392,19 +471,20 @@ void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff) {
   BPS_CHECK_EQ(accumulated, size);
   BPS_CHECK_EQ(i, key_list.size());
 
+  if (BytePSGlobal::IsDistributed() && BytePSGlobal::IsRootDevice()) {
+    // blocking push of all parts, also as a global barrier
+    BatchedPush(ps_keys, ps_vals, ps_lens,
+                GetCommandType(RequestType::kDefaultPushPull, dtype));
+  }
+
   // send to server
   if (!context.kwargs.empty() && BytePSGlobal::IsDistributed() &&
       BytePSGlobal::IsRootDevice()) {
-    auto ps = BytePSGlobal::GetOrInitPS();
     auto content = compressor::Serialize(context.kwargs);
-    auto len = content.size();
-    auto data = const_cast<char *>(content.c_str());
-    for (auto key : key_list) {
-      auto &kv = BytePSGlobal::EncodeDefaultKey(key, len);
-      ps::SArray<char> vals(data, len, false);
-      int cmd = GetCommandType(RequestType::kCompressedPushPull, dtype);
-      ps->Wait(ps->ZPush(kv.keys, vals, kv.lens, cmd));
-    }
+    std::vector<const char *> vals(ps_keys.size(), content.data());
+    std::vector<int> lens(ps_keys.size(), content.size());
+    BatchedPush(ps_keys, vals, lens,
+                GetCommandType(RequestType::kCompressedPushPull, dtype));
   }
 
   context.initialized = true;
@@ -67,7 +67,8 @@ Status EnqueueTensor(BPSContext &context, std::shared_ptr<Tensor> input,
                      std::shared_ptr<ReadyEvent> ready_event, const int device,
                      const int priority, const int version,
                      StatusCallback callback,
-                     std::shared_ptr<std::vector<QueueType>> queue_list);
+                     std::shared_ptr<std::vector<QueueType>> queue_list,
+                     const int root_rank = -1);
 
 void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff);
 
@@ -20,27 +20,92 @@
 namespace byteps {
 namespace common {
 
+ReadyTable::ReadyTable(int ready_count, const char* name) {
+  _ready_count = ready_count;
+  _table_name = std::string(name);
+  for (auto& node : _nodes) node.store(nullptr);
+}
+
+ReadyTable::~ReadyTable() {
+  for (auto& node : _nodes) {
+    auto n = node.load();
+    if (!n) continue;
+    for (auto& leaf : n->leaves) delete leaf.load();
+    delete n;
+  }
+}
+
+std::atomic<int>* ReadyTable::GetSlot(uint64_t key) {
+  if (key >> (kRootBits + kNodeBits + kLeafBits)) {
+    std::lock_guard<std::mutex> lock(_table_mutex);
+    return &_ready_table[key];
+  }
+  auto& root = _nodes[key >> (kNodeBits + kLeafBits)];
+  auto node = root.load(std::memory_order_acquire);
+  if (!node) {
+    // zeros, i.e., no leaves
+    auto fresh = new Node();
+    if (root.compare_exchange_strong(node, fresh)) {
+      node = fresh;
+    } else {
+      delete fresh;
+    }
+  }
+  auto& slot = node->leaves[(key >> kLeafBits) & ((1 << kNodeBits) - 1)];
+  auto leaf = slot.load(std::memory_order_acquire);
+  if (!leaf) {
+    auto fresh = new Leaf();
+    if (slot.compare_exchange_strong(leaf, fresh)) {
+      leaf = fresh;
+    } else {
+      delete fresh;
+    }
+  }
+  return &leaf->count[key & ((1 << kLeafBits) - 1)];
+}
+
 // below are methods for accessing/modifying the _ready_table
 bool ReadyTable::IsKeyReady(uint64_t key) {
-  std::lock_guard<std::mutex> lock(_table_mutex);
-  return _ready_table[key] == (_ready_count);
+  return GetSlot(key)->load() == (_ready_count);
 }
 
 int ReadyTable::AddReadyCount(uint64_t key) {
-  std::lock_guard<std::mutex> lock(_table_mutex);
-  BPS_CHECK_LT(_ready_table[key], _ready_count)
-      << _table_name << ": " << _ready_table[key] << ", " << (_ready_count);
-  return ++_ready_table[key];
+  int cnt = GetSlot(key)->fetch_add(1) + 1;
+  BPS_CHECK_LE(cnt, _ready_count)
+      << _table_name << ": " << cnt - 1 << ", " << (_ready_count);
+  if (cnt == _ready_count) {
+    NotifyReady(key);
+  }
+  return cnt;
 }
 
 int ReadyTable::SetReadyCount(uint64_t key, int cnt) {
-  std::lock_guard<std::mutex> lock(_table_mutex);
-  _ready_table[key] = cnt;
+  GetSlot(key)->store(cnt);
+  if (cnt == _ready_count) {
+    NotifyReady(key);
+  }
+  return cnt;
+}
+
+void ReadyTable::ClearReadyCount(uint64_t key) { GetSlot(key)->store(0); }
+
+int ReadyTable::AddListener(Listener listener) {
+  std::lock_guard<std::shared_mutex> lock(_listener_mutex);
+  int id = _next_listener_id++;
+  _listeners[id] = std::move(listener);
+  return id;
+}
+
+void ReadyTable::RemoveListener(int id) {
+  std::lock_guard<std::shared_mutex> lock(_listener_mutex);
+  _listeners.erase(id);
 }
 
-void ReadyTable::ClearReadyCount(uint64_t key) {
-  std::lock_guard<std::mutex> lock(_table_mutex);
-  _ready_table[key] = 0;
+void ReadyTable::NotifyReady(uint64_t key) {
+  std::shared_lock<std::shared_mutex> lock(_listener_mutex);
+  for (auto& it : _listeners) {
+    it.second(key);
+  }
 }
 
 }  // namespace common
@@ -16,7 +16,12 @@
 #ifndef BYTEPS_READY_TABLE_H
 #define BYTEPS_READY_TABLE_H
 
+#include <atomic>
+#include <functional>
+#include <map>
 #include <mutex>
+#include <shared_mutex>
+#include <string>
 #include <thread>
 #include <unordered_map>
 
@@ -25,23 +30,54 @@ namespace common {
 
 class ReadyTable {
  public:
-  ReadyTable(int ready_count, const char* name) {
-    _ready_count = ready_count;
-    _table_name = std::string(name);
-  }
-  // methods to access or modify the _ready_table
+  ReadyTable(int ready_count, const char* name);
+  ~ReadyTable();
+  // methods to access or modify the _ready_table, lock-free for keys below
+  // 2^32, which all of declared_key << 16 | partition are
   bool IsKeyReady(uint64_t key);
   int AddReadyCount(uint64_t key);
   int SetReadyCount(uint64_t key, int cnt);
   void ClearReadyCount(uint64_t key);
 
+  // listeners are called (outside the table lock) with a key once it
+  // becomes ready
+  using Listener = std::function<void(uint64_t)>;
+  int AddListener(Listener listener);
+  void RemoveListener(int id);
+
  private:
-  // (key, ready_signal_count) pair, only valid for root device
-  std::unordered_map<uint64_t, int> _ready_table;
-  // use this mutex to access/modify the _ready_table
+  void NotifyReady(uint64_t key);
+  // the counter of a key, allocated on its first use and kept until the
+  // table is destroyed
+  std::atomic<int>* GetSlot(uint64_t key);
+
+  // The counters of keys below 2^32 are the leaves of a radix tree: the top
+  // 12 of the 32 bits pick a node, the next 12 bits a leaf of the node, and
+  // the low 8 bits a counter of the leaf. So a leaf has 256 partitions of a
+  // tensor, and a node 16 tensors. Nodes and leaves are installed with CAS.
+  static const int kLeafBits = 8;
+  static const int kNodeBits = 12;
+  static const int kRootBits = 12;
+  struct Leaf {
+    std::atomic<int> count[1 << kLeafBits];
+  };
+  struct Node {
+    std::atomic<Leaf*> leaves[1 << kNodeBits];
+  };
+  std::atomic<Node*> _nodes[1 << kRootBits];
+
+  // (key, ready_signal_count) pair of the larger keys, only valid for root
+  // device. The map is node-based, so a counter does not move on rehash.
+  std::unordered_map<uint64_t, std::atomic<int>> _ready_table;
+  // use this mutex to find or insert a key in _ready_table
   std::mutex _table_mutex;
   int _ready_count;
   std::string _table_name;
+  // shared while notifying, so that several signaling threads notify at
+  // once, and RemoveListener() waits for in-flight calls
+  std::shared_mutex _listener_mutex;
+  std::map<int, Listener> _listeners;
+  int _next_listener_id = 0;
 };
 
 }  // namespace common
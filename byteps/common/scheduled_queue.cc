@@ -15,15 +15,14 @@
 
 #include "scheduled_queue.h"
 
-#include <algorithm>
-
 #include "global.h"
 #include "logging.h"
 
 namespace byteps {
 namespace common {
 
-BytePSScheduledQueue::BytePSScheduledQueue(QueueType type) {
+BytePSScheduledQueue::BytePSScheduledQueue(
+    QueueType type, std::shared_ptr<TaskNotifier> notifier) {
   if (type == REDUCE && BytePSGlobal::GetNccl()->IsSignalRoot()) {
     _is_scheduled = true;
   } else {
@@ -77,23 +76,33 @@ BytePSScheduledQueue::BytePSScheduledQueue(QueueType type) {
     default:
       break;
   }
+  _sq.reset(new IndexedTaskQueue<TensorTableEntry>(_is_scheduled));
+  _notifier = notifier ? notifier : std::make_shared<TaskNotifier>();
+  _wait_for_event = false;
+  // tasks waiting on the ready table are parked until their key is ready
+  if (_rt) {
+    _rt_listener = _rt->AddListener([this](uint64_t key) {
+      {
+        std::lock_guard<std::mutex> lock(_mutex);
+        _sq->unpark(key);
+      }
+      _notifier->Notify();
+    });
+  }
+}
+
+BytePSScheduledQueue::~BytePSScheduledQueue() {
+  if (_rt) {
+    _rt->RemoveListener(_rt_listener);
+  }
 }
 
 void BytePSScheduledQueue::addTask(std::shared_ptr<TensorTableEntry> entry) {
-  std::lock_guard<std::mutex> lock(_mutex);
-  _sq.push_back(entry);
-  if (_is_scheduled) {
-    // TODO: below can be optimized to O(n) using insertion sort
-    std::sort(
-        _sq.begin(), _sq.end(),
-        [](std::shared_ptr<TensorTableEntry> a,
-           std::shared_ptr<TensorTableEntry> b) {
-          if (a->priority == b->priority) {
-            return (a->key < b->key);  // from the first partition to the last
-          }
-          return (a->priority > b->priority);  // from higher priority to lower
-        });
+  {
+    std::lock_guard<std::mutex> lock(_mutex);
+    _sq->push(entry);
   }
+  _notifier->Notify();
   BPS_CHECK(entry->tensor_name != "");
   BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
                  << " addTask: " << entry->tensor_name << " key: " << entry->key
@@ -124,90 +133,95 @@ void BytePSScheduledQueue::recorderTs(std::shared_ptr<TensorTableEntry> task) {
 
 std::shared_ptr<TensorTableEntry> BytePSScheduledQueue::getTask() {
   std::lock_guard<std::mutex> lock(_mutex);
-  std::shared_ptr<TensorTableEntry> task;
-  // TODO: below can be optimized -- if we take task from the tail, erase() can
-  // be faster
-  for (auto it = _sq.begin(); it != _sq.end(); ++it) {
-    if ((*it)->ready_event) {
-      if (!(*it)->ready_event->Ready()) {
-        continue;
-      }
-    }
-    if (_is_scheduled) {
-      if ((*it)->len > _credits) {
-        continue;
+  using Queue = IndexedTaskQueue<TensorTableEntry>;
+  bool wait_for_event = false;
+  auto task = _sq->pop(_credits, [this, &wait_for_event](
+      const std::shared_ptr<TensorTableEntry> &entry) {
+    if (entry->ready_event) {
+      if (!entry->ready_event->Ready()) {
+        wait_for_event = true;
+        return Queue::NOT_READY;
       }
     }
     if (_rt) {
-      if (!_rt->IsKeyReady((*it)->key)) {
-        continue;
+      if (!_rt->IsKeyReady(entry->key)) {
+        return Queue::PARK;
       }
-      _rt->ClearReadyCount((*it)->key);
-    }
-    task = *it;
-    _sq.erase(it);
-    if (_is_scheduled) {
-      _credits -= task->len;
+      _rt->ClearReadyCount(entry->key);
     }
-
-    BPS_CHECK(task->tensor_name != "");
-    BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
-                   << " getTask: " << task->tensor_name << " key: " << task->key
-                   << " rank: " << BytePSGlobal::GetLocalRank();
-    task->ready_event = nullptr;
-    // Add for profiling communication traces
-    recorderTs(task);
-    return task;
+    return Queue::READY;
+  });
+  _wait_for_event = wait_for_event;
+  if (!task) {
+    return nullptr;
+  }
+  if (_is_scheduled) {
+    _credits -= task->len;
   }
-  return nullptr;
+
+  BPS_CHECK(task->tensor_name != "");
+  BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
+                 << " getTask: " << task->tensor_name << " key: " << task->key
+                 << " rank: " << BytePSGlobal::GetLocalRank();
+  task->ready_event = nullptr;
+  // Add for profiling communication traces
+  recorderTs(task);
+  return task;
 }
 
 std::shared_ptr<TensorTableEntry> BytePSScheduledQueue::getTask(uint64_t key) {
   BPS_CHECK(!_is_scheduled);
   std::lock_guard<std::mutex> lock(_mutex);
-  std::shared_ptr<TensorTableEntry> task;
-  for (auto it = _sq.begin(); it != _sq.end(); ++it) {
-    if ((*it)->ready_event) {
-      BPS_CHECK((*it)->ready_event->Ready());
-    }
-    if ((*it)->key != (uint64_t)key) {
-      continue;
-    }
-    task = *it;
-    _sq.erase(it);
-
-    BPS_CHECK(task->tensor_name != "");
-    BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
-                   << " getTask(key): " << task->tensor_name
-                   << " key: " << task->key
-                   << " rank: " << BytePSGlobal::GetLocalRank();
-    task->ready_event = nullptr;
-    // Add for profiling communication traces
-    recorderTs(task);
-    return task;
+  auto task = _sq->pop(key);
+  if (!task) {
+    return nullptr;
+  }
+  if (task->ready_event) {
+    BPS_CHECK(task->ready_event->Ready());
   }
-  return nullptr;
+
+  BPS_CHECK(task->tensor_name != "");
+  BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
+                 << " getTask(key): " << task->tensor_name
+                 << " key: " << task->key
+                 << " rank: " << BytePSGlobal::GetLocalRank();
+  task->ready_event = nullptr;
+  // Add for profiling communication traces
+  recorderTs(task);
+  return task;
 }
 
 uint32_t BytePSScheduledQueue::pendingSize() {
   std::lock_guard<std::mutex> lock(_mutex);
-  return _sq.size();
+  return _sq->size();
 }
 
 void BytePSScheduledQueue::reportFinish(int size) {
   if (_is_scheduled) {
-    std::lock_guard<std::mutex> lock(_mutex);
-    _credits += size;
+    {
+      std::lock_guard<std::mutex> lock(_mutex);
+      _credits += size;
+    }
+    _notifier->Notify();
   }
   return;
 }
 
 void BytePSScheduledQueue::reset(uint64_t key, int cnt) {
-  std::lock_guard<std::mutex> lock(_mutex);
-  if(_rt) {
+  // no _mutex here: the table notifies our listener, which takes it
+  if (_rt) {
     _rt->SetReadyCount(key, cnt);
   }
 }
 
+void BytePSScheduledQueue::wait(uint64_t epoch) {
+  if (BytePSGlobal::IsCoreLoopPolling() || _wait_for_event) {
+    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    return;
+  }
+  // the timeout only bounds how long a loop takes to see ShouldShutdown()
+  _notifier->Wait(epoch, std::chrono::microseconds(10000));
+}
+
 }  // namespace common
 }  // namespace byteps
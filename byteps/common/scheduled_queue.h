@@ -21,6 +21,8 @@
 #include <unordered_map>
 #include <vector>
 #include "common.h"
+#include "indexed_queue.h"
+#include "notifier.h"
 #include "ready_table.h"
 
 namespace byteps {
@@ -28,7 +30,9 @@ namespace common {
 
 class BytePSScheduledQueue {
  public:
-  BytePSScheduledQueue(QueueType type);
+  BytePSScheduledQueue(QueueType type,
+                       std::shared_ptr<TaskNotifier> notifier = nullptr);
+  ~BytePSScheduledQueue();
   QueueType getQueueType() { return _qt; }
   void addTask(std::shared_ptr<TensorTableEntry>);
   void recorderTs(std::shared_ptr<TensorTableEntry>);
@@ -38,14 +42,27 @@ class BytePSScheduledQueue {
   void reportFinish(int size);
   void reset(uint64_t key, int cnt);
 
+  // Read the epoch before getTask(); if no task is returned, wait(epoch)
+  // blocks until addTask, reportFinish or the ready table may let getTask()
+  // make progress.
+  uint64_t getEpoch() { return _notifier->GetEpoch(); }
+  void wait(uint64_t epoch);
+  void notify() { _notifier->Notify(); }
+  std::shared_ptr<TaskNotifier> getNotifier() { return _notifier; }
+
  private:
-  // TODO: use priority queue or heap
-  std::vector<std::shared_ptr<TensorTableEntry>> _sq;
+  // ordered by (priority, key) when scheduled, FIFO otherwise
+  std::unique_ptr<IndexedTaskQueue<TensorTableEntry>> _sq;
   std::mutex _mutex;
   uint64_t _credits;
   bool _is_scheduled;
   QueueType _qt;
   ReadyTable *_rt;
+  int _rt_listener;
+  std::shared_ptr<TaskNotifier> _notifier;
+  // the last getTask() skipped tasks whose ready_event was not done yet,
+  // which nobody notifies us about
+  std::atomic_bool _wait_for_event;
 };
 
 }  // namespace common
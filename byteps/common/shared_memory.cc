@@ -25,11 +25,45 @@
 namespace byteps {
 namespace common {
 
+BytePSSharedMemory::BytePSSharedMemory() {
+  auto env = getenv("BYTEPS_SHM_ARENA");
+  _use_arena = env && atoi(env);
+  env = getenv("BYTEPS_SHM_ARENA_BYTES");
+  _arena_segment_bytes = env ? strtoull(env, nullptr, 10) : (1ull << 30);
+  env = getenv("BYTEPS_SHM_ARENA_HUGEPAGE");
+  _arena_hugepage = env && atoi(env);
+  if (_use_arena) {
+    BPS_LOG(DEBUG) << "Shared memory arena segments of "
+                   << _arena_segment_bytes << " bytes"
+                   << (_arena_hugepage ? ", huge pages" : "");
+  }
+}
+
 void* BytePSSharedMemory::openSharedMemory(const std::string& prefix,
                                            uint64_t key, size_t size) {
   size = BytePSGlobal::RoundUpToPageSize(size);
   std::string shm_name(prefix);
   shm_name += std::to_string(key);
+  if (_use_arena) {
+    ShmArena* arena;
+    {
+      std::lock_guard<std::mutex> lock(_shm_mu);
+      auto& ptr = _arenas[prefix];
+      if (!ptr) {
+        ptr.reset(new ShmArena(prefix + "Arena", _arena_segment_bytes,
+                               _arena_hugepage));
+      }
+      arena = ptr.get();
+    }
+    void* ptr = arena->Open(key, size);
+    // pins (and places) the pages of the region only
+    CUDA_CALL(cudaHostRegister(ptr, size, cudaHostRegisterDefault));
+
+    std::lock_guard<std::mutex> lock(_shm_mu);
+    _key_shm_addr[shm_name] = ptr;
+    _key_shm_size[shm_name] = size;
+    return ptr;
+  }
   int shm_fd = shm_open(shm_name.c_str(), O_CREAT | O_RDWR, 0666);
   BPS_CHECK_GE(shm_fd, 0) << "shm_open failed for " << shm_name << " " << strerror(errno);
 
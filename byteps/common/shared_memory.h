@@ -22,25 +22,31 @@
 #include <cstdio>
 #include <cstdlib>
 #include <cstring>
+#include <memory>
 #include <mutex>
 #include <thread>
 #include <unordered_map>
 #include <vector>
 #include "logging.h"
+#include "shm_arena.h"
 
 namespace byteps {
 namespace common {
 
 class BytePSSharedMemory {
  public:
-  BytePSSharedMemory() {}
+  BytePSSharedMemory();
 
   ~BytePSSharedMemory() {
     for (auto &it : _key_shm_addr) {
       CUDA_CALL(cudaHostUnregister(it.second));
-      munmap(it.second, _key_shm_size[it.first]);
-      shm_unlink(it.first.c_str());
+      if (!_use_arena) {
+        munmap(it.second, _key_shm_size[it.first]);
+        shm_unlink(it.first.c_str());
+      }
     }
+    // unmaps and unlinks the segments
+    _arenas.clear();
 
     BPS_LOG(DEBUG) << "Clear shared memory: all BytePS shared memory "
                       "released/unregistered.";
@@ -53,6 +59,12 @@ class BytePSSharedMemory {
   std::unordered_map<std::string, void *> _key_shm_addr;
   std::unordered_map<std::string, size_t> _key_shm_size;
 
+  // BYTEPS_SHM_ARENA: the keys of a prefix are regions of a ShmArena
+  bool _use_arena = false;
+  size_t _arena_segment_bytes;
+  bool _arena_hugepage;
+  std::unordered_map<std::string, std::unique_ptr<ShmArena>> _arenas;
+
   std::mutex _shm_mu;
 };
 
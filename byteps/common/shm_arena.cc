@@ -0,0 +1,185 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#include "shm_arena.h"
+
+#include <fcntl.h>
+#include <sched.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <atomic>
+#include <cerrno>
+#include <cstring>
+
+#include "logging.h"
+
+namespace byteps {
+namespace common {
+
+// Lives in the shared memory of all the processes. It is never constructed:
+// the new shm file is zeros, which is an empty index with an unlocked lock.
+struct ShmArena::Index {
+  std::atomic<uint32_t> lock;
+  uint32_t num_segments;
+  uint64_t num_keys;
+  uint64_t segment_size[kMaxSegments];
+  uint64_t segment_used[kMaxSegments];
+  struct Entry {
+    uint64_t key;
+    uint64_t offset;
+    uint64_t size;
+    uint64_t segment;
+  } entries[kMaxKeys];
+  // hash table of the keys, 1 + the entry of a key or 0, linear probing
+  uint32_t slots[2 * kMaxKeys];
+};
+
+static_assert(ATOMIC_INT_LOCK_FREE == 2,
+              "the index lock is shared by processes, it must be lock-free");
+
+ShmArena::ShmArena(const std::string& name, size_t segment_bytes,
+                   bool hugepage)
+    : _name(name), _segment_bytes(segment_bytes), _hugepage(hugepage) {
+  _align = hugepage ? (2 << 20) : sysconf(_SC_PAGESIZE);
+  BPS_CHECK_GT(_align, 0);
+  _index = static_cast<Index*>(MapShm(_name + "_Index", sizeof(Index)));
+  _segments.resize(kMaxSegments, nullptr);
+}
+
+ShmArena::~ShmArena() {
+  Lock();
+  auto num_segments = _index->num_segments;
+  for (uint32_t i = 0; i < num_segments; ++i) {
+    if (_segments[i]) munmap(_segments[i], _index->segment_size[i]);
+    shm_unlink((_name + "_" + std::to_string(i)).c_str());
+  }
+  Unlock();
+  munmap(_index, sizeof(Index));
+  shm_unlink((_name + "_Index").c_str());
+  BPS_LOG(DEBUG) << "Clear shared memory arena " << _name << ": "
+                 << num_segments << " segment(s), " << _regions.size()
+                 << " key(s) of this process";
+}
+
+void* ShmArena::MapShm(const std::string& name, size_t size) {
+  int fd = shm_open(name.c_str(), O_CREAT | O_RDWR, 0666);
+  BPS_CHECK_GE(fd, 0) << "shm_open failed for " << name << " "
+                      << strerror(errno);
+  // the size is the same in all processes, so it keeps the content
+  BPS_CHECK_GE(ftruncate(fd, size), 0) << name << " " << strerror(errno);
+  void* ptr = mmap(0, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  BPS_CHECK_NE(ptr, MAP_FAILED) << name << " " << strerror(errno);
+  // the mapping stays valid
+  close(fd);
+  if (_hugepage && madvise(ptr, size, MADV_HUGEPAGE) != 0) {
+    BPS_LOG(WARNING) << "madvise(MADV_HUGEPAGE) failed for " << name << " "
+                     << strerror(errno)
+                     << ", check /sys/kernel/mm/transparent_hugepage/"
+                        "shmem_enabled";
+  }
+  return ptr;
+}
+
+void ShmArena::Lock() {
+  uint32_t unlocked = 0;
+  while (!_index->lock.compare_exchange_weak(unlocked, 1,
+                                             std::memory_order_acquire)) {
+    unlocked = 0;
+    sched_yield();
+  }
+}
+
+void ShmArena::Unlock() { _index->lock.store(0, std::memory_order_release); }
+
+char* ShmArena::MapSegment(uint32_t i) {
+  if (!_segments[i]) {
+    _segments[i] = static_cast<char*>(MapShm(_name + "_" + std::to_string(i),
+                                             _index->segment_size[i]));
+  }
+  return _segments[i];
+}
+
+void* ShmArena::Open(uint64_t key, size_t size) {
+  std::lock_guard<std::mutex> lock(_mu);
+  auto it = _regions.find(key);
+  if (it != _regions.end()) return it->second;
+
+  size_t aligned_size = (size + _align - 1) / _align * _align;
+  Lock();
+  Index::Entry* entry = nullptr;
+  // the top bits of a Fibonacci hash, the low bits of keys are often zeros
+  const size_t num_slots = 2 * kMaxKeys;
+  static_assert(2 * kMaxKeys == (1 << 17), "the hash takes 17 bits");
+  size_t slot = (key * 0x9e3779b97f4a7c15ull) >> (64 - 17);
+  for (; _index->slots[slot]; slot = (slot + 1) % num_slots) {
+    if (_index->entries[_index->slots[slot] - 1].key == key) {
+      entry = &_index->entries[_index->slots[slot] - 1];
+      break;
+    }
+  }
+  if (!entry && _index->num_keys < kMaxKeys) {
+    // the first segment with room, or a new one
+    uint32_t segment = 0;
+    while (segment < _index->num_segments &&
+           _index->segment_size[segment] - _index->segment_used[segment] <
+               aligned_size) {
+      ++segment;
+    }
+    if (segment == _index->num_segments && segment < kMaxSegments) {
+      _index->segment_size[segment] = std::max(
+          aligned_size, (_segment_bytes + _align - 1) / _align * _align);
+      _index->segment_used[segment] = 0;
+      MapSegment(segment);
+      ++_index->num_segments;
+    }
+    if (segment < _index->num_segments) {
+      _index->slots[slot] = _index->num_keys + 1;
+      entry = &_index->entries[_index->num_keys++];
+      entry->key = key;
+      entry->segment = segment;
+      entry->offset = _index->segment_used[segment];
+      entry->size = aligned_size;
+      _index->segment_used[segment] += aligned_size;
+    }
+  }
+  Index::Entry found = entry ? *entry : Index::Entry();
+  char* base = entry ? MapSegment(entry->segment) : nullptr;
+  Unlock();
+
+  BPS_CHECK(entry) << _name << " is full: " << kMaxKeys << " keys, "
+                   << kMaxSegments << " segments";
+  BPS_CHECK_GE(found.size, size)
+      << "key " << key << " has " << found.size << " bytes in " << _name
+      << ", but " << size << " are opened. It may be left by an earlier job, "
+      << "remove /dev/shm/" << _name << "_*";
+  void* ptr = base + found.offset;
+  _regions[key] = ptr;
+  BPS_LOG(TRACE) << "opened key " << key << " of " << size << " bytes in "
+                 << _name << "_" << found.segment << " at " << found.offset;
+  return ptr;
+}
+
+size_t ShmArena::NumSegments() {
+  Lock();
+  size_t n = _index->num_segments;
+  Unlock();
+  return n;
+}
+
+}  // namespace common
+}  // namespace byteps
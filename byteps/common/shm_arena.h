@@ -0,0 +1,90 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_SHM_ARENA_H
+#define BYTEPS_SHM_ARENA_H
+
+#include <stdint.h>
+
+#include <mutex>
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+namespace byteps {
+namespace common {
+
+/*!
+ * \brief Shared memory of many keys in a few large segments
+ *
+ * \par
+ * Instead of one shm file and mapping per key, the regions of the keys are
+ * carved out of segments of `segment_bytes` (or one key, if larger), named
+ * `<name>_<i>`. An index in `<name>_Index` maps every key to its segment and
+ * offset. All the local processes that open the arena with the same name
+ * share the index: the first one to open a key allocates its region, the
+ * others map the segment on their first key in it and get the same region.
+ *
+ * \par
+ * Regions are aligned to pages, or to 2 MB huge pages with `hugepage`, for
+ * which the segments are advised to be backed by transparent huge pages. It
+ * does not depend on CUDA: pinning the regions is up to the caller.
+ */
+class ShmArena {
+ public:
+  ShmArena(const std::string& name, size_t segment_bytes, bool hugepage);
+  // unmaps and unlinks the index and the segments
+  ~ShmArena();
+
+  /*!
+   * \brief the region of a key
+   *
+   * \param key key of the region, unique in the arena
+   * \param size bytes of the region, the same in all processes
+   * \return the region, aligned to pages
+   */
+  void* Open(uint64_t key, size_t size);
+
+  // segments allocated by all the processes so far
+  size_t NumSegments();
+
+  static const size_t kMaxSegments = 1024;
+  static const size_t kMaxKeys = 1 << 16;
+
+ private:
+  struct Index;
+
+  void Lock();
+  void Unlock();
+  // maps segment i of the index, must hold the lock
+  char* MapSegment(uint32_t i);
+  void* MapShm(const std::string& name, size_t size);
+
+  std::string _name;
+  size_t _segment_bytes;
+  bool _hugepage;
+  size_t _align;
+
+  Index* _index;
+  // the mappings of this process, by segment and by key
+  std::vector<char*> _segments;
+  std::unordered_map<uint64_t, void*> _regions;
+  std::mutex _mu;
+};
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_SHM_ARENA_H
@@ -0,0 +1,206 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_SERVER_BALANCER_H
+#define BYTEPS_SERVER_BALANCER_H
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <memory>
+#include <mutex>
+#include <sstream>
+#include <string>
+#include <unordered_set>
+#include <vector>
+#include "ps/ps.h"
+
+namespace byteps {
+namespace server {
+
+/**
+ * \brief Assigns keys to engine threads and measures how busy each thread
+ * is. A new key goes to the thread with the fewest bytes assigned. With
+ * rebalancing on, keys are then moved from the busiest thread to the least
+ * busy one between iterations.
+ *
+ * Time is cut into windows. A window in which the busy time of the busiest
+ * and the least busy thread differ by more than `threshold` of the window
+ * is followed by a moving window: the keys of the busiest thread that reach
+ * Rebalance() are moved until about half of the difference has moved, or
+ * until one of them comes round again (a whole iteration has passed). The
+ * window after that is only observed, so that every decision is made on the
+ * load measured after the previous moves.
+ */
+class EngineBalancer {
+ public:
+  void Init(size_t num_threads, bool rebalance, uint64_t window_ms,
+            double threshold, bool log_util) {
+    CHECK_GE(num_threads, 1);
+    num_threads_ = num_threads;
+    rebalance_ = rebalance;
+    log_util_ = log_util;
+    threshold_ = threshold;
+    window_ns_ = window_ms * 1000000;
+    busy_ns_.reset(new std::atomic<uint64_t>[num_threads]);
+    for (size_t i = 0; i < num_threads; ++i) busy_ns_[i] = 0;
+    acc_len_.assign(num_threads, 0);
+    start_ns_ = window_begin_ns_ = Now();
+    window_busy_.assign(num_threads, 0);
+    window_end_ns_ = window_begin_ns_ + window_ns_;
+  }
+
+  // engine thread `tid` spent `ns` on a message
+  void AddBusy(size_t tid, uint64_t ns) {
+    busy_ns_[tid].fetch_add(ns, std::memory_order_relaxed);
+    if (Now() >= window_end_ns_.load(std::memory_order_relaxed)) {
+      CloseWindow();
+    }
+  }
+
+  // the engine thread of a new key of `len` bytes
+  size_t Assign(size_t len) {
+    std::lock_guard<std::mutex> lock(mu_);
+    size_t tid = 0;
+    for (size_t i = 1; i < num_threads_; ++i) {
+      if (acc_len_[i] < acc_len_[tid]) tid = i;
+    }
+    acc_len_[tid] += len;
+    return tid;
+  }
+
+  /**
+   * \brief Called for a key of thread `tid` when it can move, i.e., none of
+   * its messages is queued and no pull of it is pending on `tid`.
+   * \param cost the busy time of the key in its last iteration
+   * \return the thread the key belongs to from now on
+   */
+  size_t Rebalance(uint64_t key, size_t tid, size_t len, uint64_t cost) {
+    if (!rebalance_ || (int)tid != hot_.load(std::memory_order_relaxed)) {
+      return tid;
+    }
+    std::lock_guard<std::mutex> lock(mu_);
+    if ((int)tid != hot_) return tid;
+    if (!seen_keys_.insert(key).second) {
+      hot_ = -1;  // a whole iteration has passed, enough for this window
+      return tid;
+    }
+    seen_ns_ += cost;
+    if (cost == 0 || moved_ns_ + cost > shed_ * seen_ns_) return tid;
+    moved_ns_ += cost;
+    acc_len_[tid] -= len;
+    acc_len_[cold_] += len;
+    ++moved_keys_;
+    return cold_;
+  }
+
+  // the busy fraction of every engine thread since Init()
+  std::vector<double> GetUtilization() {
+    double elapsed = std::max<uint64_t>(Now() - start_ns_, 1);
+    std::vector<double> util;
+    for (size_t i = 0; i < num_threads_; ++i) {
+      util.push_back(busy_ns_[i].load(std::memory_order_relaxed) / elapsed);
+    }
+    return util;
+  }
+
+  static std::string ToString(const std::vector<double>& util) {
+    std::ostringstream os;
+    os.precision(2);
+    for (size_t i = 0; i < util.size(); ++i) {
+      os << (i ? " " : "") << std::fixed << util[i];
+    }
+    return os.str();
+  }
+
+ private:
+  static uint64_t Now() {
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+               std::chrono::steady_clock::now().time_since_epoch())
+        .count();
+  }
+
+  void CloseWindow() {
+    std::unique_lock<std::mutex> lock(mu_, std::try_to_lock);
+    if (!lock.owns_lock()) return;  // another thread is closing it
+    auto now = Now();
+    if (now < window_end_ns_) return;
+
+    double elapsed = std::max<uint64_t>(now - window_begin_ns_, 1);
+    std::vector<uint64_t> busy(num_threads_);
+    size_t hot = 0, cold = 0;
+    for (size_t i = 0; i < num_threads_; ++i) {
+      auto total = busy_ns_[i].load(std::memory_order_relaxed);
+      busy[i] = total - window_busy_[i];
+      window_busy_[i] = total;
+      if (busy[i] > busy[hot]) hot = i;
+      if (busy[i] < busy[cold]) cold = i;
+    }
+    if (log_util_) {
+      std::vector<double> util;
+      for (auto b : busy) util.push_back(b / elapsed);
+      LOG(INFO) << "BytePS server engine utilization: " << ToString(util)
+                << (moving_ ? ", moved " : "")
+                << (moving_ ? std::to_string(moved_keys_) + " keys" : "");
+    }
+
+    if (moving_) {
+      // only observe the next window
+      moving_ = false;
+      hot_ = -1;
+    } else if (rebalance_ && num_threads_ > 1 &&
+               busy[hot] - busy[cold] > threshold_ * elapsed) {
+      moving_ = true;
+      cold_ = cold;
+      shed_ = (double)(busy[hot] - busy[cold]) / (2 * busy[hot]);
+      seen_keys_.clear();
+      seen_ns_ = moved_ns_ = 0;
+      moved_keys_ = 0;
+      hot_ = hot;
+    }
+    window_begin_ns_ = now;
+    window_end_ns_ = now + window_ns_;
+  }
+
+  size_t num_threads_ = 0;
+  bool rebalance_ = false;
+  bool log_util_ = false;
+  double threshold_ = 0;
+  uint64_t window_ns_ = 0;
+  uint64_t start_ns_ = 0;
+  // accumulated busy time of each thread, written by the engine threads
+  std::unique_ptr<std::atomic<uint64_t>[]> busy_ns_;
+  std::atomic<uint64_t> window_end_ns_{0};
+  // the thread whose keys are being moved, -1 if none
+  std::atomic<int> hot_{-1};
+
+  std::mutex mu_;  // protects everything below
+  std::vector<uint64_t> acc_len_;  // bytes of the keys of each thread
+  uint64_t window_begin_ns_ = 0;
+  std::vector<uint64_t> window_busy_;  // busy_ns_ at the window begin
+  bool moving_ = false;
+  size_t cold_ = 0;
+  double shed_ = 0;  // the fraction of the load of hot_ to move
+  std::unordered_set<uint64_t> seen_keys_;
+  uint64_t seen_ns_ = 0;
+  uint64_t moved_ns_ = 0;
+  size_t moved_keys_ = 0;
+};
+
+}  // namespace server
+}  // namespace byteps
+
+#endif  // BYTEPS_SERVER_BALANCER_H
@@ -0,0 +1,309 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_SERVER_LOADGEN_H
+#define BYTEPS_SERVER_LOADGEN_H
+
+#include <atomic>
+#include <condition_variable>
+#include <cstring>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+#include "server.h"
+
+namespace byteps {
+namespace server {
+
+/**
+ * \brief Drives BytePSHandler in-process with synthetic workers, so that the
+ * server throughput (e.g., vs. BYTEPS_SERVER_ENGINE_THREAD) can be measured
+ * on one box without a network:
+ *
+ *   BYTEPS_SERVER_LOADGEN_WORKERS=8 python3 -c "import byteps.server"
+ *
+ * Each worker pushes every key then pulls every key, and waits for all the
+ * pulls before the next round, like a BytePS worker does per step. In sync
+ * mode rounds are fenced across workers, so that every pull can be checked
+ * against the expected sum. In async mode workers run freely, and a pull is
+ * checked against the least the staleness bound guarantees.
+ *   BYTEPS_SERVER_LOADGEN_KEYS:  number of keys (default 64)
+ *   BYTEPS_SERVER_LOADGEN_BYTES: bytes per key (default 1024000)
+ *   BYTEPS_SERVER_LOADGEN_ITERS: number of rounds (default 20)
+ *   BYTEPS_SERVER_LOADGEN_STRAGGLER_US: extra time one worker spends in each
+ *   round, the workers take turns (default 0)
+ *   BYTEPS_SERVER_LOADGEN_BROADCAST: broadcast instead, worker 0 pushes the
+ *   round number and every worker pulls it (default 0)
+ *   BYTEPS_SERVER_LOADGEN_COMPRESSOR: register the keys with a compressor and
+ *   push compressed, onebit, topk or randomk (with a shared seed) at k=1%,
+ *   sync mode only (default none)
+ */
+class LoadGenWorker {
+ public:
+  void OnResponse(bool push) {
+    std::lock_guard<std::mutex> lock(mu_);
+    ++(push ? push_acks_ : pull_acks_);
+    cond_.notify_all();
+  }
+
+  void WaitPushAcks(size_t n) {
+    std::unique_lock<std::mutex> lock(mu_);
+    cond_.wait(lock, [this, n] { return push_acks_ >= n; });
+  }
+
+  void WaitPullAcks(size_t n) {
+    std::unique_lock<std::mutex> lock(mu_);
+    cond_.wait(lock, [this, n] { return pull_acks_ >= n; });
+  }
+
+  // the current round, 0 during the init
+  std::atomic<size_t> round{0};
+
+ private:
+  std::mutex mu_;
+  std::condition_variable cond_;
+  size_t push_acks_ = 0;
+  size_t pull_acks_ = 0;
+};
+
+// the kwargs of BYTEPS_SERVER_LOADGEN_COMPRESSOR
+common::compressor::kwargs_t LoadGenCompressorKwargs(const std::string& name) {
+  common::compressor::kwargs_t kwargs = {{"compressor_type", name}};
+  if (name != "onebit") kwargs["compressor_k"] = "0.01";
+  if (name == "randomk") {
+    kwargs["seed"] = "2020";
+    kwargs["compressor_randomk_shared_seed"] = "true";
+  }
+  return kwargs;
+}
+
+// checks a compressed pull of the sum of num_workers_ pushes of ones
+void CheckCompressedPull(const std::string& name,
+                         const ps::KVPairs<char>& res) {
+  auto vals = res.vals.data();
+  size_t size = res.vals.size();
+  auto key = DecodeKey(res.keys[0]);
+  if (name == "onebit") {
+    // all positive, unscaled
+    auto words = reinterpret_cast<const uint32_t*>(vals);
+    for (size_t i = 0; i < (size - sizeof(float)) / sizeof(uint32_t); ++i) {
+      CHECK_EQ(words[i], 0u) << "wrong signs for key=" << key;
+    }
+    CHECK_EQ(*reinterpret_cast<const float*>(vals + size - sizeof(float)),
+             1.0f) << "wrong scale for key=" << key;
+    return;
+  }
+  // topk sends (index, value) pairs, randomk the values and their seed
+  bool pairs = name == "topk";
+  size_t k = pairs ? size / 8 : (size - sizeof(uint64_t)) / sizeof(float);
+  auto floats = reinterpret_cast<const float*>(vals);
+  for (size_t i = 0; i < k; ++i) {
+    CHECK_EQ(pairs ? floats[2 * i + 1] : floats[i], (float)num_workers_)
+        << "wrong sum for key=" << key;
+  }
+}
+
+void RunLoadGen() {
+  size_t num_keys = GetEnv("BYTEPS_SERVER_LOADGEN_KEYS", 64);
+  size_t len = GetEnv("BYTEPS_SERVER_LOADGEN_BYTES", 1024000);
+  size_t iters = GetEnv("BYTEPS_SERVER_LOADGEN_ITERS", 20);
+  size_t straggler_us = GetEnv("BYTEPS_SERVER_LOADGEN_STRAGGLER_US", 0);
+  bool broadcast = GetEnv("BYTEPS_SERVER_LOADGEN_BROADCAST", 0);
+  std::string compressor = GetEnv("BYTEPS_SERVER_LOADGEN_COMPRESSOR", "");
+  len = len / sizeof(float) * sizeof(float);
+  CHECK_GT(len, 0);
+  CHECK(!sync_mode_ || !is_engine_blocking_)
+      << "the load generator drives the non-blocking engine or async mode";
+  CHECK(compressor.empty() || (sync_mode_ && !broadcast))
+      << "the load generator compresses in sync mode only";
+  num_workers_ = loadgen_workers_;
+  key_range_begin_ = 0;
+
+  // every worker pushes ones, so a pulled value must be num_workers_; each
+  // has its own buffer, so that the server reads as much memory as for real
+  std::vector<std::vector<float> > ones(
+      num_workers_, std::vector<float>(len / sizeof(float), 1));
+  std::vector<LoadGenWorker> workers(num_workers_);
+  // the compressor of each worker and its push of the round
+  std::vector<std::unique_ptr<common::compressor::Compressor> > compressors;
+  std::vector<common::compressor::tensor_t> compressed(num_workers_);
+  auto kwargs = LoadGenCompressorKwargs(compressor);
+  for (size_t w = 0; w < num_workers_ && !compressor.empty(); ++w) {
+    compressors.push_back(common::compressor::CompressorRegistry::Create(
+        kwargs, common::Align(len, common::BYTEPS_FLOAT32),
+        common::BYTEPS_FLOAT32));
+  }
+  response_hook_ = [&workers, broadcast, &compressor](
+                       const ps::KVMeta& req, const ps::KVPairs<char>& res) {
+    if (!req.push && !compressor.empty()) {
+      if (workers[req.sender].round) CheckCompressedPull(compressor, res);
+    } else if (!req.push) {
+      auto sum = *reinterpret_cast<float*>(res.vals.data());
+      if (broadcast) {
+        CHECK_EQ(sum, (float)workers[req.sender].round)
+            << "wrong round for key=" << DecodeKey(res.keys[0]);
+      } else if (sync_mode_) {
+        CHECK_EQ(sum, (float)num_workers_)
+            << "wrong sum for key=" << DecodeKey(res.keys[0]);
+      } else {
+        // the init value, the own pushes, and those every other worker
+        // must have done within the staleness bound
+        size_t round = workers[req.sender].round;
+        size_t others = 0;
+        if (staleness_ >= 0 && round > (size_t)staleness_) {
+          others = round - staleness_;
+        }
+        CHECK_GE(sum, (float)(1 + round + (num_workers_ - 1) * others))
+            << "too stale for key=" << DecodeKey(res.keys[0]);
+      }
+    }
+    workers[req.sender].OnResponse(req.push);
+  };
+
+  int cmd = common::GetCommandType(common::RequestType::kDefaultPushPull,
+                                   common::BYTEPS_FLOAT32);
+  int bcast_cmd = common::GetCommandType(common::RequestType::kBroadcast,
+                                         common::BYTEPS_FLOAT32);
+  int register_cmd = common::GetCommandType(
+      common::RequestType::kCompressedPushPull, common::BYTEPS_FLOAT32);
+  auto send = [&](int sender, size_t key, bool push, int req_cmd, char* vals,
+                  size_t vals_len) {
+    ps::KVMeta meta = {};
+    meta.cmd = req_cmd;
+    meta.push = push;
+    meta.sender = sender;
+    ps::KVPairs<char> data;
+    data.keys = {EncodeKey(key)};
+    if (push) {
+      data.vals = ps::SArray<char>(vals, vals_len, false);
+      data.lens = {(int)vals_len};
+    }
+    BytePSHandler(meta, data, nullptr);
+  };
+  auto make_request = [&](int sender, size_t key, bool push) {
+    auto round = workers[sender].round.load();
+    if (round && !compressor.empty()) {
+      send(sender, key, push, cmd, compressed[sender].data,
+           compressed[sender].size);
+    } else {
+      send(sender, key, push, (broadcast && round) ? bcast_cmd : cmd,
+           reinterpret_cast<char*>(ones[sender].data()), len);
+    }
+  };
+
+  // the same push of every key in one request, as the workers init
+  auto send_batch = [&](int sender, int req_cmd, const char* vals,
+                        size_t vals_len) {
+    ps::KVMeta meta = {};
+    meta.cmd = req_cmd;
+    meta.push = true;
+    meta.sender = sender;
+    ps::KVPairs<char> data;
+    data.vals = ps::SArray<char>(num_keys * vals_len);
+    for (size_t key = 0; key < num_keys; ++key) {
+      data.keys.push_back(EncodeKey(key));
+      data.lens.push_back((int)vals_len);
+      memcpy(data.vals.data() + key * vals_len, vals, vals_len);
+    }
+    BytePSHandler(meta, data, nullptr);
+  };
+
+  // the init push allocates the store, collect it before the first round,
+  // then register the compressor
+  std::string registration = common::compressor::Serialize(kwargs);
+  std::vector<std::thread> threads;
+  for (size_t w = 0; w < num_workers_; ++w) {
+    threads.emplace_back([&, w] {
+      send_batch(w, cmd, reinterpret_cast<char*>(ones[w].data()), len);
+      workers[w].WaitPushAcks(1);
+      if (compressor.empty()) return;
+      send_batch(w, register_cmd, registration.data(), registration.size());
+      workers[w].WaitPushAcks(2);
+    });
+  }
+  for (auto& t : threads) t.join();
+  threads.clear();
+
+  LOG(INFO) << "BytePS server load generator: " << num_workers_ << " workers, "
+            << num_keys << " keys x " << len << " bytes, " << iters
+            << " rounds, " << engine_thread_num_ << " engine threads, "
+            << key_shard_num_ << " key shards"
+            << (sync_mode_ ? "" : ", async, staleness ")
+            << (sync_mode_ ? "" : std::to_string(staleness_))
+            << (broadcast ? ", broadcast" : "")
+            << (compressor.empty() ? "" : ", compressor " + compressor)
+            << (compressor.empty() || compressed_sum_
+                    ? ""
+                    : ", summed densely");
+  std::mutex fence_mu;
+  std::condition_variable fence_cond;
+  size_t fenced = 0;
+  auto start = std::chrono::steady_clock::now();
+  for (size_t w = 0; w < num_workers_; ++w) {
+    threads.emplace_back([&, w] {
+      for (size_t i = 1; i <= iters; ++i) {
+        if (straggler_us && i % num_workers_ == w) {
+          std::this_thread::sleep_for(std::chrono::microseconds(straggler_us));
+        }
+        workers[w].round = i;
+        if (broadcast) {
+          if (w == 0) {
+            std::fill(ones[w].begin(), ones[w].end(), (float)i);
+            for (size_t key = 0; key < num_keys; ++key) {
+              make_request(w, key, true);
+            }
+          }
+        } else {
+          if (!compressor.empty()) {
+            common::compressor::tensor_t grad(ones[w].data(), len,
+                                              common::BYTEPS_FLOAT32);
+            compressed[w] = compressors[w]->Compress(grad);
+          }
+          for (size_t key = 0; key < num_keys; ++key) {
+            make_request(w, key, true);
+          }
+        }
+        for (size_t key = 0; key < num_keys; ++key) make_request(w, key, false);
+        workers[w].WaitPullAcks(num_keys * i);
+        if (!sync_mode_ || broadcast) continue;
+        std::unique_lock<std::mutex> lock(fence_mu);
+        ++fenced;
+        fence_cond.notify_all();
+        fence_cond.wait(lock, [&] { return fenced >= num_workers_ * i; });
+      }
+    });
+  }
+  for (auto& t : threads) t.join();
+  double secs = std::chrono::duration<double>(
+                    std::chrono::steady_clock::now() - start).count();
+  response_hook_ = nullptr;
+
+  size_t pushers = broadcast ? 1 : num_workers_;
+  size_t push_len = compressor.empty() ? len : compressed[0].size;
+  double pushed = (double)pushers * num_keys * push_len * iters;
+  LOG(INFO) << "BytePS server load generator: " << secs << " s, "
+            << pushed / secs / 1e9 << " GB/s pushed, "
+            << (pushers + num_workers_) * num_keys * iters / secs
+            << " requests/s";
+  LOG(INFO) << "BytePS server load generator: engine utilization "
+            << EngineBalancer::ToString(engine_balancer_.GetUtilization());
+}
+
+}  // namespace server
+}  // namespace byteps
+
+#endif  // BYTEPS_SERVER_LOADGEN_H
@@ -0,0 +1,185 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_SERVER_NUMA_ALLOC_H
+#define BYTEPS_SERVER_NUMA_ALLOC_H
+
+#include <numa.h>
+#include <numaif.h>
+#include <pthread.h>
+#include <sched.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+#include <atomic>
+#include <cerrno>
+#include <cstring>
+#include <sstream>
+#include <string>
+#include <vector>
+#include "ps/ps.h"
+
+namespace byteps {
+namespace server {
+
+/**
+ * \brief Placement of the engine threads and of the stores of their keys on
+ * the NUMA nodes, see BYTEPS_SERVER_NUMA_ALLOC and
+ * BYTEPS_SERVER_PIN_ENGINE_THREADS in docs/env.md.
+ *
+ * Engine thread i runs on the i-th NUMA node with cores in turn, or, when
+ * pinned, on one core of it (or of BYTEPS_SERVER_ENGINE_CORES). The store of
+ * a key is mapped anonymously, i.e., zeros without a memset, and prefers the
+ * node of the engine thread of the key. Its pages are allocated by the first
+ * write, the initial copy, as huge pages where the store is large enough.
+ */
+
+// the NUMA nodes that have cores the process may run on, in order
+inline std::vector<std::vector<int> > NodeCores() {
+  std::vector<std::vector<int> > nodes(numa_max_node() + 1);
+  cpu_set_t allowed;
+  CPU_ZERO(&allowed);
+  CHECK_EQ(sched_getaffinity(0, sizeof(allowed), &allowed), 0);
+  for (int cpu = 0; cpu < CPU_SETSIZE; ++cpu) {
+    if (!CPU_ISSET(cpu, &allowed)) continue;
+    int node = numa_node_of_cpu(cpu);
+    if (node >= 0 && node < (int)nodes.size()) nodes[node].push_back(cpu);
+  }
+  return nodes;
+}
+
+// cores like "0-3,8" (as in BYTEPS_VISIBLE_CPU_CORES)
+inline std::vector<int> ParseCores(const std::string& s) {
+  std::vector<int> cores;
+  std::stringstream ss(s);
+  std::string range;
+  while (std::getline(ss, range, ',')) {
+    if (range.empty()) continue;
+    auto dash = range.find('-');
+    int begin = std::stoi(range.substr(0, dash));
+    int end = dash == std::string::npos ? begin
+                                        : std::stoi(range.substr(dash + 1));
+    CHECK_LE(begin, end) << "bad core range " << range;
+    for (int core = begin; core <= end; ++core) cores.push_back(core);
+  }
+  return cores;
+}
+
+/**
+ * \brief the core (-1 if not pinned) and the NUMA node of each of n engine
+ * threads
+ *
+ * \param cores the cores to pin to in turn, or empty to take the cores of
+ * the nodes in turn
+ */
+inline void PlaceEngineThreads(size_t n, bool pin,
+                               const std::vector<int>& cores,
+                               std::vector<int>* engine_cores,
+                               std::vector<int>* engine_nodes) {
+  engine_cores->assign(n, -1);
+  engine_nodes->assign(n, -1);
+  std::vector<std::vector<int> > nodes;
+  for (auto& node_cores : NodeCores()) {
+    if (!node_cores.empty()) nodes.push_back(node_cores);
+  }
+  CHECK(!nodes.empty()) << "no NUMA node with cores";
+  for (size_t i = 0; i < n; ++i) {
+    if (pin && !cores.empty()) {
+      (*engine_cores)[i] = cores[i % cores.size()];
+      (*engine_nodes)[i] = numa_node_of_cpu((*engine_cores)[i]);
+      CHECK_GE((*engine_nodes)[i], 0)
+          << "bad core " << (*engine_cores)[i] << " for engine thread " << i;
+      continue;
+    }
+    auto& node_cores = nodes[i % nodes.size()];
+    (*engine_nodes)[i] = numa_node_of_cpu(node_cores[0]);
+    if (pin) {
+      (*engine_cores)[i] = node_cores[(i / nodes.size()) % node_cores.size()];
+    }
+  }
+}
+
+// runs the calling thread on the core if >= 0, else on the node if >= 0
+inline void BindThread(int core, int node) {
+  if (core >= 0) {
+    cpu_set_t cpus;
+    CPU_ZERO(&cpus);
+    CPU_SET(core, &cpus);
+    int ret = pthread_setaffinity_np(pthread_self(), sizeof(cpus), &cpus);
+    if (ret) LOG(WARNING) << "cannot pin to core " << core << ": "
+                          << strerror(ret);
+  } else if (node >= 0 && numa_run_on_node(node) != 0) {
+    LOG(WARNING) << "cannot run on NUMA node " << node << ": "
+                 << strerror(errno);
+  }
+}
+
+/**
+ * \brief zeros for the store of a key, on a NUMA node and huge pages
+ *
+ * \param size bytes needed
+ * \param node the preferred node of the pages, -1 for the default policy
+ * \param hugetlb try explicit huge pages (vm.nr_hugepages) first
+ * \param mapped bytes mapped, for NumaStoreFree
+ */
+inline void* NumaStoreMalloc(size_t size, int node, bool hugetlb,
+                             size_t* mapped) {
+  const size_t page = sysconf(_SC_PAGESIZE), huge = 2 << 20;
+  void* ptr = MAP_FAILED;
+  if (hugetlb && size >= huge) {
+    *mapped = (size + huge - 1) / huge * huge;
+    ptr = mmap(nullptr, *mapped, PROT_READ | PROT_WRITE,
+               MAP_PRIVATE | MAP_ANONYMOUS | MAP_HUGETLB, -1, 0);
+    static std::atomic_flag warned = ATOMIC_FLAG_INIT;
+    if (ptr == MAP_FAILED && !warned.test_and_set()) {
+      LOG(WARNING) << "out of explicit huge pages (vm.nr_hugepages), using "
+                      "transparent huge pages: " << strerror(errno);
+    }
+  }
+  if (ptr == MAP_FAILED) {
+    // aligned to huge pages when large enough, so that they can back all of
+    // it; the rest of the mapping is cut off
+    size_t align = size >= huge ? huge : page;
+    *mapped = (size + page - 1) / page * page;
+    auto base = static_cast<char*>(mmap(nullptr, *mapped + align - page,
+                                        PROT_READ | PROT_WRITE,
+                                        MAP_PRIVATE | MAP_ANONYMOUS, -1, 0));
+    CHECK_NE(base, MAP_FAILED) << "mmap of " << size << " bytes: "
+                               << strerror(errno);
+    auto begin = reinterpret_cast<char*>(
+        (reinterpret_cast<uintptr_t>(base) + align - 1) / align * align);
+    if (begin > base) munmap(base, begin - base);
+    auto tail = (base + *mapped + align - page) - (begin + *mapped);
+    if (tail > 0) munmap(begin + *mapped, tail);
+    ptr = begin;
+    if (size >= huge) madvise(ptr, *mapped, MADV_HUGEPAGE);
+  }
+  if (node >= 0) {
+    auto mask = numa_allocate_nodemask();
+    numa_bitmask_setbit(mask, node);
+    if (mbind(ptr, *mapped, MPOL_PREFERRED, mask->maskp, mask->size + 1, 0)) {
+      LOG(WARNING) << "mbind to NUMA node " << node << ": " << strerror(errno);
+    }
+    numa_free_nodemask(mask);
+  }
+  return ptr;
+}
+
+inline void NumaStoreFree(void* ptr, size_t mapped) { munmap(ptr, mapped); }
+
+}  // namespace server
+}  // namespace byteps
+
+#endif  // BYTEPS_SERVER_NUMA_ALLOC_H
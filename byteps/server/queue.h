@@ -16,49 +16,86 @@
 #ifndef BYTEPS_SERVER_QUEUE_H
 #define BYTEPS_SERVER_QUEUE_H
 
-#include <vector>
-#include <mutex>
 #include <condition_variable>
-#include <memory>
-#include <algorithm>
+#include <map>
+#include <mutex>
+#include <set>
+#include <unordered_map>
+#include <utility>
+#include <vector>
 
 namespace byteps {
 namespace server {
 
 /**
- * \brief thread-safe queue allowing push and waited pop
+ * \brief FIFO on a growable ring buffer, O(1) push and pop. Not thread-safe.
  */
-class PriorityQueue {
+template <typename T>
+class RingBuffer {
  public:
-  PriorityQueue(bool is_schedule) {
-    enable_schedule_ = is_schedule;
-    if (enable_schedule_) {
-      std::make_heap(queue_.begin(), queue_.end(),
-        [this](const BytePSEngineMessage& a, const BytePSEngineMessage& b) {
-          return ComparePriority(a, b);
-        }
-      );
+  bool Empty() const { return size_ == 0; }
+  size_t Size() const { return size_; }
+
+  const T& Front() const { return buf_[head_]; }
+
+  void Push(T value) {
+    if (size_ == buf_.size()) Grow();
+    buf_[(head_ + size_) & (buf_.size() - 1)] = std::move(value);
+    ++size_;
+  }
+
+  T Pop() {
+    T value = std::move(buf_[head_]);
+    buf_[head_] = T();  // drop what the moved-from slot may still hold
+    head_ = (head_ + 1) & (buf_.size() - 1);
+    --size_;
+    return value;
+  }
+
+ private:
+  void Grow() {
+    // the capacity stays a power of two, so that wrapping is a mask
+    std::vector<T> buf(buf_.empty() ? 4 : buf_.size() * 2);
+    for (size_t i = 0; i < size_; ++i) {
+      buf[i] = std::move(buf_[(head_ + i) & (buf_.size() - 1)]);
     }
+    buf_.swap(buf);
+    head_ = 0;
   }
+
+  std::vector<T> buf_;
+  size_t head_ = 0;
+  size_t size_ = 0;
+};
+
+/**
+ * \brief thread-safe queue allowing push and waited pop
+ *
+ * Without scheduling it is a FIFO. With scheduling, the messages of the key
+ * with the fewest pushes since its last ClearCounter() go first, and those
+ * of the same count in the order they were pushed. Messages of one key are
+ * always popped in the order they were pushed.
+ */
+class PriorityQueue {
+ public:
+  explicit PriorityQueue(bool is_schedule) : enable_schedule_(is_schedule) {}
   ~PriorityQueue() { }
 
   /**
-   * \brief push an value and sort using heap. threadsafe.
+   * \brief push a value. threadsafe.
    * \param new_value the value
    */
   void Push(BytePSEngineMessage new_value) {
-    mu_.lock();
-    queue_.push_back(std::move(new_value));
-    if (enable_schedule_) {
-      ++push_cnt_[new_value.key];
-      std::push_heap(queue_.begin(), queue_.end(),
-        [this](const BytePSEngineMessage& a, const BytePSEngineMessage& b) {
-          return ComparePriority(a, b);
-        }
-      );
+    {
+      std::lock_guard<std::mutex> lk(mu_);
+      if (enable_schedule_) {
+        PushScheduled(std::move(new_value));
+      } else {
+        fifo_.Push(std::move(new_value));
+      }
+      ++size_;
     }
-    mu_.unlock();
-    cond_.notify_all();
+    cond_.notify_one();
   }
 
   /**
@@ -67,41 +104,96 @@ class PriorityQueue {
    */
   void WaitAndPop(BytePSEngineMessage* value) {
     std::unique_lock<std::mutex> lk(mu_);
-    cond_.wait(lk, [this]{return !queue_.empty();});
-    if (enable_schedule_) {
-      std::pop_heap(queue_.begin(), queue_.end(),
-        [this](const BytePSEngineMessage& a, const BytePSEngineMessage& b) {
-          return ComparePriority(a, b);
-        }
-      );
-      *value = queue_.back();
-      queue_.pop_back();
-    } else {
-      *value = std::move(queue_.front());
-      queue_.erase(queue_.begin());
+    cond_.wait(lk, [this]{ return size_ > 0; });
+    *value = PopOne();
+  }
+
+  /**
+   * \brief wait until the queue is not empty, then pop up to `max` elements
+   * in order, threadsafe
+   * \param values the poped values, cleared first
+   * \return the number of poped values
+   */
+  size_t WaitAndPop(std::vector<BytePSEngineMessage>* values, size_t max) {
+    values->clear();
+    std::unique_lock<std::mutex> lk(mu_);
+    cond_.wait(lk, [this]{ return size_ > 0; });
+    while (size_ > 0 && values->size() < max) {
+      values->push_back(PopOne());
     }
+    return values->size();
   }
 
   void ClearCounter(uint64_t key) {
     if (!enable_schedule_) return;
-    std::unique_lock<std::mutex> lk(mu_);
-    push_cnt_[key] = 0;
+    std::lock_guard<std::mutex> lk(mu_);
+    auto it = keys_.find(key);
+    if (it == keys_.end()) return;
+    auto& kq = it->second;
+    if (kq.msgs.Empty()) {
+      keys_.erase(it);
+      return;
+    }
+    Unlink(key, kq);
+    kq.push_cnt = 0;
+    Link(key, kq);
   }
 
-  bool ComparePriority(const BytePSEngineMessage& a, const BytePSEngineMessage& b) {
-    if (push_cnt_[a.key] == push_cnt_[b.key]) {
-      return (a.id > b.id);
-    } else {
-      return (push_cnt_[a.key] > push_cnt_[b.key]);
+ private:
+  struct KeyQueue {
+    uint64_t push_cnt = 0;
+    RingBuffer<BytePSEngineMessage> msgs;
+  };
+
+  // the key's place in the buckets, it must have queued messages
+  void Link(uint64_t key, const KeyQueue& kq) {
+    buckets_[kq.push_cnt].emplace(kq.msgs.Front().id, key);
+  }
+
+  void Unlink(uint64_t key, const KeyQueue& kq) {
+    auto bucket = buckets_.find(kq.push_cnt);
+    bucket->second.erase(std::make_pair(kq.msgs.Front().id, key));
+    if (bucket->second.empty()) buckets_.erase(bucket);
+  }
+
+  void PushScheduled(BytePSEngineMessage value) {
+    auto key = value.key;
+    auto& kq = keys_[key];
+    if (!kq.msgs.Empty()) Unlink(key, kq);
+    ++kq.push_cnt;
+    kq.msgs.Push(std::move(value));
+    Link(key, kq);
+  }
+
+  BytePSEngineMessage PopOne() {
+    --size_;
+    if (!enable_schedule_) return fifo_.Pop();
+    auto bucket = buckets_.begin();
+    auto key = bucket->second.begin()->second;
+    auto it = keys_.find(key);
+    auto& kq = it->second;
+    Unlink(key, kq);
+    auto value = kq.msgs.Pop();
+    if (!kq.msgs.Empty()) {
+      Link(key, kq);
+    } else if (kq.push_cnt == 0) {
+      // nothing queued and no round in progress, forget the key
+      keys_.erase(it);
     }
+    return value;
   }
 
- private:
   mutable std::mutex mu_;
-  std::vector<BytePSEngineMessage> queue_;
   std::condition_variable cond_;
-  std::unordered_map<uint64_t, uint64_t> push_cnt_;
-  volatile bool enable_schedule_ = false;
+  size_t size_ = 0;
+  const bool enable_schedule_;
+  // without scheduling
+  RingBuffer<BytePSEngineMessage> fifo_;
+  // with scheduling: the keys with queued messages or a round in progress,
+  // and those with queued messages bucketed by push count, each bucket
+  // ordered by the id of the first queued message of the key
+  std::unordered_map<uint64_t, KeyQueue> keys_;
+  std::map<uint64_t, std::set<std::pair<uint64_t, uint64_t> > > buckets_;
 };
 
 }  // namespace server
@@ -16,6 +16,7 @@
 #include "server.h"
 #include "../common/compressor/utils.h"
 #include "queue.h"
+#include "loadgen.h"
 
 namespace byteps {
 namespace server {
@@ -27,46 +28,68 @@ std::vector<PriorityQueue*> engine_queues_;
 std::vector<std::thread*> engine_threads_;
 
 BytePSArray* GetStore(uint64_t key) {
-  std::lock_guard<std::mutex> lock(store_mu_);
-  return &store_[key];
+  auto shard = GetShard(key);
+  std::lock_guard<std::mutex> lock(shard->map_mu);
+  return &shard->store[key];
 }
 
 UpdateBuf* GetUpdateBuf(uint64_t key) {
-  std::lock_guard<std::mutex> lock(update_buf_mu_);
-  return &update_buf_[key];
-} 
+  auto shard = GetShard(key);
+  std::lock_guard<std::mutex> lock(shard->map_mu);
+  return &shard->update_buf[key];
+}
+
+common::compressor::Compressor* GetCompressor(uint64_t key) {
+  auto shard = GetShard(key);
+  std::lock_guard<std::mutex> lock(shard->map_mu);
+  auto iter = shard->compressor_map.find(key);
+  return iter == shard->compressor_map.end() ? nullptr : iter->second.get();
+}
 
+void Response(const ps::KVMeta& req, const ps::KVPairs<char>& res,
+              ps::KVServer<char>* server) {
+  if (response_hook_) {
+    response_hook_(req, res);
+  } else {
+    server->Response(req, res);
+  }
+}
+
+// must hold the handle_mu of the key's shard
 void SendPushResponse(uint64_t key, const ps::KVMeta& req,
                       ps::KVServer<char>* server) {
-  auto iterator = push_response_map_.find(key);
-  if (iterator == push_response_map_.end()) {  // new key
+  auto& push_response_map = GetShard(key)->push_response_map;
+  auto iterator = push_response_map.find(key);
+  if (iterator == push_response_map.end()) {  // new key
     ps::KVPairs<char> response;
-    push_response_map_[key] = response;  // add to the map
-    server->Response(req, response);
+    push_response_map[key] = response;  // add to the map
+    Response(req, response, server);
   } else {  // not new key, then reuse the memory address to avoid ibv_reg_mr on
             // RDMA data path
     ps::KVPairs<char>* response = &iterator->second;
-    server->Response(req, *response);
+    Response(req, *response, server);
   }
 }
 
 void SendPullResponse(const DataHandleType type, const uint64_t key,
                       const ps::KVMeta& req_meta, ps::KVServer<char>* server) {
-  std::lock_guard<std::mutex> lock(pullresp_mu_);
+  auto shard = GetShard(key);
+  std::lock_guard<std::mutex> lock(shard->pullresp_mu);
+  auto& pull_response_map = shard->pull_response_map;
   auto updates = GetUpdateBuf(key);
   CHECK(updates->merged.tensor) << "init " << key << " first";
   char* data = updates->merged.tensor;
   auto len = updates->merged.len;
 
   // send pull response
-  auto iterator = pull_response_map_.find(key);
-  if (iterator == pull_response_map_.end()) {  // new key
+  auto iterator = pull_response_map.find(key);
+  if (iterator == pull_response_map.end()) {  // new key
     ps::KVPairs<char> response;
     response.keys = {EncodeKey(key)};
     response.lens = {len};
     response.vals = ps::SArray<char>(data, len, false);  // zero copy
-    pull_response_map_[key] = response;                  // add to the map
-    server->Response(req_meta, response);
+    pull_response_map[key] = response;                   // add to the map
+    Response(req_meta, response, server);
   } else {  // not new key, then reuse the memory address to avoid ibv_reg_mr on
             // RDMA data path
     ps::KVPairs<char>* response = &iterator->second;
@@ -75,29 +98,77 @@ void SendPullResponse(const DataHandleType type, const uint64_t key,
     CHECK(p);
     response->lens = {len};
     response->vals = ps::SArray<char>(p, len, false);
-    server->Response(req_meta, *response);
+    Response(req_meta, *response, server);
+  }
+}
+
+// Bounded staleness: in async mode, a worker gets a pull response only if it
+// is at most staleness_ pushes of the key ahead of the slowest worker.
+// Must hold the handle_mu of the key's shard.
+bool IsWithinStaleness(UpdateBuf* updates, int sender) {
+  return staleness_ < 0 ||
+         updates->clock[sender] <= updates->min_clock + staleness_;
+}
+
+// count a push of `sender` and answer the held pulls it has unblocked,
+// must hold the handle_mu of the key's shard
+void AdvanceClock(uint64_t key, UpdateBuf* updates, int sender,
+                  ps::KVServer<char>* server) {
+  auto& clock = updates->clock;
+  auto prev = clock[sender]++;
+  if (prev != updates->min_clock || clock.size() < num_workers_) return;
+  auto min_clock = clock.begin()->second;
+  for (const auto& c : clock) min_clock = std::min(min_clock, c.second);
+  if (min_clock == updates->min_clock) return;
+  updates->min_clock = min_clock;
+
+  auto& held = updates->held_pulls;
+  for (auto it = held.begin(); it != held.end();) {
+    if (IsWithinStaleness(updates, it->second.sender)) {
+      SendPullResponse(it->first, key, it->second, server);
+      it = held.erase(it);
+    } else {
+      ++it;
+    }
   }
 }
 
 void BytePSServerEngineThread(int i) {
+  if (!engine_nodes_.empty()) BindThread(engine_cores_[i], engine_nodes_[i]);
   auto& q = engine_queues_[i];
+  // drain up to engine_batch_size_ messages per wakeup
+  std::vector<BytePSEngineMessage> batch;
+  size_t next = 0;
+  // busy time of the current round of each key
+  std::unordered_map<uint64_t, uint64_t> round_busy;
   while (true) {
-    BytePSEngineMessage msg;
-    q->WaitAndPop(&msg);
+    if (next == batch.size()) {
+      q->WaitAndPop(&batch, engine_batch_size_);
+      next = 0;
+    }
+    BytePSEngineMessage msg = std::move(batch[next++]);
     if (msg.ops == TERMINATE) break;
+    auto begin = std::chrono::steady_clock::now();
     // do some check
     CHECK(msg.dst);
     CHECK(msg.src);
 
-    auto iter = compressor_map_.find(msg.key);
-    if (iter != compressor_map_.end()) {
+    auto compressor = GetCompressor(msg.key);
+    // summed by the compressor, nothing to copy or sum densely
+    bool summed = false;
+    if (compressor) {
       // compress
       if (msg.ops == ALL_RECV) {
-        common::compressor::tensor_t grad(reinterpret_cast<char*>(msg.src),
-                                          msg.len, msg.type.dtype);
-        auto compressed = iter->second->Compress(grad);
-        // 1. compress
         auto updates = GetUpdateBuf(msg.key);
+        common::compressor::tensor_t compressed;
+        if (updates->compressed_sum) {
+          compressed = compressor->CompressSum();
+        } else {
+          common::compressor::tensor_t grad(reinterpret_cast<char*>(msg.src),
+                                            msg.len, msg.type.dtype);
+          compressed = compressor->Compress(grad);
+        }
+        // 1. compress
         updates->merged.tensor = compressed.data;
         updates->merged.len = compressed.size;
       } else {  // decompress
@@ -105,8 +176,21 @@ void BytePSServerEngineThread(int i) {
         CHECK_LE(compressed_len, msg.len);
         common::compressor::tensor_t compressed(
             reinterpret_cast<char*>(msg.src), compressed_len, msg.type.dtype);
-        auto decompressed = iter->second->Decompress(compressed);
-        msg.src = decompressed.data;
+        // the first push decides for the round, in the compressed domain if
+        // the compressor can, else densely
+        auto updates = GetUpdateBuf(msg.key);
+        if (msg.ops == COPY_FIRST) {
+          updates->compressed_sum =
+              compressed_sum_ && compressor->SumCompressed(compressed, true);
+          summed = updates->compressed_sum;
+        } else if (updates->compressed_sum) {
+          summed = compressor->SumCompressed(compressed, false);
+          CHECK(summed);
+        }
+        if (!summed) {
+          auto decompressed = compressor->Decompress(compressed);
+          msg.src = decompressed.data;
+        }
       }
     } else {
       if (msg.ops == ALL_RECV) {
@@ -120,6 +204,7 @@ void BytePSServerEngineThread(int i) {
     bool is_debug = (debug_mode_ && (debug_key_ == msg.key));
     switch (msg.ops) {
       case COPY_FIRST: {
+        if (summed) break;
         if (is_debug) {
           std::lock_guard<std::mutex> lock(debug_mu_);
           LOG(INFO) << "stage: ENGINE_COPY_MERGED_TO_STORE_BEFORE \t"
@@ -163,7 +248,7 @@ void BytePSServerEngineThread(int i) {
           } else {
             ++it;
           }
-          if (pull_cnt_[i][msg.key] == (size_t)ps::NumWorkers()) {
+          if (pull_cnt_[i][msg.key] == num_workers_) {
             is_push_finished_[i][msg.key] = false;
             pull_cnt_[i][msg.key] = 0;
             seen_sender_[i][msg.key].clear();
@@ -172,7 +257,18 @@ void BytePSServerEngineThread(int i) {
         }
       } break;
 
+      case FUSED_SUM: {
+        std::vector<const void*> srcs;
+        for (auto& sarray : msg.fused_sarrays) {
+          srcs.push_back(sarray.vals.data());
+        }
+        CHECK_GE(bps_reducer_->sum(msg.dst, srcs, msg.len,
+                                   bps_reducer_->GetDataType(msg.type.dtype)),
+                 0);
+      } break;
+
       case SUM_RECV: {
+        if (summed) break;
         auto bps_type = bps_reducer_->GetDataType(msg.type.dtype);
         if (is_debug) {
           std::lock_guard<std::mutex> lock(debug_mu_);
@@ -199,16 +295,195 @@ void BytePSServerEngineThread(int i) {
       default:
         CHECK(0);
     }
+
+    uint64_t ns = std::chrono::duration_cast<std::chrono::nanoseconds>(
+                      std::chrono::steady_clock::now() - begin)
+                      .count();
+    engine_balancer_.AddBusy(i, ns);
+    auto& busy = round_busy[msg.key];
+    busy += ns;
+    if (msg.ops == ALL_RECV) {  // the last message of the round
+      GetUpdateBuf(msg.key)->round_busy_ns = busy;
+      busy = 0;
+    }
   }
 }  // namespace server
 
+// answer a broadcast pull of `sender` if it has not got the last push yet,
+// must hold the handle_mu of the key's shard
+bool TryBroadcastPull(const DataHandleType type, uint64_t key,
+                      UpdateBuf* updates, const ps::KVMeta& req_meta,
+                      ps::KVServer<char>* server) {
+  if (!updates->bcast_round ||
+      !updates->bcast_pulled.insert(req_meta.sender).second) {
+    return false;
+  }
+  SendPullResponse(type, key, req_meta, server);
+  return true;
+}
+
+// Broadcast: the root worker pushes a key once per round and every worker
+// pulls it, nothing is summed. A pull waits for the push of its round, and a
+// push waits until all the workers have pulled the previous round.
+// Must hold the handle_mu of the key's shard.
+void HandleBroadcast(const DataHandleType type, uint64_t key,
+                     const ps::KVMeta& req_meta,
+                     const ps::KVPairs<char>& req_data,
+                     ps::KVServer<char>* server) {
+  auto stored = GetStore(key);
+  CHECK(stored->tensor) << "Should init the buffer for key=" << key
+                        << " first";
+  auto updates = GetUpdateBuf(key);
+  if (!req_meta.push) {
+    if (!TryBroadcastPull(type, key, updates, req_meta, server)) {
+      updates->held_pulls.emplace_back(type, req_meta);
+    } else if (updates->bcast_push &&
+               updates->bcast_pulled.size() == num_workers_) {
+      // the last pull of the round, the next push can go
+      auto push = std::move(updates->bcast_push);
+      HandleBroadcast(type, key, push->first, push->second, server);
+    }
+    return;
+  }
+
+  CHECK_EQ(req_data.lens.size(), (size_t)1);
+  CHECK_EQ((size_t)req_data.lens[0], stored->len)
+      << "broadcast size of key=" << key << " does not match";
+  if (updates->bcast_round && updates->bcast_pulled.size() < num_workers_) {
+    CHECK(!updates->bcast_push) << "two broadcast pushes of key=" << key;
+    updates->bcast_push.reset(
+        new std::pair<ps::KVMeta, ps::KVPairs<char> >(req_meta, req_data));
+    return;
+  }
+  bps_reducer_->copy(stored->tensor, req_data.vals.data(), stored->len);
+  updates->merged.tensor = stored->tensor;
+  updates->merged.len = stored->len;
+  updates->merged.dtype = stored->dtype;
+  ++updates->bcast_round;
+  updates->bcast_pulled.clear();
+  SendPushResponse(key, req_meta, server);
+
+  auto held = std::move(updates->held_pulls);
+  updates->held_pulls.clear();
+  for (const auto& pull : held) {
+    if (!TryBroadcastPull(pull.first, key, updates, pull.second, server)) {
+      updates->held_pulls.push_back(pull);
+    }
+  }
+}
+
+// must hold the handle_mu of the key's shard
+void InitStore(uint64_t key, const DataHandleType type, const char* recved,
+               size_t len) {
+  auto stored = GetStore(key);
+  auto updates = GetUpdateBuf(key);
+  // init stored buffer, use page aligned memory
+  size_t aligned_size = common::Align(len, type.dtype);
+  if (numa_alloc_) {
+    // on the node of the engine thread the key is assigned to now
+    int node = engine_nodes_.empty()
+                   ? -1
+                   : engine_nodes_[GetThreadID(key, updates, len)];
+    stored->tensor = reinterpret_cast<char*>(
+        NumaStoreMalloc(aligned_size, node, hugetlb_, &stored->mapped));
+  } else {
+    PageAlignedMalloc((void**)&stored->tensor, aligned_size);
+  }
+  stored->len = len;
+  stored->dtype = type.dtype;
+  CHECK(stored->tensor);
+
+  bps_reducer_->copy(stored->tensor, recved,
+                     len);  // we may not need this copy
+  updates->merged.len = len;
+  updates->merged.dtype = type.dtype;
+  if (!sync_mode_) {
+    // async: pushes are summed into the store, pulls read it
+    updates->merged.tensor = stored->tensor;
+  }
+}
+
+// must hold the handle_mu of the key's shard, and the key must be inited
+void RegisterCompressor(uint64_t key, const char* content, size_t len) {
+  auto shard = GetShard(key);
+  auto kwargs = byteps::common::compressor::Deserialize(
+      std::string(content, len));
+  auto stored = GetStore(key);
+  size_t aligned_size = byteps::common::Align(stored->len, stored->dtype);
+  // its buffers go to the node of the store, like the store itself
+  auto updates = GetUpdateBuf(key);
+  bool numa = stored->mapped && !engine_nodes_.empty() &&
+              updates->engine_tid >= 0;
+  if (numa) numa_set_preferred(engine_nodes_[updates->engine_tid]);
+  auto compressor_ptr = byteps::common::compressor::CompressorRegistry::Create(
+      kwargs, aligned_size,
+      static_cast<byteps::common::DataType>(stored->dtype));
+  if (numa) numa_set_localalloc();
+  CHECK_NE(compressor_ptr, nullptr);
+  {
+    std::lock_guard<std::mutex> lock(shard->map_mu);
+    shard->compressor_map[key] = std::move(compressor_ptr);
+  }
+  if (log_key_info_) {
+    LOG(INFO) << "register compressor for key=" << key;
+  }
+}
+
+// The init pushes (kDefaultPushPull) or the compressor registrations
+// (kCompressedPushPull) of many keys in one request. A key is inited or
+// registered once every worker has sent it, like in the per-key requests,
+// and the request is answered once all of its keys are.
+void HandleBatchedInit(const DataHandleType type, const ps::KVMeta& req_meta,
+                       const ps::KVPairs<char>& req_data,
+                       ps::KVServer<char>* server) {
+  CHECK(req_meta.push) << "only pushes can be batched";
+  CHECK(type.requestType == RequestType::kDefaultPushPull ||
+        type.requestType == RequestType::kCompressedPushPull)
+      << "batched request of type " << (int)type.requestType;
+  CHECK_EQ(req_data.lens.size(), req_data.keys.size());
+  auto batch = std::make_shared<BatchedInit>();
+  batch->req_meta = req_meta;
+  batch->pending = req_data.keys.size();
+  size_t offset = 0;
+  for (size_t i = 0; i < req_data.keys.size(); ++i) {
+    uint64_t key = DecodeKey(req_data.keys[i]);
+    auto len = (size_t)req_data.lens[i];
+    auto recved = reinterpret_cast<char*>(req_data.vals.data()) + offset;
+    offset += len;
+    if (log_key_info_) {
+      LOG(INFO) << "batched push key=" << key
+                << "\t sender=" << req_meta.sender << "\t size=" << len;
+    }
+
+    auto shard = GetShard(key);
+    std::lock_guard<std::mutex> lock(shard->handle_mu);
+    auto updates = GetUpdateBuf(key);
+    updates->init_batches.push_back(batch);
+    if (updates->init_batches.size() < num_workers_) continue;
+
+    if (type.requestType == RequestType::kCompressedPushPull) {
+      if (!GetCompressor(key)) RegisterCompressor(key, recved, len);
+    } else if (!GetStore(key)->tensor) {
+      InitStore(key, type, recved, len);
+    }
+    for (auto& b : updates->init_batches) {
+      if (--b->pending == 0) Response(b->req_meta, ps::KVPairs<char>(), server);
+    }
+    updates->init_batches.clear();
+  }
+  CHECK_EQ(offset, req_data.vals.size());
+}
+
 void BytePSHandler(const ps::KVMeta& req_meta,
                    const ps::KVPairs<char>& req_data,
                    ps::KVServer<char>* server) {
-  std::lock_guard<std::mutex> lock(handle_mu_);  // push & pull may have racing
   DataHandleType type = DepairDataHandleType(req_meta.cmd);
   // CHECK_EQ(type.requestType, RequestType::kDefaultPushPull);
   // do some check
+  if (req_data.keys.size() > 1) {
+    HandleBatchedInit(type, req_meta, req_data, server);
+    return;
+  }
   CHECK_EQ(req_data.keys.size(), (size_t)1);
   if (log_key_info_) {
     if (req_meta.push) {
@@ -223,31 +498,22 @@ void BytePSHandler(const ps::KVMeta& req_meta,
     }
   }
   uint64_t key = DecodeKey(req_data.keys[0]);
+  // push & pull of the same key may have racing, other keys go in parallel
+  auto shard = GetShard(key);
+  std::lock_guard<std::mutex> lock(shard->handle_mu);
 
   // register compressor
   if (type.requestType == RequestType::kCompressedPushPull) {
-    if (compressor_map_.find(key) == compressor_map_.end()) {
-      std::string content{reinterpret_cast<char*>(req_data.vals.data()),
-                          static_cast<size_t>(req_data.lens[0])};
-      auto kwargs = byteps::common::compressor::Deserialize(content);
-      auto stored = GetStore(key);
-      size_t aligned_size = byteps::common::Align(stored->len, stored->dtype);
-      auto compressor_ptr =
-          byteps::common::compressor::CompressorRegistry::Create(
-              kwargs, aligned_size,
-              static_cast<byteps::common::DataType>(stored->dtype));
-      CHECK_NE(compressor_ptr, nullptr);
-      compressor_map_[key] = std::move(compressor_ptr);
-      if (log_key_info_) {
-        LOG(INFO) << "register compressor for key=" << key;
-      }
+    if (!GetCompressor(key)) {
+      RegisterCompressor(key, reinterpret_cast<char*>(req_data.vals.data()),
+                         static_cast<size_t>(req_data.lens[0]));
     }
 
     // buffer the request meta
     auto updates = GetUpdateBuf(key);
     updates->request.push_back(req_meta);
     // should send response after collecting all init push
-    if (updates->request.size() < (size_t)ps::NumWorkers()) return;
+    if (updates->request.size() < num_workers_) return;
 
     for (const auto& req : updates->request) {
       SendPushResponse(key, req, server);
@@ -256,6 +522,11 @@ void BytePSHandler(const ps::KVMeta& req_meta,
     return;
   }
 
+  if (type.requestType == RequestType::kBroadcast) {
+    HandleBroadcast(type, key, req_meta, req_data, server);
+    return;
+  }
+
   if (req_meta.push) {  // push request
     CHECK_EQ(req_data.lens.size(), (size_t)1);
     CHECK_EQ(req_data.vals.size(), (size_t)req_data.lens[0]);
@@ -272,30 +543,27 @@ void BytePSHandler(const ps::KVMeta& req_meta,
       // buffer the request meta
       updates->request.push_back(req_meta);
       // should send response after collecting all init push
-      if (updates->request.size() < (size_t)ps::NumWorkers()) return;
+      if (updates->request.size() < num_workers_) return;
       if (log_key_info_) {
         LOG(INFO) << "Collected all " << updates->request.size()
                   << " requests for key=" << key
                   << ", init the store buffer size="
                   << (size_t)req_data.lens[0];
       }
-      // init stored buffer, use page aligned memory
-      size_t aligned_size = common::Align(len, type.dtype);
-      PageAlignedMalloc((void**)&stored->tensor, aligned_size);
-      stored->len = len;
-      stored->dtype = type.dtype;
-      CHECK(stored->tensor);
-
-      bps_reducer_->copy(stored->tensor, recved,
-                         len);  // we may not need this copy
+      InitStore(key, type, recved, len);
       for (const auto& req : updates->request) {
         SendPushResponse(key, req, server);
       }
       updates->request.clear();
     } else {
       auto updates = GetUpdateBuf(key);
-      auto tid = GetThreadID(key, len);
-      if (updates->request.empty()) {  // from the first incoming worker
+      auto tid = GetThreadID(key, updates, len);
+      bool is_fused = fused_reduce_ && sync_mode_ && !is_engine_blocking_ &&
+                      !GetCompressor(key);
+      if (is_fused) {
+        // buffer the push, all of them are summed in one pass at the end
+        updates->fused.push_back(req_data);
+      } else if (updates->request.empty()) {  // from the first incoming worker
         if (sync_mode_) {
           if (debug_mode_ && (debug_key_ == key)) {
             std::lock_guard<std::mutex> lock(debug_mu_);
@@ -345,7 +613,7 @@ void BytePSHandler(const ps::KVMeta& req_meta,
       // add a worker information (request.size() is the # workers received)
       updates->request.push_back(req_meta);
       SendPushResponse(key, req_meta, server);
-      if (sync_mode_ && updates->request.size() == (size_t)ps::NumWorkers()) {
+      if (sync_mode_ && updates->request.size() == num_workers_) {
         auto stored = GetStore(key);
         auto& update = updates->merged;
         if (debug_mode_ && (debug_key_ == key)) {
@@ -361,6 +629,14 @@ void BytePSHandler(const ps::KVMeta& req_meta,
           // TODO: compress
           bps_reducer_->copy(stored->tensor, updates->merged.tensor, len);
         } else {
+          if (is_fused) {
+            BytePSEngineMessage msg = {
+                timestamp_++,   type,        key,      stored->tensor,
+                stored->tensor, stored->len, FUSED_SUM};
+            msg.fused_sarrays = std::move(updates->fused);
+            updates->fused.clear();
+            engine_queues_[tid]->Push(msg);
+          }
           BytePSEngineMessage msg = {
               timestamp_++,   type,        key,     stored->tensor,
               stored->tensor, stored->len, ALL_RECV};
@@ -371,16 +647,23 @@ void BytePSHandler(const ps::KVMeta& req_meta,
       } else if (!sync_mode_) {
         // async: clean the request buffer
         updates->request.clear();
+        if (staleness_ >= 0) {
+          AdvanceClock(key, updates, req_meta.sender, server);
+        }
       }
     }
   } else {  // pull request
     auto stored = GetStore(key);
     CHECK(stored->tensor) << "Should init the buffer for key=" << key
                           << " first";
-    if (is_engine_blocking_ || !sync_mode_) {
+    if (!sync_mode_ && !IsWithinStaleness(GetUpdateBuf(key),
+                                          req_meta.sender)) {
+      // too far ahead, wait for the slowest worker to push
+      GetUpdateBuf(key)->held_pulls.emplace_back(type, req_meta);
+    } else if (is_engine_blocking_ || !sync_mode_) {
       SendPullResponse(type, key, req_meta, server);
     } else {
-      auto tid = GetThreadID(key, 0);
+      auto tid = GetThreadID(key, GetUpdateBuf(key), 0);
       std::lock_guard<std::mutex> lock(flag_mu_[tid]);
       if (is_push_finished_[tid].find(key) == is_push_finished_[tid].end()) {
         is_push_finished_[tid][key] = false;
@@ -396,7 +679,7 @@ void BytePSHandler(const ps::KVMeta& req_meta,
         pull_cnt_[tid][key] += 1;
         seen_sender_[tid][key].insert(req_meta.sender);
 
-        if (pull_cnt_[tid][key] == (size_t)ps::NumWorkers()) {
+        if (pull_cnt_[tid][key] == num_workers_) {
           is_push_finished_[tid][key] = false;
           pull_cnt_[tid][key] = 0;
           seen_sender_[tid][key].clear();
@@ -435,6 +718,12 @@ void init_global_env() {
   if (!sync_mode_)
     LOG(INFO) << "BytePS server is enabled asynchronous training";
 
+  // bounded staleness of async training, -1 for unbounded
+  staleness_ = GetEnv("BYTEPS_ASYNC_STALENESS", -1);
+  if (!sync_mode_ && staleness_ >= 0)
+    LOG(INFO) << "BytePS server bounds the staleness of asynchronous "
+                 "training to " << staleness_ << " iterations";
+
   // debug mode
   debug_mode_ = GetEnv("BYTEPS_SERVER_DEBUG", 0);
   debug_key_ = GetEnv("BYTEPS_SERVER_DEBUG_KEY", 0);
@@ -453,6 +742,53 @@ void init_global_env() {
   enable_schedule_ = GetEnv("BYTEPS_SERVER_ENABLE_SCHEDULE", 0);
   if (enable_schedule_)
     LOG(INFO) << "Enable engine scheduling for BytePS server";
+
+  // max number of messages an engine thread takes per wakeup, with
+  // scheduling a message is only ordered against those queued at its pop
+  engine_batch_size_ =
+      GetEnv("BYTEPS_SERVER_ENGINE_BATCH", enable_schedule_ ? 1 : 16);
+  CHECK_GE(engine_batch_size_, 1);
+
+  // move keys between engine threads by their measured busy time
+  engine_rebalance_ = GetEnv("BYTEPS_SERVER_ENGINE_REBALANCE", 0);
+  engine_rebalance_window_ms_ =
+      GetEnv("BYTEPS_SERVER_ENGINE_REBALANCE_WINDOW", 1000);
+  engine_rebalance_threshold_ =
+      GetEnv("BYTEPS_SERVER_ENGINE_REBALANCE_THRESHOLD", 10);
+  CHECK_GE(engine_rebalance_window_ms_, 1);
+  if (engine_rebalance_)
+    LOG(INFO) << "Enable engine rebalancing for BytePS server, window="
+              << engine_rebalance_window_ms_
+              << "ms threshold=" << engine_rebalance_threshold_ << "%";
+  log_engine_util_ = GetEnv("BYTEPS_SERVER_LOG_ENGINE_UTIL", 0);
+
+  // sum all the pushes of a key in one pass (sync, non-blocking mode)
+  fused_reduce_ = GetEnv("BYTEPS_SERVER_FUSED_REDUCE", 0);
+  if (fused_reduce_)
+    LOG(INFO) << "Enable fused reduction for BytePS server";
+
+  // sum the pushes of compressed keys without decompressing them, if their
+  // compressor can
+  compressed_sum_ = GetEnv("BYTEPS_SERVER_COMPRESSED_SUM", 1);
+  if (!compressed_sum_)
+    LOG(INFO) << "BytePS server decompresses every compressed push";
+
+  // number of key shards of the request handler
+  key_shard_num_ = GetEnv("BYTEPS_SERVER_KEY_SHARDS", 64);
+  CHECK_GE(key_shard_num_, 1);
+
+  // place the stores of the keys on the NUMA node of their engine thread,
+  // on huge pages, and pin the engine threads to cores
+  numa_alloc_ = GetEnv("BYTEPS_SERVER_NUMA_ALLOC", 0);
+  hugetlb_ = GetEnv("BYTEPS_SERVER_HUGETLB", 0);
+  pin_engine_threads_ = GetEnv("BYTEPS_SERVER_PIN_ENGINE_THREADS", 0);
+  if (numa_alloc_)
+    LOG(INFO) << "BytePS server allocates the stores on the NUMA node of "
+                 "their engine thread"
+              << (hugetlb_ ? ", on explicit huge pages" : "");
+
+  // run the in-process load generator instead of serving ps-lite
+  loadgen_workers_ = GetEnv("BYTEPS_SERVER_LOADGEN_WORKERS", 0);
 }
 
 extern "C" void byteps_server() {
@@ -481,32 +817,61 @@ extern "C" void byteps_server() {
   CHECK_EQ(q_pull_reqmeta_.size(), engine_thread_num_);
   CHECK_EQ(pull_cnt_.size(), engine_thread_num_);
 
-  // init the engine
-  for (size_t i = 0; i < engine_thread_num_; ++i) {
-    acc_load_.push_back(0);
+  for (size_t i = 0; i < key_shard_num_; ++i) {
+    key_shards_.emplace_back(new KeyShard());
   }
+
+  // init the engine
+  engine_balancer_.Init(engine_thread_num_, engine_rebalance_,
+                        engine_rebalance_window_ms_,
+                        engine_rebalance_threshold_ / 100.0, log_engine_util_);
   if (sync_mode_) {
     for (size_t i = 0; i < engine_thread_num_; ++i) {
       auto q = new PriorityQueue(enable_schedule_);
       engine_queues_.push_back(q);
     }
+    if (numa_alloc_ || pin_engine_threads_) {
+      if (numa_available() < 0) {
+        LOG(WARNING) << "NUMA is not available, the engine threads and the "
+                        "stores are not placed";
+      } else {
+        PlaceEngineThreads(
+            engine_thread_num_, pin_engine_threads_,
+            ParseCores(GetEnv("BYTEPS_SERVER_ENGINE_CORES", "")),
+            &engine_cores_, &engine_nodes_);
+        for (size_t i = 0; i < engine_thread_num_; ++i) {
+          LOG(INFO) << "engine thread " << i << " runs on NUMA node "
+                    << engine_nodes_[i] << ", core "
+                    << (engine_cores_[i] < 0 ? std::string("any")
+                                             : std::to_string(engine_cores_[i]));
+        }
+      }
+    }
     for (size_t i = 0; i < engine_thread_num_; ++i) {
       auto t = new std::thread(&BytePSServerEngineThread, i);
       engine_threads_.push_back(t);
     }
   }
 
-  // init server instance
-  ps::StartPS(0, role_, preferred_rank, true, "byteps\0");
-  byteps_server_ = new KVServer<SERVER_DATA_TYPE>(0, false, 0);
-  byteps_server_->set_request_handle(BytePSHandler);
-  if (!Postoffice::Get()->is_recovery()) {
-    Postoffice::Get()->Barrier(
-        0, ps::kWorkerGroup + ps::kServerGroup + ps::kScheduler);
-  }
+  if (loadgen_workers_) {
+    // drive the handler in-process, without ps-lite
+    RunLoadGen();
+  } else {
+    // init server instance
+    ps::StartPS(0, role_, preferred_rank, true, "byteps\0");
+    num_workers_ = ps::NumWorkers();
+    key_range_begin_ =
+        ps::Postoffice::Get()->GetServerKeyRanges()[ps::MyRank()].begin();
+    byteps_server_ = new KVServer<SERVER_DATA_TYPE>(0, false, 0);
+    byteps_server_->set_request_handle(BytePSHandler);
+    if (!Postoffice::Get()->is_recovery()) {
+      Postoffice::Get()->Barrier(
+          0, ps::kWorkerGroup + ps::kServerGroup + ps::kScheduler);
+    }
 
-  // clean the server resource
-  Finalize(0, role_, true);
+    // clean the server resource
+    Finalize(0, role_, true);
+  }
   if (byteps_server_) {
     delete byteps_server_;
     byteps_server_ = nullptr;
@@ -520,9 +885,13 @@ extern "C" void byteps_server() {
   for (auto q : engine_queues_) q->Push(msg);
   for (auto t : engine_threads_) t->join();
 
-  for (auto& it : store_) {
-    if (it.second.tensor) {
-      free(it.second.tensor);
+  for (auto& shard : key_shards_) {
+    for (auto& it : shard->store) {
+      if (it.second.tensor && it.second.mapped) {
+        NumaStoreFree(it.second.tensor, it.second.mapped);
+      } else if (it.second.tensor) {
+        free(it.second.tensor);
+      }
     }
   }
   
@@ -16,15 +16,21 @@
 #ifndef BYTEPS_SERVER_H
 #define BYTEPS_SERVER_H
 
+#include <atomic>
 #include <chrono>
 #include <cmath>
 #include <cstdlib>
+#include <functional>
+#include <memory>
 #include <set>
+#include <unordered_set>
 #include <unistd.h>
 #include "ps/ps.h"
 #include "../common/cpu_reducer.h"
 #include "../common/compressor/compressor.h"
 #include "../common/compressor/compressor_registry.h"
+#include "balancer.h"
+#include "numa_alloc.h"
 
 namespace byteps {
 namespace server {
@@ -37,11 +43,11 @@ namespace server {
 using namespace ps;
 
 enum class RequestType {
-  kDefaultPushPull, kRowSparsePushPull, kCompressedPushPull
+  kDefaultPushPull, kRowSparsePushPull, kCompressedPushPull, kBroadcast
 };
 
 enum BytePSEngineOperation {
-  SUM_RECV, COPY_FIRST, ALL_RECV, TERMINATE
+  SUM_RECV, COPY_FIRST, ALL_RECV, TERMINATE, FUSED_SUM
 };
 
 struct PSKV {
@@ -59,11 +65,36 @@ struct BytePSArray {
   size_t len;
   int dtype;
   ps::KVPairs<char> tmp_sarray;
+  size_t mapped = 0;  // bytes mapped by NumaStoreMalloc, 0 if malloc'ed
+};
+
+// a batched init request of one worker, answered when none of its keys is
+// pending, i.e., waiting for the same key from the other workers
+struct BatchedInit {
+  ps::KVMeta req_meta;
+  std::atomic<size_t> pending;
 };
 
 struct UpdateBuf {
   std::vector<ps::KVMeta> request;
+  // the batched init requests that include the key, one per worker so far
+  std::vector<std::shared_ptr<BatchedInit> > init_batches;
   BytePSArray merged;
+  std::vector<ps::KVPairs<char> > fused;  // pushes buffered for FUSED_SUM
+  int engine_tid = -1;  // the engine thread of the key, -1 until its 1st push
+  std::atomic<uint64_t> round_busy_ns{0};  // engine time of its last round
+  // the compressor sums the pushes of the round in the compressed domain
+  bool compressed_sum = false;
+  // bounded staleness (async mode): pushes of each worker since the init,
+  // the fewest of them, and the pulls held until the slowest catches up
+  std::unordered_map<int, uint64_t> clock;
+  uint64_t min_clock = 0;
+  std::vector<std::pair<DataHandleType, ps::KVMeta> > held_pulls;
+  // broadcast: the pushes of the root so far, the workers that pulled the
+  // last one, and a push of the next round waiting for the rest to pull
+  uint64_t bcast_round = 0;
+  std::unordered_set<int> bcast_pulled;
+  std::unique_ptr<std::pair<ps::KVMeta, ps::KVPairs<char> > > bcast_push;
 };
 
 struct BytePSEngineMessage {
@@ -76,6 +107,7 @@ struct BytePSEngineMessage {
   BytePSEngineOperation ops;
   ps::KVPairs<char> sarray; // to temporarily hold it and auto release
   ps::KVMeta req_meta;
+  std::vector<ps::KVPairs<char> > fused_sarrays;  // the inputs of FUSED_SUM
 };
 
 static DataHandleType DepairDataHandleType(int cmd) {
@@ -95,10 +127,6 @@ static DataHandleType DepairDataHandleType(int cmd) {
 KVServer<SERVER_DATA_TYPE>* byteps_server_;
 byteps::common::CpuReducer* bps_reducer_;
 
-std::mutex pullresp_mu_;
-std::unordered_map<uint64_t, ps::KVPairs<char> > push_response_map_;
-std::unordered_map<uint64_t, ps::KVPairs<char> > pull_response_map_;
-
 // push & pull flag
 std::vector<std::mutex> flag_mu_;
 std::vector<std::unordered_map<uint64_t, bool> > is_push_finished_;
@@ -106,29 +134,53 @@ std::vector<std::unordered_map<uint64_t, std::vector<ps::KVMeta> > > q_pull_reqm
 std::vector<std::unordered_map<uint64_t, std::set<int> > > seen_sender_;
 std::vector<std::unordered_map<uint64_t, size_t> > pull_cnt_;
 
-// byteps handler
-std::mutex handle_mu_;
-std::mutex update_buf_mu_;
-std::unordered_map<uint64_t, UpdateBuf> update_buf_;
-std::unordered_map<uint64_t, std::unique_ptr<common::compressor::Compressor>> compressor_map_;
+// per-key handler state, sharded by key so that requests for different keys
+// are handled in parallel
+struct KeyShard {
+  std::mutex handle_mu;    // push & pull of a key may have racing
+  std::mutex map_mu;       // protects the structure of the maps below
+  std::mutex pullresp_mu;  // serializes pull responses of the shard
+  std::unordered_map<uint64_t, UpdateBuf> update_buf;
+  std::unordered_map<uint64_t, BytePSArray> store;
+  std::unordered_map<uint64_t, std::unique_ptr<common::compressor::Compressor>>
+      compressor_map;
+  std::unordered_map<uint64_t, ps::KVPairs<char> > push_response_map;
+  std::unordered_map<uint64_t, ps::KVPairs<char> > pull_response_map;
+};
+std::vector<std::unique_ptr<KeyShard> > key_shards_;
+size_t key_shard_num_ = 64;
 
-// address map
-std::mutex store_mu_;
-std::unordered_map<uint64_t, BytePSArray> store_;
+KeyShard* GetShard(uint64_t key) {
+  // keys are (declared_key << 16 | partition), spread both parts
+  return key_shards_[((key >> 16) * 31 + (key & 0xffff)) % key_shard_num_]
+      .get();
+}
 
-// hash function
-std::mutex hash_mu_;
-std::unordered_map<uint64_t, size_t> hash_cache_;
-std::vector<uint64_t> acc_load_; // accumulated tensor size for an engine thread
+// key to engine thread assignment
+EngineBalancer engine_balancer_;
 
 // global knob
-uint64_t timestamp_ = 0;
+std::atomic<uint64_t> timestamp_{0};
 size_t engine_thread_num_ = 4;
+size_t engine_batch_size_ = 16;
+volatile bool engine_rebalance_ = false;
+size_t engine_rebalance_window_ms_ = 1000;
+size_t engine_rebalance_threshold_ = 10;  // percent of the window
+volatile bool log_engine_util_ = false;
 volatile bool is_engine_blocking_ = false;
 volatile bool log_key_info_ = false;
 volatile bool sync_mode_ = true;
+int staleness_ = -1;  // async mode: max pushes ahead of the slowest, -1: any
 volatile bool debug_mode_ = false;
 volatile bool enable_schedule_ = false;
+volatile bool fused_reduce_ = false;
+volatile bool compressed_sum_ = true;
+// NUMA placement of the stores and the engine threads, see numa_alloc.h
+volatile bool numa_alloc_ = false;
+volatile bool hugetlb_ = false;
+volatile bool pin_engine_threads_ = false;
+std::vector<int> engine_cores_;  // -1: not pinned
+std::vector<int> engine_nodes_;  // -1: not placed
 
 ps::Node::Role role_;
 int preferred_rank = -1;
@@ -138,43 +190,57 @@ volatile bool is_server_ = true;
 uint64_t debug_key_;
 std::mutex debug_mu_;
 
+// cached after ps-lite starts, so that requests do not query the Postoffice
+size_t num_workers_ = 0;
+ps::Key key_range_begin_ = 0;
+
+// in-process load generator, see loadgen.h
+size_t loadgen_workers_ = 0;
+// replaces KVServer::Response when set
+std::function<void(const ps::KVMeta&, const ps::KVPairs<char>&)> response_hook_;
+
 int DivUp(int x, int y) { return (x + y - 1) / y; }
 int RoundUp(int x, int y) { return DivUp(x, y) * y; }
 
 uint64_t DecodeKey(ps::Key key) {
-  auto kr = ps::Postoffice::Get()->GetServerKeyRanges()[ps::MyRank()];
-  return key - kr.begin();
+  return key - key_range_begin_;
 }
 
 uint64_t EncodeKey(ps::Key key) {
-  auto kr = ps::Postoffice::Get()->GetServerKeyRanges()[ps::MyRank()];
-  return key + kr.begin();
+  return key + key_range_begin_;
 }
 
-size_t GetThreadID(uint64_t key, size_t len) {
-  std::lock_guard<std::mutex> lock(hash_mu_);
-  if (len == 0) { // pull
-    CHECK_NE(hash_cache_.find(key), hash_cache_.end());
-    return hash_cache_[key];
-  }
-  if (hash_cache_.find(key) != hash_cache_.end()) {
-    return hash_cache_[key];
-  }
-  CHECK_GT(len, 0);
-  CHECK_EQ(acc_load_.size(), engine_thread_num_);
-  auto min_index = -1;
-  auto min_load = std::numeric_limits<uint64_t>::max();
-  for (size_t i = 0; i < engine_thread_num_; ++i) {
-    if (acc_load_[i] < min_load) {
-      min_load = acc_load_[i];
-      min_index = i;
-    }
+// Move the key to another engine thread if the balancer says so. Called at
+// the first push of an iteration, so none of the key's messages is queued;
+// it moves only if no pull of it is pending either.
+void RebalanceKey(uint64_t key, UpdateBuf* updates, size_t len) {
+  size_t tid = updates->engine_tid;
+  std::lock_guard<std::mutex> lock(flag_mu_[tid]);
+  auto it = is_push_finished_[tid].find(key);
+  if (it != is_push_finished_[tid].end() && it->second) return;
+  auto pulls = q_pull_reqmeta_[tid].find(key);
+  if (pulls != q_pull_reqmeta_[tid].end() && !pulls->second.empty()) return;
+  auto new_tid =
+      engine_balancer_.Rebalance(key, tid, len, updates->round_busy_ns);
+  if (new_tid == tid) return;
+  // the pull state of the new thread is created on its first use
+  is_push_finished_[tid].erase(key);
+  pull_cnt_[tid].erase(key);
+  seen_sender_[tid].erase(key);
+  q_pull_reqmeta_[tid].erase(key);
+  updates->engine_tid = new_tid;
+}
+
+// must hold the handle_mu of the key's shard
+size_t GetThreadID(uint64_t key, UpdateBuf* updates, size_t len) {
+  if (updates->engine_tid < 0) {
+    CHECK_GT(len, 0);
+    updates->engine_tid = engine_balancer_.Assign(len);
+  } else if (len > 0 && updates->request.empty() && sync_mode_ &&
+             !is_engine_blocking_) {
+    RebalanceKey(key, updates, len);
   }
-  CHECK_GE(min_index, 0);
-  CHECK_LT(min_index, engine_thread_num_);
-  acc_load_[min_index] += len;
-  hash_cache_[key] = min_index;
-  return hash_cache_[key];
+  return updates->engine_tid;
 }
 
 void PageAlignedMalloc(void** ptr, size_t size) {
@@ -188,6 +254,10 @@ void PageAlignedMalloc(void** ptr, size_t size) {
   *ptr = p;
 }
 
+void BytePSHandler(const ps::KVMeta& req_meta,
+                   const ps::KVPairs<char>& req_data,
+                   ps::KVServer<char>* server);
+
 extern "C" void byteps_server();
 
 }  // namespace server
@@ -20,23 +20,27 @@ from __future__ import print_function
 
 from contextlib import contextmanager
 
-from byteps.torch.compression import Compression
+from byteps.torch.compression import Compression, CompressionPolicy
+from byteps.torch.compression import decompress_into, native_kwargs
+from byteps.torch.broadcast import broadcast_tensors, broadcast_object
+from byteps.torch.fusion import build_fusion_buckets
 from byteps.torch.ops import push_pull_async_inplace as byteps_push_pull
-from byteps.torch.ops import push_pull
-from byteps.torch.ops import poll, synchronize, declare
+from byteps.torch.ops import push_pull_async_many as byteps_push_pull_many
+from byteps.torch.ops import push_pull, push_pull_async_many
+from byteps.torch.ops import poll, synchronize, synchronize_many, declare
 from byteps.torch.ops import init, shutdown, suspend, resume
 from byteps.torch.ops import size, local_size, rank, local_rank
 
 import os
+import mmap
+import struct
 import torch
 import collections
-import io
-import cloudpickle
 
 
 class _DistributedOptimizer(torch.optim.Optimizer):
     def __init__(self, params, named_parameters, compression,
-                 backward_passes_per_step=1):
+                 backward_passes_per_step=1, compression_params=None):
         super(self.__class__, self).__init__(params)
         self._compression = compression
 
@@ -85,16 +89,76 @@ class _DistributedOptimizer(torch.optim.Optimizer):
         self.backward_passes_per_step = backward_passes_per_step
         self._push_pull_delay = {v: self.backward_passes_per_step
                                  for _, v in sorted(named_parameters)}
+        # the push_pull names of the gradients, so that the hooks build none
+        self._grad_names = {}
+        for param_group in self.param_groups:
+            for p in param_group['params']:
+                if self._is_tensor_instance:
+                    name = self._parameter_names.get(p.__hash__())
+                else:
+                    name = self._parameter_names.get(p)
+                if name is not None:
+                    self._grad_names[p] = "Gradient." + name
         self._handles = {}
+        # async: the weights before the update, reused across steps
+        self._old_weights = {}
         self._grad_accs = []
         self._requires_update = set()
         self._should_sync = True
+
+        # native compressors of the gradients, chosen per parameter
+        native_params = {}
+        compressed = set()
+        if compression_params is not None:
+            policy = compression_params if callable(compression_params) \
+                else CompressionPolicy(compression_params)
+            for param_group in self.param_groups:
+                for p in param_group['params']:
+                    if not p.requires_grad:
+                        continue
+                    if self._is_tensor_instance:
+                        name = self._parameter_names.get(p.__hash__())
+                    else:
+                        name = self._parameter_names.get(p)
+                    params = policy(name, p)
+                    if params:
+                        native_params[name] = params
+                        compressed.add(p)
+
+        # fuse the gradients smaller than BYTEPS_FUSION_THRESHOLD bytes, except
+        # the compressed ones, whose compressors work per tensor
+        self._fusion_buckets = []
+        self._fusion_bucket_of = {}
+        fusion_threshold = int(os.getenv('BYTEPS_FUSION_THRESHOLD', 0))
+        if fusion_threshold > 0 and not self._enable_async and size() > 1:
+            params = [p for param_group in self.param_groups
+                      for p in param_group['params']
+                      if p.requires_grad and p not in compressed]
+            self._fusion_buckets = build_fusion_buckets(
+                params, fusion_threshold,
+                int(os.getenv('BYTEPS_FUSION_BUCKET_BYTES', 4096000)),
+                "Gradient.Fused.")
+            for bucket in self._fusion_buckets:
+                for p in bucket.params:
+                    self._fusion_bucket_of[p] = bucket
+
         if size() > 1:
             self._register_hooks()
 
+        # vanilla error feedback reads the learning rate from lr.s
+        self._lr_mmap = None
+        if any(native_kwargs(params).get('ef_type') == 'vanilla'
+               for params in native_params.values()):
+            with open('lr.s', 'wb') as f:
+                f.write(struct.pack('d', self.param_groups[0]['lr']))
+            with open('lr.s', 'r+b') as f:
+                self._lr_mmap = mmap.mmap(f.fileno(), 8)
+
         # declare tensors
         for name in sorted(self._parameter_names.values()):
-            declare("Gradient."+name)
+            declare("Gradient."+name, native_params.get(name))
+        for bucket in self._fusion_buckets:
+            declare(bucket.name)
         # We use two loops for load-balancing
         for name in sorted(self._parameter_names.values()):
             declare("Parameter."+name)
@@ -126,21 +190,60 @@ class _DistributedOptimizer(torch.optim.Optimizer):
                     self._grad_accs.append(grad_acc)
 
     def _push_pull_grad_async(self, p):
-        if self._is_tensor_instance:
-            name = self._parameter_names.get(p.__hash__())
-        else:
-            name = self._parameter_names.get(p)
         if self._enable_async:
             # the real handle will be created in step()
             handle, ctx = None, None
         else:
             tensor = p.grad
             tensor_compressed, ctx = self._compression.compress(tensor)
-            handle = byteps_push_pull(tensor_compressed, average=True, name="Gradient."+name)
+            handle = byteps_push_pull(tensor_compressed, average=True, name=self._grad_names[p])
         return handle, ctx
 
+    def _push_pull_grads_async(self, params, buckets):
+        """Starts the push_pull of the gradients of `params` and of the
+        fusion `buckets` in one call."""
+        if self._enable_async:
+            for p in params:
+                self._handles[p] = (None, None)
+            return
+        tensors, names, ctxs = [], [], []
+        for p in params:
+            tensor_compressed, ctx = self._compression.compress(p.grad)
+            tensors.append(tensor_compressed)
+            names.append(self._grad_names[p])
+            ctxs.append(ctx)
+        for bucket in buckets:
+            bucket.fill()
+            tensor_compressed, bucket.ctx = self._compression.compress(bucket.buffer)
+            tensors.append(tensor_compressed)
+            names.append(bucket.name)
+        if not tensors:
+            return
+        handles = byteps_push_pull_many(tensors, names, average=True)
+        for p, handle, ctx in zip(params, handles, ctxs):
+            self._handles[p] = (handle, ctx)
+        for bucket, handle in zip(buckets, handles[len(params):]):
+            bucket.handle = handle
+
+    def _push_pull_bucket_async(self, bucket):
+        tensor_compressed, bucket.ctx = self._compression.compress(bucket.buffer)
+        bucket.handle = byteps_push_pull(tensor_compressed, average=True,
+                                         name=bucket.name)
+
     def _make_hook(self, p):
         def hook(*ignore):
+            if p in self._fusion_bucket_of:
+                if self._push_pull_delay[p] <= 0:
+                    raise AssertionError(
+                        "Gradients were computed more than "
+                        "backward_passes_per_step times before call "
+                        "to step(). Increase backward_passes_per_step to "
+                        "accumulate gradients locally.")
+                self._push_pull_delay[p] -= 1
+                bucket = self._fusion_bucket_of[p]
+                if self._push_pull_delay[p] == 0 and bucket.add(p):
+                    self._push_pull_bucket_async(bucket)
+                return
             if p in self._handles and self._handles[p][0] is not None:
                 if self._push_pull_delay[p] <= 0:
                     raise AssertionError(
@@ -158,21 +261,23 @@ class _DistributedOptimizer(torch.optim.Optimizer):
         return hook
 
     def synchronize(self):
-        missing_p = self._requires_update - set(self._handles.keys())
-        for p in missing_p:
-            handle, ctx = self._push_pull_grad_async(p)
-            self._handles[p] = (handle, ctx)
-
-        for p, value in self._handles.items():
-            handle, ctx = value
-            if handle is None:
-                handle, ctx = self._push_pull_grad_async(p)
-                self._handles[p] = (handle, ctx)
-        for p, (handle, ctx) in self._handles.items():
-            output = synchronize(handle)
+        missing_p = self._requires_update - set(self._handles.keys()) - \
+            set(self._fusion_bucket_of.keys())
+        pending = list(missing_p) + [p for p, (handle, _) in self._handles.items()
+                                     if handle is None]
+        self._push_pull_grads_async(
+            pending, [b for b in self._fusion_buckets if b.handle is None])
+
+        # wait for all the gradients and buckets at once
+        outputs = synchronize_many(
+            [handle for handle, _ in self._handles.values()] +
+            [bucket.handle for bucket in self._fusion_buckets])
+        for (p, (handle, ctx)), output in zip(self._handles.items(), outputs):
             self._push_pull_delay[p] = self.backward_passes_per_step
             if not self._enable_async:
-                tmp = self._compression.decompress(output, ctx)
+                tmp = decompress_into(self._compression, output, ctx, p.grad)
+                if tmp is p.grad:
+                    continue
                 try:
                     p.grad.set_(tmp)
                 except Exception as e:
@@ -180,7 +285,13 @@ class _DistributedOptimizer(torch.optim.Optimizer):
                         p.grad.copy_(tmp)
                     else:
                         raise
+        bucket_outputs = outputs[len(self._handles):]
         self._handles.clear()
+        for bucket, output in zip(self._fusion_buckets, bucket_outputs):
+            bucket.unpack(decompress_into(
+                self._compression, output, bucket.ctx, bucket.buffer))
+            for p in bucket.params:
+                self._push_pull_delay[p] = self.backward_passes_per_step
 
     @contextmanager
     def skip_synchronize(self):
@@ -194,16 +305,17 @@ class _DistributedOptimizer(torch.optim.Optimizer):
 
     def step(self, closure=None):
         if self._enable_async:
-            old_weight_map = {}
             # store the weights before update
             for p, _ in self._handles.items():
-                old_weight_map[p] = p.data.clone().detach()
+                if p not in self._old_weights:
+                    self._old_weights[p] = torch.empty_like(p.data)
+                self._old_weights[p].copy_(p.data)
             # update
             loss = super(self.__class__, self).step(closure)
 
             for p, (h, _) in self._handles.items():
                 # get the diff for each weight (in-place)
-                p.data.sub_(old_weight_map.get(p))
+                p.data.sub_(self._old_weights[p])
                 if h is None:
                     # create the handler now
                     if self._is_tensor_instance:
@@ -211,12 +323,14 @@ class _DistributedOptimizer(torch.optim.Optimizer):
                     else:
                         name = self._parameter_names.get(p)
                     handle = byteps_push_pull(p, average=False, name="AsyncParam."+name)
-                    _, ctx = self._compression.compress(p)
-                    self._handles[p] = (handle, ctx)
+                    # the weights are not compressed, so there is no context
+                    self._handles[p] = (handle, None)
 
             self.synchronize()
             return loss
         else:
+            if self._lr_mmap is not None:
+                self._lr_mmap[:8] = struct.pack('d', self.param_groups[0]['lr'])
             # skip sync if calling skip_synchronize
             if self._should_sync:
                 self.synchronize()
@@ -225,7 +339,8 @@ class _DistributedOptimizer(torch.optim.Optimizer):
 
 def DistributedOptimizer(optimizer, named_parameters=None,
                          compression=Compression.none,
-                         backward_passes_per_step=1):
+                         backward_passes_per_step=1,
+                         compression_params=None):
     """
     An optimizer that wraps another torch.optim.Optimizer, using an push_pull to
     average gradient values before applying gradients to model weights.
@@ -256,13 +371,22 @@ def DistributedOptimizer(optimizer, named_parameters=None,
                                   allows accumulating gradients over multiple
                                   mini-batches before executing averaging and
                                   applying them.
+        compression_params: Native compressors of the gradients, which run in
+                            the worker pipeline and on the servers. Either the
+                            params of all gradients, e.g., {'compressor':
+                            'topk', 'k': 0.01, 'ef': 'vanilla'}, or a
+                            `CompressionPolicy` or a function of (name,
+                            parameter) that returns the params of a gradient,
+                            or None to not compress it. Gradients smaller than
+                            BYTEPS_MIN_COMPRESS_BYTES are never compressed.
+                            Use with `compression=Compression.none`.
     """
     # We dynamically create a new class that inherits from the optimizer that was passed in.
     # The goal is to override the `step()` method with an push_pull implementation.
     cls = type(optimizer.__class__.__name__, (optimizer.__class__,),
                dict(_DistributedOptimizer.__dict__))
     return cls(optimizer.param_groups, named_parameters,
-               compression, backward_passes_per_step)
+               compression, backward_passes_per_step, compression_params)
 
 
 def broadcast_parameters(params, root_rank, prefix="Parameter."):
@@ -276,6 +400,9 @@ def broadcast_parameters(params, root_rank, prefix="Parameter."):
             - dict of parameters to broadcast
         root_rank: The rank of the process from which parameters will be
                    broadcasted to all other processes.
+
+    Small parameters are coalesced into flat buffers and many broadcasts are
+    kept in flight, see `byteps.torch.broadcast.broadcast_tensors`.
     """
     if isinstance(params, dict):
         params = sorted(params.items())
@@ -285,18 +412,8 @@ def broadcast_parameters(params, root_rank, prefix="Parameter."):
     else:
         raise ValueError('invalid params of type: %s' % type(params))
 
-    # Run synchronous broadcasts.
-    for name, p in params:
-        # Broadcast is implemented as push + pull in BytePS
-        # To make it a real broadcast, we set the non-root tensors all 0.
-        if rank() != root_rank:
-            p.fill_(0)
-        # Remember to disable averaging because we are doing broadcast
-        if name:
-            handle = byteps_push_pull(p, average=False, name=prefix+name)
-        else:
-            handle = byteps_push_pull(p, average=False)
-        synchronize(handle)
+    broadcast_tensors([(prefix + (name if name else 'noname.%d' % i), p)
+                       for i, (name, p) in enumerate(params)], root_rank)
 
 
 def broadcast_optimizer_state(optimizer, root_rank, prefix="Parameter."):
@@ -422,45 +539,3 @@ def broadcast_optimizer_state(optimizer, root_rank, prefix="Parameter."):
     scalars = broadcast_object(scalars, root_rank)
     for key, p in scalars.items():
         callbacks[key](p)
-
-def broadcast_object(obj, root_rank=0, name=None):
-    """
-    Serializes and broadcasts an object from root rank to all other processes.
-    Typical usage is to broadcast the `optimizer.state_dict()`, for example:
-
-    .. code-block:: python
-
-        state_dict = broadcast_object(optimizer.state_dict(), 0)
-        if bps.rank() > 0:
-            optimizer.load_state_dict(state_dict)
-
-    Arguments:
-        obj: An object capable of being serialized without losing any context.
-        root_rank: The rank of the process from which parameters will be
-                   broadcasted to all other processes.
-        name: Optional name to use during broadcast, will default to the class
-              type.
-    Returns:
-        The object that was broadcast from the `root_rank`.
-    """
-    if name is None:
-        name = type(obj).__name__
-
-    if rank() == root_rank:
-        b = io.BytesIO()
-        cloudpickle.dump(obj, b)
-        t = torch.ByteTensor(bytearray(b.getvalue()))
-        sz = torch.IntTensor([t.shape[0]])
-        broadcast_parameters([(name + '.sz', sz)], root_rank, prefix="Size.")
-    else:
-        sz = torch.IntTensor([0])
-        broadcast_parameters([(name + '.sz', sz)], root_rank, prefix="Size.")
-        t = torch.ByteTensor(sz.tolist()[0])
-
-    broadcast_parameters([(name + '.t', t)], root_rank, prefix="Parameter.")
-
-    if rank() != root_rank:
-        buf = io.BytesIO(t.numpy().tobytes())
-        obj = cloudpickle.load(buf)
-
-    return obj
@@ -0,0 +1,285 @@
+# Copyright 2019 Bytedance Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Broadcast of many tensors, with the small ones coalesced into flat buffers
+and a bounded number of broadcasts in flight, and of picklable objects."""
+
+import collections
+import hashlib
+import os
+import pickle
+import struct
+
+import cloudpickle
+import torch
+
+from byteps.torch.ops import broadcast_async_inplace, synchronize
+from byteps.torch.ops import rank, local_size
+
+
+class _BroadcastBucket(object):
+    """Small tensors of the same dtype and device broadcast as one flat
+    buffer. The root packs them, the others unpack the result."""
+    def __init__(self, names, tensors, is_root, zero):
+        digest = hashlib.md5('|'.join(
+            '%s:%s:%s' % (name, tuple(t.shape), t.dtype)
+            for name, t in zip(names, tensors)).encode()).hexdigest()
+        # the members decide the size, so they decide the name too
+        self.name = '%s.Fused.%s' % (names[0], digest[:16])
+        self.tensors = tensors
+        if is_root:
+            self.buffer = torch.cat([t.reshape(-1) for t in tensors])
+        else:
+            numel = sum(t.numel() for t in tensors)
+            new = torch.zeros if zero else torch.empty
+            self.buffer = new(numel, dtype=tensors[0].dtype,
+                              device=tensors[0].device)
+        self.is_root = is_root
+
+    def unpack(self):
+        if self.is_root:
+            return
+        offset = 0
+        for t in self.tensors:
+            t.copy_(self.buffer.narrow(0, offset, t.numel()).view_as(t))
+            offset += t.numel()
+
+
+def _plan(named_tensors, is_root, zero, threshold, bucket_bytes):
+    """Returns the broadcasts as (name, tensor, done) in the order of
+    `named_tensors`, where a bucket goes when it is closed. `done` is called
+    once the broadcast has finished."""
+    ops = []
+    open_buckets = {}
+
+    def close(key):
+        names, tensors, _ = open_buckets.pop(key)
+        if len(tensors) == 1:
+            add(names[0], tensors[0])
+        else:
+            bucket = _BroadcastBucket(names, tensors, is_root, zero)
+            ops.append((bucket.name, bucket.buffer, bucket.unpack))
+
+    def add(name, t):
+        if t.is_contiguous():
+            if zero:
+                t.zero_()
+            ops.append((name, t, None))
+        elif is_root:
+            ops.append((name, t.contiguous(), None))
+        else:
+            new = torch.zeros_like if zero else torch.empty_like
+            tmp = new(t, memory_format=torch.contiguous_format)
+            ops.append((name, tmp, lambda: t.copy_(tmp)))
+
+    for name, t in named_tensors:
+        nbytes = t.numel() * t.element_size()
+        if nbytes >= threshold:
+            add(name, t)
+            continue
+        key = (t.dtype, t.device)
+        if key in open_buckets and open_buckets[key][2] + nbytes > bucket_bytes:
+            close(key)
+        bucket = open_buckets.setdefault(key, [[], [], 0])
+        bucket[0].append(name)
+        bucket[1].append(t)
+        bucket[2] += nbytes
+    for key in list(open_buckets.keys()):
+        close(key)
+    return ops
+
+
+def broadcast_tensors(named_tensors, root_rank):
+    """Broadcasts a list of (name, tensor) in place from `root_rank`.
+
+    Tensors smaller than BYTEPS_BROADCAST_FUSION_THRESHOLD bytes (default
+    65536) are coalesced into buffers of at most BYTEPS_BROADCAST_BUCKET_BYTES
+    (default 4096000), and up to BYTEPS_BROADCAST_INFLIGHT broadcasts (default
+    32) are in flight at a time. The list must be in the same order on all
+    processes.
+    """
+    threshold = int(os.getenv('BYTEPS_BROADCAST_FUSION_THRESHOLD', 65536))
+    bucket_bytes = int(os.getenv('BYTEPS_BROADCAST_BUCKET_BYTES', 4096000))
+    is_root = rank() == root_rank
+    with torch.no_grad():
+        ops = _plan(named_tensors, is_root, _needs_zero(root_rank), threshold,
+                    bucket_bytes)
+        _run(ops, root_rank)
+
+
+def _needs_zero(root_rank):
+    # the GPUs of a machine are summed before the push, so the others on the
+    # machine of the root must add zeros
+    return rank() != root_rank and \
+        rank() // local_size() == root_rank // local_size()
+
+
+def _run(ops, root_rank):
+    """Runs the broadcasts of (name, tensor, done), at most
+    BYTEPS_BROADCAST_INFLIGHT at a time."""
+    max_inflight = max(1, int(os.getenv('BYTEPS_BROADCAST_INFLIGHT', 32)))
+    inflight = collections.deque()
+    for name, tensor, done in ops:
+        if len(inflight) == max_inflight:
+            handle, prev_done = inflight.popleft()
+            synchronize(handle)
+            if prev_done:
+                prev_done()
+        handle = broadcast_async_inplace(tensor, root_rank, name)
+        inflight.append((handle, done))
+    while inflight:
+        handle, done = inflight.popleft()
+        synchronize(handle)
+        if done:
+            done()
+
+
+# An object is sent as one byte stream: a header, the pickle, and the
+# out-of-band buffers of pickle protocol 5 (e.g., of numpy arrays), each
+# 64-byte aligned. The stream is cut into a first chunk of a fixed size, big
+# enough for most objects, and chunks of BYTEPS_OBJECT_CHUNK_BYTES. Every
+# chunk has its own key, so a name reuses its keys in later calls.
+_OBJECT_FIRST_CHUNK = 65536
+_OBJECT_ALIGN = 64
+# stream length, pickle length, number of buffers; then the buffer lengths
+_OBJECT_HEADER = struct.Struct('<QQQ')
+
+
+def _align(offset):
+    return (offset + _OBJECT_ALIGN - 1) // _OBJECT_ALIGN * _OBJECT_ALIGN
+
+
+def _object_layout(data_len, buffer_lens):
+    """Returns the offsets of the pickle and the buffers in the stream, and
+    the stream length."""
+    offset = _align(_OBJECT_HEADER.size + 8 * len(buffer_lens))
+    data_offset = offset
+    offset = _align(offset + data_len)
+    buffer_offsets = []
+    for length in buffer_lens:
+        buffer_offsets.append(offset)
+        offset = _align(offset + length)
+    return data_offset, buffer_offsets, offset
+
+
+def _serialize(obj):
+    """Returns the pickle of `obj`, its out-of-band buffers, and the length
+    of the stream they make."""
+    buffers = []
+    if pickle.HIGHEST_PROTOCOL >= 5:
+        data = cloudpickle.dumps(obj, protocol=5,
+                                 buffer_callback=buffers.append)
+        buffers = [b.raw() for b in buffers]
+    else:
+        data = cloudpickle.dumps(obj)
+    _, _, length = _object_layout(len(data), [b.nbytes for b in buffers])
+    return data, buffers, length
+
+
+def _write_stream(stream, data, buffers):
+    """Writes the pickle and the buffers to the memoryview `stream`."""
+    data_offset, buffer_offsets, length = _object_layout(
+        len(data), [b.nbytes for b in buffers])
+    _OBJECT_HEADER.pack_into(stream, 0, length, len(data), len(buffers))
+    struct.pack_into('<%dQ' % len(buffers), stream, _OBJECT_HEADER.size,
+                     *[b.nbytes for b in buffers])
+    stream[data_offset:data_offset + len(data)] = data
+    for offset, b in zip(buffer_offsets, buffers):
+        stream[offset:offset + b.nbytes] = b
+
+
+def _read_stream(stream):
+    """Unpickles the object in the memoryview `stream`. Its buffers are
+    views of the stream, not copies."""
+    _, data_len, num_buffers = _OBJECT_HEADER.unpack_from(stream, 0)
+    buffer_lens = struct.unpack_from('<%dQ' % num_buffers, stream,
+                                     _OBJECT_HEADER.size)
+    data_offset, buffer_offsets, _ = _object_layout(data_len, buffer_lens)
+    data = stream[data_offset:data_offset + data_len]
+    if pickle.HIGHEST_PROTOCOL >= 5:
+        return pickle.loads(data, buffers=[
+            stream[offset:offset + length]
+            for offset, length in zip(buffer_offsets, buffer_lens)])
+    return pickle.loads(data)
+
+
+def _object_chunks(prefix, flat, chunk_bytes):
+    """Cuts the stream `flat` after its first chunk into chunks, returns
+    them as (name, tensor, None)."""
+    return [('%s.%d' % (prefix, i + 1),
+             flat.narrow(0, offset, chunk_bytes), None)
+            for i, offset in enumerate(range(_OBJECT_FIRST_CHUNK,
+                                             flat.numel(), chunk_bytes))]
+
+
+def _stream_size(length, chunk_bytes):
+    """The bytes of the whole chunks that hold a stream of `length`."""
+    if length <= _OBJECT_FIRST_CHUNK:
+        return _OBJECT_FIRST_CHUNK
+    rest = length - _OBJECT_FIRST_CHUNK
+    return _OBJECT_FIRST_CHUNK + \
+        (rest + chunk_bytes - 1) // chunk_bytes * chunk_bytes
+
+
+def broadcast_object(obj, root_rank=0, name=None):
+    """
+    Serializes and broadcasts an object from root rank to all other processes.
+    Typical usage is to broadcast the `optimizer.state_dict()`, for example:
+
+    .. code-block:: python
+
+        state_dict = broadcast_object(optimizer.state_dict(), 0)
+        if bps.rank() > 0:
+            optimizer.load_state_dict(state_dict)
+
+    An object that fits in the first chunk (64 KB with the header) takes a
+    single broadcast. Larger ones are sent in chunks of
+    BYTEPS_OBJECT_CHUNK_BYTES (default 4194304), which must be the same on
+    all processes. The keys of a name are reused by later calls.
+
+    Arguments:
+        obj: An object capable of being serialized without losing any context.
+        root_rank: The rank of the process from which parameters will be
+                   broadcasted to all other processes.
+        name: Optional name to use during broadcast, will default to the class
+              type.
+    Returns:
+        The object that was broadcast from the `root_rank`.
+    """
+    if name is None:
+        name = type(obj).__name__
+    prefix = 'Object.' + name
+    chunk_bytes = int(os.getenv('BYTEPS_OBJECT_CHUNK_BYTES', 4194304))
+
+    with torch.no_grad():
+        if rank() == root_rank:
+            data, buffers, length = _serialize(obj)
+            flat = torch.empty(_stream_size(length, chunk_bytes),
+                               dtype=torch.uint8)
+            _write_stream(memoryview(flat.numpy()), data, buffers)
+            first = flat.narrow(0, 0, _OBJECT_FIRST_CHUNK)
+            _run([(prefix + '.0', first, None)] +
+                 _object_chunks(prefix, flat, chunk_bytes), root_rank)
+            return obj
+
+        new = torch.zeros if _needs_zero(root_rank) else torch.empty
+        first = new(_OBJECT_FIRST_CHUNK, dtype=torch.uint8)
+        _run([(prefix + '.0', first, None)], root_rank)
+        length = _OBJECT_HEADER.unpack_from(memoryview(first.numpy()), 0)[0]
+        if length <= _OBJECT_FIRST_CHUNK:
+            return _read_stream(memoryview(first.numpy()))
+        flat = new(_stream_size(length, chunk_bytes), dtype=torch.uint8)
+        flat.narrow(0, 0, _OBJECT_FIRST_CHUNK).copy_(first)
+        _run(_object_chunks(prefix, flat, chunk_bytes), root_rank)
+        return _read_stream(memoryview(flat.numpy()))
@@ -15,6 +15,9 @@
 # ==============================================================================
 """Gradient compression algorithms."""
 
+import fnmatch
+import weakref
+
 import torch
 
 
@@ -30,6 +33,13 @@ class Compressor(object):
         """Decompress the tensor with the given context."""
         pass
 
+    @classmethod
+    def decompress_into(cls, tensor, ctx, out):
+        """Decompress the tensor with the given context, into `out` if the
+        compressor can, e.g., the gradient it was compressed from. Returns the
+        decompressed tensor, which may not be `out`."""
+        return cls.decompress(tensor, ctx)
+
 
 class NoneCompressor(Compressor):
     """Default no-op compression."""
@@ -65,6 +75,57 @@ class FP16Compressor(Compressor):
         return tensor_decompressed
 
 
+class BF16Compressor(Compressor):
+    """Compress all floating point gradients to bfloat16, which keeps the range
+    of float32. A tensor that does not require grad, e.g., a gradient, is cast
+    into a bfloat16 buffer kept for it, and `decompress_into` casts the result
+    back into it, so the optimizer allocates no tensor per step."""
+    # id of the gradient -> (weak reference to it, its bfloat16 buffer)
+    _buffers = {}
+
+    @staticmethod
+    def _buffer(tensor):
+        key = id(tensor)
+        ref, buf = BF16Compressor._buffers.get(key, (None, None))
+        if ref is None or ref() is not tensor or buf.shape != tensor.shape \
+                or buf.device != tensor.device:
+            buf = torch.empty(tensor.shape, dtype=torch.bfloat16,
+                              device=tensor.device)
+            ref = weakref.ref(
+                tensor, lambda _: BF16Compressor._buffers.pop(key, None))
+            BF16Compressor._buffers[key] = (ref, buf)
+        return buf
+
+    @staticmethod
+    def compress(tensor):
+        """Casts the tensor to bfloat16, into its buffer unless autograd has to
+        see the cast."""
+        if not tensor.dtype.is_floating_point or tensor.dtype == torch.bfloat16:
+            return tensor, None
+        if tensor.requires_grad:
+            return tensor.type(torch.bfloat16), tensor.dtype
+        buf = BF16Compressor._buffer(tensor)
+        buf.copy_(tensor)
+        return buf, tensor.dtype
+
+    @staticmethod
+    def decompress(tensor, ctx):
+        """Casts the tensor back to the initialization dtype."""
+        if ctx is None:
+            return tensor
+        return tensor.type(ctx)
+
+    @staticmethod
+    def decompress_into(tensor, ctx, out):
+        """Casts the tensor back into `out`."""
+        if ctx is None:
+            return tensor
+        if out.dtype != ctx or out.shape != tensor.shape or out.requires_grad:
+            return tensor.type(ctx)
+        out.copy_(tensor)
+        return out
+
+
 class Compression(object):
     """Optional gradient compression algorithm used during push_pull."""
 
@@ -73,3 +134,83 @@ class Compression(object):
 
     """Compress all floating point gradients to 16-bit."""
     fp16 = FP16Compressor
+
+    """Compress all floating point gradients to bfloat16."""
+    bf16 = BF16Compressor
+
+
+def decompress_into(compression, tensor, ctx, out):
+    """`compression.decompress_into`, or `decompress` for compression objects
+    that only implement `compress` and `decompress`; the caller copies the
+    result into `out` if it is not `out`."""
+    if hasattr(compression, 'decompress_into'):
+        return compression.decompress_into(tensor, ctx, out)
+    return compression.decompress(tensor, ctx)
+
+
+# short names of the hyper-parameters of the native compressors
+_NATIVE_KEYS = {
+    'compressor': 'compressor_type',
+    'ef': 'ef_type',
+    'momentum': 'momentum_type',
+    'k': 'compressor_k',
+    'mu': 'momentum_mu',
+    'scaling': 'compressor_onebit_scaling',
+    'topk_select': 'compressor_topk_select',
+    'shared_seed': 'compressor_randomk_shared_seed',
+    'state_dtype': 'compressor_state_dtype',
+    'partition': 'dithering_partition',
+    'normalize': 'dithering_normalize',
+}
+
+
+def native_kwargs(params):
+    """Translates compression params, e.g., {'compressor': 'topk', 'k': 0.01,
+    'ef': 'vanilla'}, to the kwargs of the native compressor registry. Native
+    names such as 'compressor_type' pass through."""
+    kwargs = {}
+    for key, value in params.items():
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        kwargs[_NATIVE_KEYS.get(key, key)] = str(value)
+    return kwargs
+
+
+class CompressionPolicy(object):
+    """Chooses the native compressor of each tensor by its name and size.
+
+    The compressors run in the COMPRESS/DECOMPRESS stages of the workers and
+    on the servers, so they apply to tensors declared with them before their
+    first push_pull, and should be used with `Compression.none`.
+
+    Arguments:
+        params: Compression params of the compressed tensors, e.g.,
+                {'compressor': 'onebit', 'ef': 'vanilla'}.
+        min_bytes: Tensors smaller than this are not compressed.
+        include: Name patterns (fnmatch) of the tensors to compress, all if None.
+        exclude: Name patterns of the tensors not to compress.
+        overrides: A list of (pattern, params), the first one whose pattern
+                   matches the name gives its params instead, None to not
+                   compress it.
+    """
+    def __init__(self, params, min_bytes=0, include=None, exclude=None,
+                 overrides=None):
+        self.params = params
+        self.min_bytes = min_bytes
+        self.include = include
+        self.exclude = exclude or []
+        self.overrides = overrides or []
+
+    def __call__(self, name, tensor):
+        """Returns the params of the tensor, or None to not compress it."""
+        if tensor.numel() * tensor.element_size() < self.min_bytes:
+            return None
+        if self.include is not None and \
+                not any(fnmatch.fnmatchcase(name, p) for p in self.include):
+            return None
+        if any(fnmatch.fnmatchcase(name, p) for p in self.exclude):
+            return None
+        for pattern, params in self.overrides:
+            if fnmatch.fnmatchcase(name, pattern):
+                return params
+        return self.params
@@ -2,7 +2,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from byteps.torch.compression import Compression
+from byteps.torch.compression import Compression, decompress_into
 from byteps.torch.ops import push_pull_async_inplace as byteps_push_pull
 from byteps.torch.ops import poll, synchronize
 from byteps.torch.ops import init, shutdown
@@ -166,7 +166,9 @@ class _CrossBarrier(_DistributedOptimizer):
             # Check whether the push-pull is finished. If so, start updating parameters.
             if handle is not None and poll(handle):
                 output = synchronize(handle)
-                p.grad.set_(self._compression.decompress(output, ctx))
+                tmp = decompress_into(self._compression, output, ctx, p.grad)
+                if tmp is not p.grad:
+                    p.grad.set_(tmp)
                 self._logger.debug("{} {} finished push-pull".format(self._desc, self._get_parameter_name(p)))
                 self._push_pull_delay[p] = self.backward_passes_per_step
                 # So only support SGD, Adam and RMSprop optimizers in torch
@@ -0,0 +1,98 @@
+# Copyright 2019 Bytedance Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Fusion of small gradients into shared buffers before push_pull."""
+
+import torch
+
+
+class FusionBucket(object):
+    """Small gradients of the same dtype and device packed into one flat
+    buffer, which is push_pulled as a single tensor.
+
+    A gradient is copied into the buffer as soon as it is ready, so the
+    bucket can be sent when its last member arrives.
+    """
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self._slices = {}
+        offset = 0
+        for p in params:
+            self._slices[p] = (offset, p.numel())
+            offset += p.numel()
+        self.buffer = torch.zeros(offset, dtype=params[0].dtype,
+                                  device=params[0].device)
+        self._ready = set()
+        self.handle, self.ctx = None, None
+
+    def _view(self, tensor, p):
+        offset, numel = self._slices[p]
+        return tensor.narrow(0, offset, numel).view_as(p)
+
+    def add(self, p):
+        """Packs the gradient of `p`. Returns True when all are packed."""
+        if p.grad is None:
+            self._view(self.buffer, p).zero_()
+        else:
+            self._view(self.buffer, p).copy_(p.grad)
+        self._ready.add(p)
+        return len(self._ready) == len(self.params)
+
+    def fill(self):
+        """Packs the gradients that have not arrived, e.g., of unused
+        parameters, as they are."""
+        for p in self.params:
+            if p not in self._ready:
+                self.add(p)
+
+    def unpack(self, output):
+        """Copies the push_pulled gradients back to the parameters."""
+        for p in self.params:
+            if p.grad is None:
+                p.grad = self._view(output, p).clone()
+            else:
+                p.grad.copy_(self._view(output, p))
+        self._ready.clear()
+        self.handle, self.ctx = None, None
+
+
+def build_fusion_buckets(params, threshold, bucket_bytes, prefix):
+    """Groups the parameters smaller than `threshold` bytes into buckets of
+    at most `bucket_bytes` bytes.
+
+    Parameters are taken in reverse order, which is about the order the
+    backward pass produces their gradients, so a bucket fills up in a short
+    window. The grouping only depends on the parameters, so it is the same on
+    all workers. Buckets of a single parameter are not formed.
+
+    Returns a list of FusionBucket named `prefix` + index.
+    """
+    groups = []
+    open_groups = {}
+    for p in reversed(list(params)):
+        nbytes = p.numel() * p.element_size()
+        if nbytes >= threshold:
+            continue
+        key = (p.dtype, p.device)
+        group = open_groups.get(key)
+        if group is None or group[0] + nbytes > bucket_bytes:
+            group = [0, []]
+            open_groups[key] = group
+            groups.append(group)
+        group[0] += nbytes
+        group[1].append(p)
+    fused = [members for _, members in groups if len(members) > 1]
+    return [FusionBucket('%s%d' % (prefix, i), members)
+            for i, members in enumerate(fused)]
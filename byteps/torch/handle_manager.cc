@@ -16,38 +16,134 @@
 
 #include "handle_manager.h"
 
+#include <stdexcept>
+#include <string>
+
 namespace byteps {
 namespace torch {
 
-int HandleManager::AllocateHandle() {
-  int handle = last_handle_.fetch_add(1) + 1;
-  std::lock_guard<std::mutex> guard(mutex_);
-  results_[handle] = nullptr;
+HandleManager::HandleManager() {
+  for (int i = 0; i < kMaxChunks; ++i) chunks_[i] = nullptr;
+}
+
+HandleManager::~HandleManager() {
+  for (int i = 0; i < num_chunks_; ++i) delete[] chunks_[i].load();
+}
+
+int HandleManager::AllocateHandle(::torch::Tensor output) {
+  int index;
+  {
+    std::lock_guard<std::mutex> guard(mutex_);
+    if (free_.empty()) {
+      if (num_chunks_ == kMaxChunks) {
+        throw std::runtime_error("Too many push_pull handles in flight: " +
+                                 std::to_string(kMaxChunks * kChunkSize));
+      }
+      chunks_[num_chunks_] = new Slot[kChunkSize];
+      for (int i = kChunkSize - 1; i >= 0; --i) {
+        free_.push_back(num_chunks_ * kChunkSize + i);
+      }
+      ++num_chunks_;
+    }
+    index = free_.back();
+    free_.pop_back();
+  }
+  auto& slot = chunks_[index >> kChunkBits].load()[index & (kChunkSize - 1)];
+  // generations 1..2047, so that handles are positive and never 0
+  slot.generation = slot.generation % 2047 + 1;
+  slot.output = std::move(output);
+  slot.done.store(false, std::memory_order_relaxed);
+  int handle = (slot.generation << kIndexBits) | index;
+  slot.handle.store(handle, std::memory_order_release);
   return handle;
 }
 
+HandleManager::Slot* HandleManager::GetSlot(int handle) {
+  int index = handle & ((1 << kIndexBits) - 1);
+  int chunk = index >> kChunkBits;
+  Slot* slots = handle > 0 && chunk < kMaxChunks ? chunks_[chunk].load()
+                                                  : nullptr;
+  if (!slots) return nullptr;
+  auto& slot = slots[index & (kChunkSize - 1)];
+  if (slot.handle.load(std::memory_order_acquire) != handle) return nullptr;
+  return &slot;
+}
+
 void HandleManager::MarkDone(int handle, const Status& status) {
-  std::lock_guard<std::mutex> guard(mutex_);
-  results_[handle] = std::make_shared<Status>(status);
+  auto slot = GetSlot(handle);
+  if (!slot) return;
+  slot->status = status;
+  slot->done.store(true, std::memory_order_release);
+  done_notifier_.Notify();
 }
 
 bool HandleManager::PollHandle(int handle) {
-  std::lock_guard<std::mutex> guard(mutex_);
-  if (results_.find(handle) == results_.end()) {
+  auto slot = GetSlot(handle);
+  if (!slot) {
     throw std::invalid_argument("Handle " + std::to_string(handle) +
                                 " was not created or has been cleared.");
   }
-  return results_[handle] != nullptr;
+  return slot->done.load(std::memory_order_acquire);
 }
 
-std::shared_ptr<Status> HandleManager::ReleaseHandle(int handle) {
-  std::lock_guard<std::mutex> guard(mutex_);
-  if (results_.find(handle) == results_.end()) {
+bool HandleManager::IsValid(int handle) { return GetSlot(handle) != nullptr; }
+
+bool HandleManager::WaitHandle(int handle, std::chrono::microseconds timeout) {
+  auto epoch = done_notifier_.GetEpoch();
+  if (PollHandle(handle)) return true;
+  done_notifier_.Wait(epoch, timeout);
+  return PollHandle(handle);
+}
+
+void HandleManager::WaitHandles(const std::vector<int>& handles) {
+  size_t next = 0;
+  while (true) {
+    auto epoch = done_notifier_.GetEpoch();
+    while (next < handles.size()) {
+      auto slot = GetSlot(handles[next]);
+      if (slot && !slot->done.load(std::memory_order_acquire)) break;
+      ++next;
+    }
+    if (next == handles.size()) return;
+    done_notifier_.Wait(epoch, std::chrono::milliseconds(1));
+  }
+}
+
+Status HandleManager::ClearSlot(Slot* slot, ::torch::Tensor* output) {
+  auto status = std::move(slot->status);
+  if (output) *output = std::move(slot->output);
+  slot->output = ::torch::Tensor();
+  slot->handle.store(0, std::memory_order_release);
+  return status;
+}
+
+Status HandleManager::ReleaseHandle(int handle, ::torch::Tensor* output) {
+  auto slot = GetSlot(handle);
+  if (!slot) {
     throw std::invalid_argument("Handle " + std::to_string(handle) +
                                 " was not created or has been cleared.");
   }
-  auto status = results_[handle];
-  results_.erase(handle);
+  auto status = ClearSlot(slot, output);
+  std::lock_guard<std::mutex> guard(mutex_);
+  free_.push_back(handle & ((1 << kIndexBits) - 1));
+  return status;
+}
+
+Status HandleManager::ReleaseHandles(const std::vector<int>& handles,
+                                     std::vector<::torch::Tensor>* outputs) {
+  auto status = Status::OK();
+  outputs->resize(handles.size());
+  std::vector<int> freed;
+  freed.reserve(handles.size());
+  for (size_t i = 0; i < handles.size(); ++i) {
+    auto slot = GetSlot(handles[i]);
+    if (!slot) continue;
+    auto s = ClearSlot(slot, &(*outputs)[i]);
+    if (status.ok() && !s.ok()) status = s;
+    freed.push_back(handles[i] & ((1 << kIndexBits) - 1));
+  }
+  std::lock_guard<std::mutex> guard(mutex_);
+  free_.insert(free_.end(), freed.begin(), freed.end());
   return status;
 }
 
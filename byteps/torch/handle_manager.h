@@ -17,29 +17,77 @@
 #ifndef BYTEPS_TORCH_HANDLE_MANAGER_H
 #define BYTEPS_TORCH_HANDLE_MANAGER_H
 
+#include <torch/torch.h>
+
 #include <atomic>
+#include <chrono>
 #include <memory>
 #include <mutex>
-#include <unordered_map>
+#include <vector>
 
 #include "../common/common.h"
+#include "../common/notifier.h"
 
 namespace byteps {
 namespace torch {
 
 using namespace byteps::common;
 
+/**
+ * Handles of the in-flight push_pull ops. A handle names a slot of a pool
+ * that is recycled once the handle is released, so the steady state does not
+ * allocate. Polling and marking done do not lock; allocating and releasing
+ * take a short lock on the free list.
+ *
+ * A handle is (generation << kIndexBits | slot index), so a handle that has
+ * been released is not mistaken for the one that reuses its slot.
+ */
 class HandleManager {
  public:
-  int AllocateHandle();
+  HandleManager();
+  ~HandleManager();
+
+  // a handle for an op writing to `output`, which the slot keeps alive
+  int AllocateHandle(::torch::Tensor output);
   void MarkDone(int handle, const Status& status);
   bool PollHandle(int handle);
-  std::shared_ptr<Status> ReleaseHandle(int handle);
+  // false if the handle was not created or has been released
+  bool IsValid(int handle);
+  // wait until MarkDone() or `timeout`, returns PollHandle()
+  bool WaitHandle(int handle, std::chrono::microseconds timeout);
+  // wait until all the valid handles are done
+  void WaitHandles(const std::vector<int>& handles);
+  Status ReleaseHandle(int handle, ::torch::Tensor* output);
+  // release all the valid handles and return the first error, the outputs of
+  // the invalid ones are left undefined
+  Status ReleaseHandles(const std::vector<int>& handles,
+                        std::vector<::torch::Tensor>* outputs);
 
  private:
-  std::atomic_int last_handle_;
-  std::unordered_map<int, std::shared_ptr<Status>> results_;
+  static const int kIndexBits = 20;
+  static const int kChunkBits = 10;
+  static const int kChunkSize = 1 << kChunkBits;
+  static const int kMaxChunks = 1 << (kIndexBits - kChunkBits);
+
+  struct Slot {
+    std::atomic<int> handle{0};  // 0 if free
+    std::atomic<bool> done{false};
+    int generation = 0;
+    Status status;
+    ::torch::Tensor output;
+  };
+
+  Slot* GetSlot(int handle);
+  // takes the status and output of a valid slot and clears it, the caller
+  // returns its index to free_
+  Status ClearSlot(Slot* slot, ::torch::Tensor* output);
+
+  // chunks are never moved nor freed while running, so lookups do not lock
+  std::atomic<Slot*> chunks_[kMaxChunks];
+  int num_chunks_ = 0;
+  std::vector<int> free_;
   std::mutex mutex_;
+  TaskNotifier done_notifier_;
 };
 
 }  // namespace torch
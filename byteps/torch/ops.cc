@@ -52,7 +52,8 @@ int GetDeviceID(const ::torch::Tensor& tensor) {
 }  // namespace
 
 void StartTask(::torch::Tensor tensor, ::torch::Tensor output, int average,
-               const std::string tensor_name, int version, int priority, int handle) {
+               const std::string tensor_name, int version, int priority, int handle,
+               int root_rank) {
 
   auto device = GetDeviceID(tensor);
   auto ready_event = RecordReadyEvent(device);
@@ -89,29 +90,43 @@ void StartTask(::torch::Tensor tensor, ::torch::Tensor output, int average,
         }
         handle_manager.MarkDone(handle, status);
       },
-      queue_list);
+      queue_list, root_rank);
 
   ThrowIfError(enqueue_result);
   return;
 
 }
 
-int DoPushPull(::torch::Tensor tensor, ::torch::Tensor output, int average,
-               const std::string& name, int version, int priority) {
+int Enqueue(::torch::Tensor tensor, ::torch::Tensor output, int average,
+            const std::string& name, int version, int priority, int root_rank) {
   ThrowIfError(common::CheckInitialized());
 
-  auto handle = handle_manager.AllocateHandle();
+  auto handle = handle_manager.AllocateHandle(output);
   std::string tensor_name = GetOpName("byteps", name.c_str(), 0);
   auto& context = common::GetContextFromName(tensor_name);
   if (context.initialized) {
-    StartTask(tensor, output, average, tensor_name, version, priority, handle);
+    StartTask(tensor, output, average, tensor_name, version, priority, handle,
+              root_rank);
   } else {
-    std::thread t(StartTask, tensor, output, average, tensor_name, version, priority, handle);
+    std::thread t(StartTask, tensor, output, average, tensor_name, version,
+                  priority, handle, root_rank);
     t.detach();
   }
   return handle;
 }
 
+int DoPushPull(::torch::Tensor tensor, ::torch::Tensor output, int average,
+               const std::string& name, int version, int priority) {
+  return Enqueue(tensor, output, average, name, version, priority, -1);
+}
+
+// In-place broadcast from `root_rank`: the servers keep the push of the
+// root's worker instead of summing, the other workers only pull.
+int DoBroadcast(::torch::Tensor tensor, int root_rank, const std::string& name,
+                int version, int priority) {
+  return Enqueue(tensor, tensor, 0, name, version, priority, root_rank);
+}
+
 void SetNumGrads(int num_grads) {
   std::lock_guard<std::mutex> lock(mutex_);
   num_grads_ = num_grads;
@@ -121,17 +136,71 @@ void SetNumGrads(int num_grads) {
 
 int PollHandle(int handle) { return handle_manager.PollHandle(handle) ? 1 : 0; }
 
-void DeclareTensor(const std::string& name) {
+// kwargs configure the native compressor of the tensor, they take effect if
+// it is declared before its first push_pull
+void DeclareTensor(const std::string& name,
+                   std::unordered_map<std::string, std::string> kwargs) {
   std::string tensor_name = GetOpName("byteps", name.c_str(), 0);
   common::IsTensorDeclared(tensor_name);
+  if (!kwargs.empty()) {
+    common::RegisterCompressor(tensor_name, kwargs);
+  }
 }
 
-void WaitAndClear(int handle) {
-  while (!handle_manager.PollHandle(handle)) {
-    std::this_thread::sleep_for(std::chrono::milliseconds(1));
+// Returns the output of the op, or None if the handle was not created or has
+// been cleared.
+pybind11::object WaitAndClear(int handle) {
+  if (!handle_manager.IsValid(handle)) return pybind11::none();
+  {
+    pybind11::gil_scoped_release release;
+    while (!handle_manager.WaitHandle(handle, std::chrono::milliseconds(1))) {
+    }
   }
-  auto status = handle_manager.ReleaseHandle(handle);
-  ThrowIfError(*status);
+  ::torch::Tensor output;
+  auto status = handle_manager.ReleaseHandle(handle, &output);
+  ThrowIfError(status);
+  return pybind11::cast(output);
+}
+
+// Returns the outputs of the ops in order, None for a handle that was not
+// created or has been cleared. Waits for all of them at once.
+pybind11::list WaitAndClearMany(const std::vector<int>& handles) {
+  {
+    pybind11::gil_scoped_release release;
+    handle_manager.WaitHandles(handles);
+  }
+  std::vector<::torch::Tensor> outputs;
+  auto status = handle_manager.ReleaseHandles(handles, &outputs);
+  ThrowIfError(status);
+  pybind11::list result;
+  for (auto& output : outputs) {
+    if (output.defined()) {
+      result.append(pybind11::cast(output));
+    } else {
+      result.append(pybind11::none());
+    }
+  }
+  return result;
+}
+
+std::vector<int> DoPushPullMany(const std::vector<::torch::Tensor>& tensors,
+                                const std::vector<::torch::Tensor>& outputs,
+                                int average,
+                                const std::vector<std::string>& names,
+                                int version, const std::vector<int>& priorities) {
+  if (outputs.size() != tensors.size() || names.size() != tensors.size() ||
+      priorities.size() != tensors.size()) {
+    throw std::invalid_argument(
+        "push_pull_async_many needs as many outputs, names and priorities as "
+        "tensors");
+  }
+  std::vector<int> handles;
+  handles.reserve(tensors.size());
+  for (size_t i = 0; i < tensors.size(); ++i) {
+    handles.push_back(DoPushPull(tensors[i], outputs[i], average, names[i],
+                                 version, priorities[i]));
+  }
+  return handles;
 }
 
 pybind11::tuple DoPushPullGroupSync(::torch::Tensor tensor,
@@ -140,16 +209,17 @@ pybind11::tuple DoPushPullGroupSync(::torch::Tensor tensor,
                                     int priority) {
   ThrowIfError(common::CheckInitialized());
 
-  auto handle = handle_manager.AllocateHandle();
+  auto handle = handle_manager.AllocateHandle(output);
   std::string tensor_name = GetOpName("byteps", name.c_str(), 0);
   auto& context = common::GetContextFromName(tensor_name);
   int curr_count;
 
   if (context.initialized) {
-    StartTask(tensor, output, average, tensor_name, version, priority, handle);
+    StartTask(tensor, output, average, tensor_name, version, priority, handle,
+              -1);
   } else {
     std::thread t(StartTask, tensor, output, average, tensor_name, version,
-                  priority, handle);
+                  priority, handle, -1);
     t.detach();
   }
 
@@ -171,15 +241,20 @@ PYBIND11_MODULE(c_lib, m) {
   m.def("byteps_torch_push_pull_async_torch_IntTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_LongTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_HalfTensor", &DoPushPull);
+  m.def("byteps_torch_push_pull_async_torch_BFloat16Tensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_FloatTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_DoubleTensor", &DoPushPull);
 
+  m.def("byteps_torch_push_pull_async_many", &DoPushPullMany);
+  m.def("byteps_torch_broadcast_async", &DoBroadcast);
+
   m.def("byteps_torch_set_num_grads", &SetNumGrads);
 
   m.def("byteps_torch_push_pull_group_sync_torch_ByteTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_IntTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_LongTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_HalfTensor", &DoPushPullGroupSync);
+  m.def("byteps_torch_push_pull_group_sync_torch_BFloat16Tensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_FloatTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_DoubleTensor", &DoPushPullGroupSync);
 
@@ -188,6 +263,7 @@ PYBIND11_MODULE(c_lib, m) {
   m.def("byteps_torch_push_pull_async_torch_cuda_IntTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_LongTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_HalfTensor", &DoPushPull);
+  m.def("byteps_torch_push_pull_async_torch_cuda_BFloat16Tensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_FloatTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_DoubleTensor", &DoPushPull);
 
@@ -195,6 +271,7 @@ PYBIND11_MODULE(c_lib, m) {
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_IntTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_LongTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_HalfTensor", &DoPushPullGroupSync);
+  m.def("byteps_torch_push_pull_group_sync_torch_cuda_BFloat16Tensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_FloatTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_DoubleTensor", &DoPushPullGroupSync);
 #endif
@@ -202,7 +279,10 @@ PYBIND11_MODULE(c_lib, m) {
   // basics
   m.def("byteps_torch_poll", &PollHandle);
   m.def("byteps_torch_wait_and_clear", &WaitAndClear);
-  m.def("byteps_torch_declare_tensor", &DeclareTensor);
+  m.def("byteps_torch_wait_and_clear_many", &WaitAndClearMany);
+  m.def("byteps_torch_declare_tensor", &DeclareTensor, pybind11::arg("name"),
+        pybind11::arg("kwargs") =
+            std::unordered_map<std::string, std::string>());
 }
 
 }  // namespace torch
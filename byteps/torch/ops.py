@@ -32,7 +32,7 @@ _basics = _BytePSBasics(__file__, 'c_lib')
 _NULL = ""
 
 
-from byteps.torch.compression import Compression
+from byteps.torch.compression import Compression, native_kwargs
 
 # import basic methods
 init = _basics.init
@@ -45,12 +45,6 @@ rank = _basics.rank
 local_rank = _basics.local_rank
 
 
-# Schema: handle -> input, output
-# We keep input in order to make sure it does not get garbage collected
-# before the operation is finished.
-_handle_map = {}
-
-
 def _check_function(function_factory, tensor):
     function = function_factory(tensor)
     if not hasattr(c_lib, function):
@@ -66,26 +60,50 @@ def _push_pull_function_factory(tensor):
 def _push_pull_group_function_factory(tensor):
     return 'byteps_torch_push_pull_group_sync_' + tensor.type().replace('.', '_')
 
-def _do_push_pull_async(tensor, output, average, name, version=0, priority=0):
-    c_lib.byteps_torch_declare_tensor(name.encode() if name is not None else _NULL)
-    function = _check_function(_push_pull_function_factory, tensor)
-    handle = getattr(c_lib, function)(tensor, output, average,
-                                      name.encode() if name is not None else _NULL,
-                                      version, priority)
-    _handle_map[handle] = (tensor, output)
-    return handle
+class _PushPullOp(object):
+    """The push_pull of a named tensor, with its name declared and encoded and
+    its C function resolved once, on the first call. The C side keeps the
+    output alive until the handle is synchronized."""
+    __slots__ = ('function', 'name', 'dtype', 'is_cuda')
+
+    def __init__(self, function_factory, tensor, name, compression_params=None):
+        self.name = name.encode() if name is not None else _NULL
+        c_lib.byteps_torch_declare_tensor(
+            self.name, native_kwargs(compression_params or {}))
+        self.function = getattr(c_lib, _check_function(function_factory, tensor))
+        self.dtype = tensor.dtype
+        self.is_cuda = tensor.is_cuda
+
+
+# Schema: name -> _PushPullOp
+_push_pull_ops = {}
+_push_pull_group_ops = {}
+
+
+def _get_op(ops, function_factory, tensor, name, compression_params=None):
+    op = ops.get(name)
+    if op is None or op.dtype is not tensor.dtype or op.is_cuda != tensor.is_cuda:
+        op = _PushPullOp(function_factory, tensor, name, compression_params)
+        ops[name] = op
+    elif not tensor.is_contiguous():
+        raise ValueError('Tensor is required to be contiguous.')
+    return op
+
+
+def _do_push_pull_async(tensor, output, average, name, version=0, priority=0,
+                        compression_params=None):
+    op = _get_op(_push_pull_ops, _push_pull_function_factory, tensor, name,
+                 compression_params)
+    return op.function(tensor, output, average, op.name, version, priority)
 
 def _do_push_pull_group_sync(tensor, output, average, name, version=0, priority=0):
-    c_lib.byteps_torch_declare_tensor(name.encode() if name is not None else _NULL)
-    function = _check_function(_push_pull_group_function_factory, tensor)
-    handle, curr_count = getattr(c_lib, function)(tensor, output, average,
-                                      name.encode() if name is not None else _NULL,
-                                      version, priority)
-    _handle_map[handle] = (tensor, output)
-    return handle, curr_count
+    op = _get_op(_push_pull_group_ops, _push_pull_group_function_factory,
+                 tensor, name)
+    return op.function(tensor, output, average, op.name, version, priority)
 
 
-def push_pull_async(tensor, average=True, name=None, version=0, priority=0):
+def push_pull_async(tensor, average=True, name=None, version=0, priority=0,
+                    compression_params=None):
     """
     A function that performs asynchronous averaging or summation of the input tensor
     over all the BytePS processes. The input tensor is not modified.
@@ -98,12 +116,17 @@ def push_pull_async(tensor, average=True, name=None, version=0, priority=0):
         average: A flag indicating whether to compute average or summation,
                  defaults to average.
         name: A name of the reduction operation.
+        compression_params: Params of the native compressor of the tensor,
+                            e.g., {'compressor': 'onebit', 'ef': 'vanilla'},
+                            see `compression.native_kwargs()`. They take
+                            effect on the first push_pull of the name.
     Returns:
         A handle to the push_pull operation that can be used with `poll()` or
         `synchronize()`.
     """
     output = tensor.new(tensor.shape)
-    return _do_push_pull_async(tensor, output, average, name, version, priority)
+    return _do_push_pull_async(tensor, output, average, name, version, priority,
+                               compression_params)
 
 
 class BytePSPushPull(torch.autograd.Function):
@@ -154,7 +177,8 @@ def push_pull(tensor, average=True, name=None, version=0, priority=0, compressio
     return compression.decompress(summed_tensor_compressed, ctx)
 
 
-def push_pull_async_inplace(tensor, average=True, name=None, version=0, priority=0):
+def push_pull_async_inplace(tensor, average=True, name=None, version=0, priority=0,
+                            compression_params=None):
     """
     A function that performs asynchronous in-place averaging or summation of the input
     tensor over all the BytePS processes.
@@ -167,11 +191,56 @@ def push_pull_async_inplace(tensor, average=True, name=None, version=0, priority
         average: A flag indicating whether to compute average or summation,
                  defaults to average.
         name: A name of the reduction operation.
+        compression_params: Params of the native compressor of the tensor,
+                            see `push_pull_async()`.
     Returns:
         A handle to the push_pull operation that can be used with `poll()` or
         `synchronize()`.
     """
-    return _do_push_pull_async(tensor, tensor, average, name, version, priority)
+    return _do_push_pull_async(tensor, tensor, average, name, version, priority,
+                               compression_params)
+
+def push_pull_async_many(tensors, names, average=True, version=0, priorities=None):
+    """
+    A function that performs asynchronous in-place averaging or summation of a list
+    of tensors over all the BytePS processes, with all of them enqueued in one call.
+    Each reduction is keyed by its name, as in `push_pull_async_inplace()`.
+    Arguments:
+        tensors: A list of tensors to average and sum.
+        names: A list of names of the reduction operations, one per tensor.
+        average: A flag indicating whether to compute average or summation,
+                 defaults to average.
+        priorities: A list of priorities, one per tensor, defaults to 0.
+    Returns:
+        A list of handles to the push_pull operations that can be used with
+        `synchronize_many()`.
+    """
+    if priorities is None:
+        priorities = [0] * len(tensors)
+    encoded_names = [_get_op(_push_pull_ops, _push_pull_function_factory,
+                             tensor, name).name
+                     for tensor, name in zip(tensors, names)]
+    return c_lib.byteps_torch_push_pull_async_many(
+        tensors, tensors, average, encoded_names, version, priorities)
+
+def broadcast_async_inplace(tensor, root_rank, name, version=0, priority=0):
+    """
+    A function that asynchronously broadcasts the input tensor in place from
+    `root_rank` to all the BytePS processes. Only the worker of the root rank
+    pushes it, the servers keep the push as it is and the others just pull, so
+    the tensors of the other processes need not be zeroed, except those on the
+    machine of the root rank, which are summed with it locally first.
+    Arguments:
+        tensor: A tensor to broadcast.
+        root_rank: The rank of the process to broadcast from.
+        name: A name of the broadcast operation.
+    Returns:
+        A handle to the broadcast operation that can be used with `poll()` or
+        `synchronize()`.
+    """
+    op = _get_op(_push_pull_ops, _push_pull_function_factory, tensor, name)
+    return c_lib.byteps_torch_broadcast_async(tensor, root_rank, op.name,
+                                              version, priority)
 
 def push_pull_group_sync_inplace(tensor, average=True, name=None, version=0, priority=0):
     return _do_push_pull_group_sync(tensor, tensor, average, name, version, priority)
@@ -211,8 +280,9 @@ def poll(handle):
     return c_lib.byteps_torch_poll(handle) != 0
 
 
-def declare(name):
-    c_lib.byteps_torch_declare_tensor(name.encode())
+def declare(name, compression_params=None):
+    c_lib.byteps_torch_declare_tensor(name.encode(),
+                                      native_kwargs(compression_params or {}))
     return 0
 
 def byteps_torch_set_num_grads(num_grads_):
@@ -229,8 +299,19 @@ def synchronize(handle):
     Returns:
         An output tensor of the operation.
     """
-    if handle not in _handle_map:
-        return
-    c_lib.byteps_torch_wait_and_clear(handle)
-    _, output = _handle_map.pop(handle)
-    return output
+    if handle is None:
+        return None
+    return c_lib.byteps_torch_wait_and_clear(handle)
+
+def synchronize_many(handles):
+    """
+    Synchronizes a list of asynchronous push_pull operations until all of them
+    are completed, with a single wait.
+    Arguments:
+        handles: A list of handles returned by push_pull asynchronous
+                 operations, None entries are skipped.
+    Returns:
+        A list of the output tensors of the operations, None for a None handle.
+    """
+    return c_lib.byteps_torch_wait_and_clear_many(
+        [-1 if handle is None else handle for handle in handles])
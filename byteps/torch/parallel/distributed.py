@@ -2,11 +2,11 @@ import torch
 from torch.nn.modules import Module
 from byteps.torch.ops import push_pull_group_sync_inplace as byteps_push_pull_group
 from byteps.torch.ops import push_pull_async_inplace as byteps_push_pull
-from byteps.torch.ops import poll, synchronize, declare, byteps_torch_set_num_grads
+from byteps.torch.ops import poll, synchronize, synchronize_many, declare, byteps_torch_set_num_grads
 from byteps.torch.ops import size, local_size, rank, local_rank
 from contextlib import contextmanager
 import byteps as bps
-from byteps.torch.compression import Compression
+from byteps.torch.compression import Compression, decompress_into
 from torch.cuda._utils import _get_device_index
 import os
 
@@ -280,8 +280,10 @@ class DistributedDataParallel(Module):
             if handle is None:
                 handle, ctx, grad_count = self._push_pull_grad_group_sync(p)
                 self._handles[p] = (handle, ctx)
-        for p, (handle, _) in self._handles.items():
-            output = synchronize(handle)
+        outputs = synchronize_many([handle for handle, _ in self._handles.values()])
+        for (p, (handle, ctx)), output in zip(self._handles.items(), outputs):
             if not self._enable_async:
-                p.grad.set_(self._compression.decompress(output, ctx))
+                tmp = decompress_into(self._compression, output, ctx, p.grad)
+                if tmp is not p.grad:
+                    p.grad.set_(tmp)
         self._handles.clear()
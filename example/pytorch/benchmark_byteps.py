@@ -16,6 +16,8 @@ parser = argparse.ArgumentParser(description='PyTorch Synthetic Benchmark',
                                  formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument('--fp16-pushpull', action='store_true', default=False,
                     help='use fp16 compression during byteps pushpull')
+parser.add_argument('--bf16-pushpull', action='store_true', default=False,
+                    help='use bf16 compression during byteps pushpull')
 
 parser.add_argument('--model', type=str, default='resnet50',
                     help='model to benchmark')
@@ -61,6 +63,8 @@ optimizer = optim.SGD(model.parameters(), lr=0.01)
 
 # BytePS: (optional) compression algorithm.
 compression = bps.Compression.fp16 if args.fp16_pushpull else bps.Compression.none
+if args.bf16_pushpull:
+    compression = bps.Compression.bf16
 
 # BytePS: wrap optimizer with DistributedOptimizer.
 optimizer = bps.DistributedOptimizer(optimizer,
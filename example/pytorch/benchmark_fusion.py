@@ -0,0 +1,152 @@
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+
+# Compares the push_pull count and the step time of a model with many small
+# tensors with and without gradient fusion, e.g., on each worker:
+#   python3 benchmark_fusion.py --fusion-threshold 0
+#   python3 benchmark_fusion.py --fusion-threshold 65536
+# With --dry-run it needs no workers or GPU: it counts the push_pulls per step
+# with and without fusion, and times packing and unpacking the buckets on the
+# CPU, which is what fusion adds to a step:
+#   python3 benchmark_fusion.py --dry-run
+parser = argparse.ArgumentParser(description='BytePS Gradient Fusion Benchmark',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--fusion-threshold', type=int, default=65536,
+                    help='fuse gradients smaller than this (bytes), 0 to disable')
+parser.add_argument('--fusion-bucket-bytes', type=int, default=4096000,
+                    help='max bytes of a fusion bucket')
+parser.add_argument('--num-layers', type=int, default=96,
+                    help='number of residual blocks')
+parser.add_argument('--hidden', type=int, default=256,
+                    help='hidden size, every block has 2 biases and a LayerNorm of this size')
+parser.add_argument('--batch-size', type=int, default=32,
+                    help='input batch size')
+parser.add_argument('--num-warmup-batches', type=int, default=10,
+                    help='number of warm-up batches that don\'t count towards benchmark')
+parser.add_argument('--num-batches-per-iter', type=int, default=10,
+                    help='number of batches per benchmark iteration')
+parser.add_argument('--num-iters', type=int, default=10,
+                    help='number of benchmark iterations')
+parser.add_argument('--no-cuda', action='store_true', default=False,
+                    help='disables CUDA training')
+parser.add_argument('--dry-run', action='store_true', default=False,
+                    help='count the push_pulls and time the packing on the '
+                         'CPU, without BytePS workers')
+args = parser.parse_args()
+args.cuda = not args.no_cuda and not args.dry_run and torch.cuda.is_available()
+
+# read by DistributedOptimizer
+os.environ['BYTEPS_FUSION_THRESHOLD'] = str(args.fusion_threshold)
+os.environ['BYTEPS_FUSION_BUCKET_BYTES'] = str(args.fusion_bucket_bytes)
+
+import byteps.torch as bps
+from byteps.torch.fusion import build_fusion_buckets
+
+
+class Block(nn.Module):
+    def __init__(self, hidden):
+        super(Block, self).__init__()
+        self.norm = nn.LayerNorm(hidden)
+        self.fc1 = nn.Linear(hidden, hidden)
+        self.fc2 = nn.Linear(hidden, hidden)
+
+    def forward(self, x):
+        return x + self.fc2(F.relu(self.fc1(self.norm(x))))
+
+
+# like a transformer encoder: per block, two weight matrices and four small
+# vectors (2 biases, LayerNorm weight and bias)
+model = nn.Sequential(*[Block(args.hidden) for _ in range(args.num_layers)])
+data = torch.rand(args.batch_size, args.hidden)
+target = torch.rand(args.batch_size, args.hidden)
+
+
+def dry_run():
+    F.mse_loss(model(data), target).backward()
+    params = [p for p in model.parameters() if p.requires_grad]
+    for threshold in sorted({0, args.fusion_threshold}):
+        buckets = build_fusion_buckets(params, threshold,
+                                       args.fusion_bucket_bytes,
+                                       'Gradient.Fused.') if threshold else []
+        num_fused = sum(len(b.params) for b in buckets)
+        print('fusion threshold %d: %d tensors, %d fused into %d buckets, '
+              '%d push_pull per step'
+              % (threshold, len(params), num_fused, len(buckets),
+                 len(params) - num_fused + len(buckets)))
+        if not buckets:
+            continue
+
+        # what the optimizer does per step: pack each gradient as its hook
+        # fires, and copy the pulled buffer back
+        def pack_unpack():
+            for bucket in buckets:
+                for p in bucket.params:
+                    bucket.add(p)
+                bucket.unpack(bucket.buffer)
+        number = args.num_batches_per_iter * args.num_iters
+        pack_unpack()
+        secs = timeit.timeit(pack_unpack, number=number)
+        print('  packing and unpacking: %.3f ms per step'
+              % (secs * 1000 / number))
+
+
+if args.dry_run:
+    dry_run()
+    sys.exit(0)
+
+bps.init()
+if args.cuda:
+    torch.cuda.set_device(bps.local_rank())
+    model.cuda()
+
+optimizer = optim.SGD(model.parameters(), lr=0.01)
+optimizer = bps.DistributedOptimizer(optimizer,
+                                     named_parameters=model.named_parameters())
+bps.broadcast_parameters(model.state_dict(), root_rank=0)
+
+if args.cuda:
+    data, target = data.cuda(), target.cuda()
+
+
+def benchmark_step():
+    optimizer.zero_grad()
+    loss = F.mse_loss(model(data), target)
+    loss.backward()
+    optimizer.step()
+
+
+def log(s):
+    if bps.local_rank() != 0:
+        return
+    print(s)
+    sys.stdout.flush()
+
+
+num_params = sum(1 for p in model.parameters() if p.requires_grad)
+buckets = optimizer._fusion_buckets
+num_fused = sum(len(b.params) for b in buckets)
+log('Tensors: %d, fused into %d buckets: %d' % (num_params, len(buckets), num_fused))
+log('push_pull per step: %d' % (num_params - num_fused + len(buckets)))
+
+log('Running warmup...')
+timeit.timeit(benchmark_step, number=args.num_warmup_batches)
+
+log('Running benchmark...')
+step_times = []
+for x in range(args.num_iters):
+    time = timeit.timeit(benchmark_step, number=args.num_batches_per_iter)
+    step_ms = time * 1000 / args.num_batches_per_iter
+    log('Iter #%d: %.2f ms per step' % (x, step_ms))
+    step_times.append(step_ms)
+
+log('Step time: %.2f +-%.2f ms' % (np.mean(step_times), 1.96 * np.std(step_times)))
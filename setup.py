@@ -289,8 +289,10 @@ def get_common_options(build_ext):
                'byteps/common/scheduled_queue.cc',
                'byteps/common/ready_table.cc',
                'byteps/common/shared_memory.cc',
+               'byteps/common/shm_arena.cc',
                'byteps/common/nccl_manager.cc',
                'byteps/common/cpu_reducer.cc'] + [
+               'byteps/common/compressor/buffer_arena.cc',
                'byteps/common/compressor/compressor_registry.cc',
                'byteps/common/compressor/error_feedback.cc',
                'byteps/common/compressor/momentum.cc',
@@ -351,6 +353,7 @@ def build_server(build_ext, options):
                           'byteps/common/cpu_reducer.cc',
                           'byteps/common/logging.cc',
                           'byteps/common/common.cc'] + [
+                          'byteps/common/compressor/buffer_arena.cc',
                           'byteps/common/compressor/compressor_registry.cc',
                           'byteps/common/compressor/error_feedback.cc',
                           'byteps/common/compressor/impl/dithering.cc',
@@ -369,6 +372,7 @@ def build_server(build_ext, options):
         server_lib.libraries = ['rdmacm', 'ibverbs', 'rt']
     else:
         server_lib.libraries = []
+    server_lib.libraries += ['numa']
     if use_ucx():
         server_lib.libraries += ['ucp', 'uct', 'ucs', 'ucm']
         ucx_home = get_ucx_home()